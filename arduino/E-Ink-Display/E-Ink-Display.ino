@@ -45,6 +45,10 @@ const String DEVICE = "home-office";
 
 #define FORMAT_LITTLEFS_IF_FAILED true
 
+// Hash of the frame on screen (X-Frame-Hash), kept through deep sleep.
+// Sent with each wake, the server answers 304 if the frame is unchanged.
+RTC_DATA_ATTR char displayed[33] = "";
+
 // Instantiate display driver object
 EPaper epaper = EPaper();
 
@@ -200,46 +204,18 @@ String service_url_get(String api)
     return url;
 }
 
-// service_data_get
-// Retrieves data from the server for the given service.
-// Device name is passed by default as defined by service_url_get().
+// http_body_read
+// Reads the body of a response.
 //
 // Params:
-//   service - Name of service endpoint from which to request data.
+//   http - Client, after a successful request.
 //   data:
 //     - If empty string, data will be returned in this variable.
 //     - If non-empty, data will be written to file system with given file name.
-int service_data_get(String service, String &data)
+//
+// Returns HTTP_CODE_OK, or -1 if the file could not be opened.
+int http_body_read(HTTPClient &http, String &data)
 {
-    // Connected?
-    int conn_status = WiFi.status();
-    if (conn_status != WL_CONNECTED)
-    {
-        if (Serial)
-        {
-            Serial.printf("WiFi not connected, status: %d\n", conn_status);
-        }
-        return conn_status;
-    }
-
-    // URL for service for this device
-    String url = service_url_get(service);
-    if (Serial)
-    {
-        Serial.printf("Service URL: %s\n", url.c_str());
-    }
-    delay(10);
-
-    // Request data
-    HTTPClient http;
-    http.begin(url);
-    int httpCode = http.GET();
-    if (httpCode != HTTP_CODE_OK)
-    {
-        http.end();
-        return httpCode;
-    }
-
     // Open file if requested.
     bool use_file = data.length() > 0;
     fs::File file = fs::File();
@@ -251,7 +227,6 @@ int service_data_get(String service, String &data)
         if (!file)
         {
             s_println("Failed to open file for writing");
-            http.end();
             return -1;
         }
     }
@@ -295,12 +270,73 @@ int service_data_get(String service, String &data)
         s_println("File write complete");
     }
 
+    return HTTP_CODE_OK;
+}
+
+// service_data_get
+// Retrieves data from the server for the given service.
+// Device name is passed by default as defined by service_url_get().
+//
+// Params:
+//   service - Name of service endpoint from which to request data.
+//   data:
+//     - If empty string, data will be returned in this variable.
+//     - If non-empty, data will be written to file system with given file name.
+int service_data_get(String service, String &data)
+{
+    // Connected?
+    int conn_status = WiFi.status();
+    if (conn_status != WL_CONNECTED)
+    {
+        if (Serial)
+        {
+            Serial.printf("WiFi not connected, status: %d\n", conn_status);
+        }
+        return conn_status;
+    }
+
+    // URL for service for this device
+    String url = service_url_get(service);
+    if (Serial)
+    {
+        Serial.printf("Service URL: %s\n", url.c_str());
+    }
+    delay(10);
+
+    // Request data
+    HTTPClient http;
+    http.begin(url);
+    int httpCode = http.GET();
+    if (httpCode == HTTP_CODE_OK)
+    {
+        int err = http_body_read(http, data);
+        if (err != HTTP_CODE_OK)
+        {
+            httpCode = err;
+        }
+    }
+
     http.end();
     return httpCode;
 }
 
-void device_state_post()
+// wake_post
+// Posts the device state and downloads the frame in one round trip,
+// POST /wake/{device}.
+//
+// Params:
+//   filename - File the frame is written to.
+//   sleep_delay - Set to the seconds to sleep (X-Sleep-Delay), empty if the
+//                 server was not reached.
+//   frame_hash - Set to the hash of the frame downloaded (X-Frame-Hash).
+//
+// Returns the HTTP status: 200 with a new frame, 304 if the frame on
+// screen is current, else an error.
+int wake_post(String filename, String &sleep_delay, String &frame_hash)
 {
+    sleep_delay = String();
+    frame_hash = String();
+
     // Connected?
     int conn_status = WiFi.status();
     if (conn_status != WL_CONNECTED)
@@ -309,15 +345,14 @@ void device_state_post()
         {
             Serial.printf("WiFi not connected, status: %d\n", conn_status);
         }
-        return;
+        return conn_status;
     }
 
     // URL for service for this device
-    String url = String(SERVER);
-    url.concat("/state");
+    String url = service_url_get(String("wake"));
     if (Serial)
     {
-        Serial.printf("Status URL: %s\n", url.c_str());
+        Serial.printf("Wake URL: %s\n", url.c_str());
     }
     delay(10);
 
@@ -330,28 +365,40 @@ void device_state_post()
     payload.concat("\"battery_voltage\": \"");
     float bat_v = readBatteryVoltage();
     payload.concat(String(bat_v, 2));
+    payload.concat("\",");
+
+    payload.concat("\"displayed\": \"");
+    payload.concat(displayed);
     payload.concat("\"");
 
     payload.concat("}");
 
-    // Post data
+    // Post state, the response carries the frame and the sleep delay.
     HTTPClient http;
     http.begin(url);
     http.addHeader("Content-Type", "application/json");
-    s_println("Posting status: " + payload);
+    const char *headers[] = {"X-Sleep-Delay", "X-Frame-Hash"};
+    http.collectHeaders(headers, 2);
+    s_println("Posting wake: " + payload);
     int httpCode = http.POST(payload);
-    if (httpCode != HTTP_CODE_OK)
+    sleep_delay = http.header("X-Sleep-Delay");
+
+    if (httpCode == HTTP_CODE_OK)
     {
-        if (Serial)
+        frame_hash = http.header("X-Frame-Hash");
+        int err = http_body_read(http, filename);
+        if (err != HTTP_CODE_OK)
         {
-            Serial.printf("Status post error: %d\n", httpCode);
+            httpCode = err;
         }
     }
-    else
+    else if (Serial)
     {
-        s_println("Status posted successfully");
+        Serial.printf("Wake post status: %d\n", httpCode);
     }
+
     http.end();
+    return httpCode;
 }
 
 // Open the PNG file from LittleFS
@@ -416,17 +463,24 @@ void screen_clear()
     epaper.fillScreen(TFT_WHITE);
     epaper.update();
     y_pos = Y_START;
+
+    // Frame no longer on screen.
+    displayed[0] = '\0';
 }
 
 void image_read_and_display()
 {
-    device_state_post();
-
-    // Download file
+    // Post state and download the frame, one round trip.
     String filename = "/image.png";
-    int resp = service_data_get(String("image"), filename);
+    String sleep_delay;
+    String frame_hash;
+    int resp = wake_post(filename, sleep_delay, frame_hash);
 
-    if (resp != HTTP_CODE_OK)
+    if (resp == HTTP_CODE_NOT_MODIFIED)
+    {
+        s_println("Frame unchanged");
+    }
+    else if (resp != HTTP_CODE_OK)
     {
         if (Serial)
         {
@@ -438,6 +492,9 @@ void image_read_and_display()
     }
     else
     {
+        // Screen is drawn over from here.
+        displayed[0] = '\0';
+
         epaper.drawString("File downloaded", x_pos, y_pos);
         y_pos += Y_DELTA;
 
@@ -490,30 +547,26 @@ void image_read_and_display()
 
         // Update display
         epaper.update();
+        strlcpy(displayed, frame_hash.c_str(), sizeof(displayed));
 
         // Close the file
         png.close();
 
     } // HTTP Response OK
 
-    // Read the time to sleep until next update
-    String payload = String();
-    resp = service_data_get(String("delay"), payload);
-    if (resp != HTTP_CODE_OK)
+    // Time to sleep until next update, sent with the frame.
+    if (sleep_delay.length() == 0)
     {
-        if (Serial)
-        {
-            Serial.printf("Network read error: %d\n", resp);
-        }
+        s_println("No sleep delay from server");
         epaper.drawString("Network Read Error", x_pos, y_pos);
         y_pos += Y_DELTA;
     }
     else
     {
-        s_println("Sleep delay: " + payload + " [sec]");
+        s_println("Sleep delay: " + sleep_delay + " [sec]");
 
         // Program wake timer & go to sleep
-        int sleep_secs = payload.toInt();
+        int sleep_secs = sleep_delay.toInt();
         esp_sleep_enable_timer_wakeup(sleep_secs * USEC_TO_SEC);
         esp_deep_sleep_start();
     }
@@ -1,11 +1,11 @@
 # update.sh
 # General idea: use the Kindle for display only, everything else is handled by the server.
 # 1. Kindle wakes up
-# 2. Kindle posts its state to the server
-# 3. Kindle grabs the latest image from the server (which now include Kindle state)
-# 4. Kindle displays the image
-# 5. Kindle reads the next wakeup delay from the server
-# 6. Kindle goes to sleep
+# 2. Kindle posts its state to the server, in the same request it gets
+#    the latest image (which now include Kindle state) and the next
+#    wakeup delay (X-Sleep-Delay header)
+# 3. Kindle displays the image
+# 4. Kindle goes to sleep
 
 # Server
 HOST=http://192.168.0.120:8000
@@ -23,7 +23,7 @@ while true; do
     echo `powerd_test -s | grep Powerd`
 
     # Remove the last image
-    rm -f image.png
+    rm -f image.png headers.txt
 
     # Wait a bit.  
     # Seeing issue where not getting image periodically.
@@ -36,7 +36,7 @@ while true; do
     #echo "performance" > /sys/devices/system/cpu/cpu0/cpufreq/scaling_governor
     #sleep 1
 
-    # Post Kindle's state data
+    # Post Kindle's state data and grab the latest file, one round trip.
     # gasgauge-info doesn't seem to update when in powersave mode.
     BATTERY_SOC=`gasgauge-info -s`
     TEMPERATURE=`gasgauge-info -k | cut -d " " -f1`
@@ -44,38 +44,52 @@ while true; do
     TEMPERATURE=`cat /sys/devices/system/yoshi_battery/yoshi_battery0/battery_temperature`
     BATTERY_SOC=`cat /sys/devices/system/yoshi_battery/yoshi_battery0/battery_capacity`
 
-    JSON='{"device":"'$DEVICE'","temp":"'$TEMPERATURE'","battery":"'$BATTERY_SOC'"}'
+    # Hash of the frame on screen, tells the server no redraw is needed
+    # if the frame is unchanged.
+    DISPLAYED=`cat displayed.txt 2>/dev/null`
+
+    JSON='{"device":"'$DEVICE'","temp":"'$TEMPERATURE'","battery":"'$BATTERY_SOC'","displayed":"'$DISPLAYED'"}'
     echo $JSON
-    curl -g -X POST ${HOST}/state -H "Content-Type: application/json" -H "Accept: application/json"  -d ${JSON}
-    sleep 1
+    curl -g -f -m 180 -X POST ${HOST}/wake/${DEVICE} -H "Content-Type: application/json" -d ${JSON} -D headers.txt -o image.png
+
+    # Frame unchanged, leave the screen as is.
+    STATUS=`head -n 1 headers.txt 2>/dev/null | cut -d " " -f2`
+    if [ "${STATUS}" = "304" ]; then
+        echo "Frame unchanged"
+    else
+        rm -f displayed.txt
 
-    # Grab the latest file
-    curl -m 180 ${HOST}/image/${DEVICE} -o image.png
+        # Clear display.  Call twice eliminate shadows of previous image.
+        eips -c
+        eips -c
 
-    # Clear display.  Call twice eliminate shadows of previous image.
-    eips -c
-    eips -c
+        # Test if the file is valid, if not, error message
+        if [ ! -f image.png ]; then
+            echo "Error: image.png not found"
+            eips 16 16 "Error: image.png not found"
+        else
 
-    # Test if the file is valid, if not, error message
-    if [ ! -f image.png ]; then
-        echo "Error: image.png not found"
-        eips 16 16 "Error: image.png not found"
-    else
+            # Display new image
+            eips -fg image.png
+            grep -i '^X-Frame-Hash:' headers.txt | cut -d " " -f2 | tr -d '\r' > displayed.txt
+        fi
 
-        # Display new image
-        eips -fg image.png
+        # Pause to let it refresh.
+        sleep 2
     fi
 
-    # Pause to let it refresh.
-    sleep 2
-
-    # Read next wakeup delay from the server
-    DELAY=`curl -m 180  -X GET ${HOST}/delay/${DEVICE} -H 'accept: text/plain'`
+    # Next wakeup delay from the server
+    DELAY=`grep -i '^X-Sleep-Delay:' headers.txt | cut -d " " -f2 | tr -d '\r'`
+    if [ -z "${DELAY}" ]; then
+        # No response, try again later.
+        DELAY=300
+    fi
     echo "Wakeup delay: $DELAY sec"
 
     # Test if $DELAY is zero, if so, exit.
     if [ "${DELAY}" = "0" ]; then
         echo "Exiting"
+        rm -f displayed.txt
         eips -c
         eips 16 16 "Program Exited"
         exit 0
@@ -86,6 +100,7 @@ while true; do
     if [ "$CHARGING" == "Charging: Yes" ]; then
 
         echo "Device Charging"
+        rm -f displayed.txt
         eips -c 
         eips -c 
 
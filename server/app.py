@@ -8,7 +8,10 @@ from fastapi.responses import RedirectResponse
 from nicegui import ui, app
 import paths  # Importing adds paths to sys.path  # noqa: F401
 
+from google_service import google_service
 from plugin_manager import PluginManager
+from render_pool import render_pool
+from render_scheduler import render_scheduler
 from string_filters import StringFilter, StringFilterManager
 
 # Root logger config
@@ -54,6 +57,22 @@ def LoadPlugins():
     # Store with app for later use.
     setattr(app, "plugin_manager", plugmgr)
 
+    # Start render workers with the device renderer modules preloaded.
+    modules = [
+        type(device.renderer).__module__
+        for device in plugmgr.devices
+        if device.renderer
+    ]
+    render_pool.start(modules=modules)
+
+    # Pre-renders scheduled by device wakes, saved across restarts.
+    from devices import frame_render
+    render_scheduler.start(
+        render=frame_render,
+        filename=os.path.join(os.getcwd(), "render-schedule.json"),
+        busy=lambda: render_pool.to_dict()["inflight"],
+    )
+
     # Store filters in the app.
     # Basic filters will be added from file.
     fm = StringFilterManager()
@@ -87,6 +106,9 @@ def LoadPlugins():
 
 
 app.on_startup(handler=LoadPlugins)
+app.on_shutdown(handler=render_scheduler.shutdown)
+app.on_shutdown(handler=render_pool.shutdown)
+app.on_shutdown(handler=google_service.shutdown)
 
 
 @app.exception_handler(404)
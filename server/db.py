@@ -150,6 +150,31 @@ class DB:
 
         return df
 
+    def device_since(self, device: str, since: dt.datetime) -> pd.DataFrame:
+        """
+        Returns data in database for device from a time on, oldest first.
+
+        Args:
+            device (str): Device name.
+            since (datetime.datetime): Earliest time.
+
+        Returns:
+            pd.DataFrame: Data, empty if there is none.
+        """
+
+        stmt = (
+            select(DeviceState)
+            .where(DeviceState.device == device)
+            .where(DeviceState.time >= since)
+            .order_by(DeviceState.time)
+        )
+        res = self._session.exec(stmt)
+
+        records = [x.dict() for x in res.all()]
+        df = pd.DataFrame.from_records(records)
+
+        return df
+
     def data_all(self) -> pd.DataFrame:
         """
         Returns all data in database as a pandas DataFrame.
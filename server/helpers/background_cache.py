@@ -0,0 +1,166 @@
+# background_cache.py
+# Cache of pre-drawn static background layers for renderers.
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable
+
+from PIL import Image, ImageDraw
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+
+
+class BackgroundCache:
+    """
+    LRU cache of base images holding a renderer's static layers.
+
+    A renderer describes the parts of a frame that do not change between
+    renders (separator lines, grid lines, labels) as layers, each a
+    callable drawing onto an `ImageDraw`.  The layers are drawn once per
+    key onto a blank image, and every render starts from a copy of that
+    base and only draws the dynamic content on top.
+
+    The key must capture everything the layers depend on: renderer,
+    layout version, device, image mode and size, and any layout positions.
+    """
+
+    def __init__(self, size_max: int = 32):
+        self._bases = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+        self.size_max = size_max
+
+    @property
+    def size_max(self) -> int:
+        """
+        Maximum number of base images held before eviction.
+
+        Returns:
+            int: Maximum number of entries.
+        """
+
+        return self._size_max
+
+    @size_max.setter
+    def size_max(self, value: int) -> None:
+        if not isinstance(value, int):
+            raise TypeError(f"Cache size must be an integer, got {type(value)}")
+        if value < 1:
+            raise ValueError(f"Cache size must be >= 1, got {value}")
+
+        self._size_max = value
+
+    @property
+    def hits(self) -> int:
+        """
+        Number of renders started from a cached base.
+        """
+
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """
+        Number of renders that required drawing the static layers.
+        """
+
+        return self._misses
+
+    def __len__(self) -> int:
+        return len(self._bases)
+
+    def base_get(
+        self,
+        key: tuple,
+        mode: str,
+        size: tuple,
+        background: int,
+        layers: Iterable[Callable[[ImageDraw.ImageDraw], None]] = (),
+    ) -> Image.Image:
+        """
+        Returns a new image holding the static layers for a key.
+
+        The returned image is a private copy the caller can draw on.
+
+        Args:
+            key (tuple): Hashable key identifying the static layers.
+            mode (str): Image mode.
+            size (tuple): Image (width, height).
+            background (int): Background color.
+            layers (Iterable[Callable], optional): Layer drawing functions,
+                called in order with the drawing context on a cache miss.
+                Defaults to ().
+
+        Returns:
+            PIL.Image.Image: Copy of the base image.
+
+        Example:
+            >>> def grid(draw):
+            ...     draw.line((0, 10, 100, 10), fill=0)
+            >>> image = background_cache.base_get(("demo", 1), "1", (100, 50), 255, [grid])
+            >>> image.getpixel((50, 10))
+            0
+        """
+
+        key = (mode, tuple(size), background) + tuple(key)
+        with self._lock:
+            base = self._bases.get(key)
+            if base is not None:
+                self._bases.move_to_end(key)
+                self._hits += 1
+                return base.copy()
+
+            self._misses += 1
+
+        base = Image.new(mode, size, background)
+        draw = ImageDraw.Draw(base)
+        for layer in layers:
+            layer(draw)
+
+        with self._lock:
+            self._bases[key] = base
+            self._bases.move_to_end(key)
+            while len(self._bases) > self._size_max:
+                self._bases.popitem(last=False)
+
+        return base.copy()
+
+    def clear(self) -> None:
+        """
+        Drops all cached base images and resets hit/miss counters.
+        """
+
+        with self._lock:
+            self._bases.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def to_dict(self) -> dict:
+        """
+        Returns cache statistics.
+
+        Returns:
+            dict: Entry count, maximum size, hits, misses and hit rate.
+
+        Example:
+            >>> background_cache.to_dict()["size_max"]
+            32
+        """
+
+        lookups = self._hits + self._misses
+        return {
+            "size": len(self._bases),
+            "size_max": self._size_max,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+        }
+
+
+# Process wide background cache shared by all renderers.
+background_cache = BackgroundCache()
@@ -0,0 +1,363 @@
+# battery_model.py
+# Per device battery discharge model fitted from posted state history.
+
+import concurrent.futures
+import datetime as dt
+import logging
+import threading
+from typing import NamedTuple
+
+import numpy as np
+
+from db import DB
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+
+# LiPo state of charge curve, (volts, percent), as measured by the
+# devices.  Interpolated between points, clamped at the ends.
+SOC_CURVE = (
+    (2.90, 0),
+    (3.00, 20),
+    (3.20, 50),
+    (3.30, 80),
+    (3.65, 100),
+)
+
+# State history used for a fit.
+HISTORY = dt.timedelta(days=14)
+
+# Rise in state of charge between wakes taken as a charge, not noise.
+CHARGE_JUMP = 5
+
+# Wake intervals needed for a fit.
+FIT_SAMPLES_MIN = 10
+
+# Time a fitted model is used before fitting again.
+FIT_TTL = dt.timedelta(minutes=15)
+
+# Most a sleep delay is stretched to reach a runtime target.
+MULTIPLIER_MAX = 4.0
+
+
+def soc_from_voltage(voltage):
+    """
+    Returns the state of charge for battery voltages, by the SOC_CURVE.
+
+    Args:
+        voltage (float or numpy.ndarray): Battery voltage(s) in volts.
+
+    Returns:
+        float or numpy.ndarray: State of charge, percent 0 to 100.
+
+    Example:
+        >>> soc_from_voltage(3.25)
+        65.0
+        >>> soc_from_voltage(np.array([2.5, 3.1, 4.1]))
+        array([  0.,  35., 100.])
+    """
+
+    volts, socs = zip(*SOC_CURVE)
+    soc = np.interp(voltage, volts, socs)
+
+    return float(soc) if np.ndim(soc) == 0 else soc
+
+
+def drain_fit(hours: np.ndarray, socs: np.ndarray) -> tuple:
+    """
+    Fits battery drain to a device's state history.
+
+    Each state post is a wake.  The drop in state of charge between two
+    posts is modeled as the cost of one wake plus the cost of the time
+    asleep, fitted by least squares over all intervals without a charge.
+    Telling the two apart needs intervals of different lengths.
+
+    Args:
+        hours (numpy.ndarray): Post times in hours, ascending.
+        socs (numpy.ndarray): State of charge at each post, percent.
+
+    Returns:
+        tuple: (wake, idle, samples).  Percent per wake, percent per hour
+            and the intervals fitted, or None with too few intervals.
+
+    Example:
+        >>> gaps = np.resize([0.25, 1.0], 19)
+        >>> hours = np.concatenate([[0], np.cumsum(gaps)])
+        >>> socs = 90 - np.concatenate([[0], np.cumsum(0.2 + gaps * 0.4)])
+        >>> [round(x, 3) for x in drain_fit(hours, socs)[:2]]
+        [0.2, 0.4]
+    """
+
+    d_hours = np.diff(hours)
+    d_socs = np.diff(socs)
+
+    # Drop charges, and posts with no time between them.
+    valid = (d_socs <= CHARGE_JUMP) & (d_hours > 0)
+    samples = int(valid.sum())
+    if samples < FIT_SAMPLES_MIN:
+        return None
+
+    x = np.column_stack([np.ones(samples), d_hours[valid]])
+    y = -d_socs[valid]
+    (wake, idle), *_ = np.linalg.lstsq(x, y, rcond=None)
+
+    return max(float(wake), 0.0), max(float(idle), 0.0), samples
+
+
+class DrainModel(NamedTuple):
+    """
+    Fitted battery drain of a device.
+    """
+
+    soc: float
+    wake: float
+    idle: float
+    samples: int
+    time: dt.datetime
+
+    def rate_get(self, delay: dt.timedelta) -> float:
+        """
+        Returns the drain waking once per delay.
+
+        Args:
+            delay (datetime.timedelta): Sleep delay.
+
+        Returns:
+            float: Percent per hour.
+        """
+
+        hours = delay.total_seconds() / 3600
+        if hours <= 0:
+            return float("inf")
+
+        return self.wake / hours + self.idle
+
+    def runtime_get(self, delay: dt.timedelta) -> dt.timedelta:
+        """
+        Returns the projected time until the battery is empty.
+
+        Args:
+            delay (datetime.timedelta): Sleep delay.
+
+        Returns:
+            datetime.timedelta: Runtime, or None if the battery isn't draining.
+        """
+
+        rate = self.rate_get(delay)
+        if rate <= 0:
+            return None
+
+        return dt.timedelta(hours=self.soc / rate)
+
+    def multiplier_get(self, delay: dt.timedelta, target: dt.timedelta) -> float:
+        """
+        Returns the factor to stretch a sleep delay by to reach a runtime.
+
+        Args:
+            delay (datetime.timedelta): Sleep delay.
+            target (datetime.timedelta): Runtime target from now.
+
+        Returns:
+            float: Multiplier, 1 to MULTIPLIER_MAX.
+
+        Example:
+            >>> now = dt.datetime(2025, 3, 4, 9)
+            >>> model = DrainModel(soc=50, wake=0.2, idle=0.05, samples=40, time=now)
+            >>> model.multiplier_get(dt.timedelta(minutes=15), dt.timedelta(days=7))
+            3.230769230769231
+        """
+
+        runtime = self.runtime_get(delay)
+        if runtime is None or runtime >= target:
+            return 1.0
+
+        # Wake drain the runtime target allows, after the idle drain.
+        budget = self.soc / (target.total_seconds() / 3600) - self.idle
+        if budget <= 0:
+            return MULTIPLIER_MAX
+
+        hours = self.wake / budget
+        multiplier = hours / (delay.total_seconds() / 3600)
+
+        return min(max(multiplier, 1.0), MULTIPLIER_MAX)
+
+
+class BatteryModels:
+    """
+    Drain model per device, fitted from the DeviceState history in the DB.
+
+    Fits are vectorized over the HISTORY window and kept for FIT_TTL,
+    posts come in once per wake so the model changes slowly.  Sleep
+    delays are computed on the event loop, so lookups only read the last
+    fitted model.  Stale models are refitted on a background thread, the
+    lookup returns the previous model, or None, until the fit is done.
+    """
+
+    def __init__(self, ttl: dt.timedelta = FIT_TTL):
+        self._models = {}
+        self._fitting = set()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._fits = 0
+
+        self.ttl = ttl
+
+    @property
+    def ttl(self) -> dt.timedelta:
+        """
+        Time a fitted model is used.
+
+        Returns:
+            datetime.timedelta: Time to live.
+        """
+
+        return self._ttl
+
+    @ttl.setter
+    def ttl(self, value: dt.timedelta) -> None:
+        if not isinstance(value, dt.timedelta):
+            raise TypeError(f"TTL must be a datetime.timedelta, got {type(value)}")
+
+        self._ttl = value
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+    def model_get(self, device: str) -> DrainModel:
+        """
+        Returns the last fitted drain model of a device.  Doesn't block,
+        a stale or missing model is refitted in the background.
+
+        Args:
+            device (str): Device name.
+
+        Returns:
+            DrainModel: Model, or None without enough history or before
+                the first fit is done.
+
+        Example:
+            >>> model = battery_models.model_get("home-office")
+            >>> model.runtime_get(dt.timedelta(hours=1)) > dt.timedelta(days=7)
+            True
+        """
+
+        now = dt.datetime.now()
+        with self._lock:
+            cached = self._models.get(device)
+            stale = cached is None or now - cached[0] >= self._ttl
+            if stale and device not in self._fitting:
+                self._fitting.add(device)
+                if self._executor is None:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=1, thread_name_prefix="battery-fit"
+                    )
+                self._executor.submit(self._refresh, device)
+
+        return cached[1] if cached is not None else None
+
+    def _refresh(self, device: str) -> None:
+        """
+        Fits a device's model and stores it, on the fit thread.
+        """
+
+        now = dt.datetime.now()
+        try:
+            model = self._fit(device, now)
+        except Exception as e:
+            logger.error(f"Battery fit failed for {device}: {e}")
+            with self._lock:
+                self._fitting.discard(device)
+            return
+
+        with self._lock:
+            self._models[device] = (now, model)
+            self._fitting.discard(device)
+            self._fits += 1
+
+    def _fit(self, device: str, now: dt.datetime) -> DrainModel:
+        """
+        Fits a device's drain model from its history.
+        """
+
+        df = DB().device_since(device, now - HISTORY)
+        if df is None or df.empty:
+            return None
+
+        # State of charge from the voltage where posted, else as posted.
+        voltage = df["battery_voltage"].to_numpy(dtype=float)
+        socs = df["battery_soc"].to_numpy(dtype=float)
+        socs = np.where(voltage > 0, soc_from_voltage(voltage), socs)
+
+        # Skip posts without a battery reading.
+        known = (socs >= 0) & (socs <= 100)
+        times = df["time"].to_numpy(dtype="datetime64[s]")[known]
+        socs = socs[known]
+        if socs.size == 0:
+            return None
+
+        hours = (times - times[0]) / np.timedelta64(1, "h")
+        fit = drain_fit(hours, socs)
+        if fit is None:
+            logger.debug(f"Not enough battery history to fit: {device}")
+            return None
+
+        wake, idle, samples = fit
+        logger.debug(
+            f"Battery drain for {device}: {wake:.3f}%/wake, {idle:.3f}%/hour, {samples} samples"
+        )
+
+        return DrainModel(float(socs[-1]), wake, idle, samples, now)
+
+    def delay_multiplier_get(
+        self, device: str, delay: dt.timedelta, target: dt.timedelta
+    ) -> float:
+        """
+        Returns the factor to stretch a device's sleep delay by so its
+        battery lasts the target runtime.
+
+        Args:
+            device (str): Device name.
+            delay (datetime.timedelta): Sleep delay.
+            target (datetime.timedelta): Runtime target from now.
+
+        Returns:
+            float: Multiplier, 1 without a model.
+        """
+
+        model = self.model_get(device)
+        if model is None:
+            return 1.0
+
+        return model.multiplier_get(delay, target)
+
+    def clear(self, device: str = None) -> None:
+        """
+        Drops fitted models, refitting on next use.
+
+        Args:
+            device (str, optional): Device name, None for all. Defaults to None.
+        """
+
+        with self._lock:
+            if device is None:
+                self._models.clear()
+            else:
+                self._models.pop(device, None)
+
+    def to_dict(self) -> dict:
+        """
+        Returns model statistics.
+
+        Returns:
+            dict: Devices modeled and fits run.
+        """
+
+        return {
+            "devices": len(self._models),
+            "fits": self._fits,
+        }
+
+
+# Process wide battery models.
+battery_models = BatteryModels()
@@ -0,0 +1,398 @@
+# calendar_sync.py
+# Local calendar event store for incremental syncs.
+
+import contextlib
+import datetime as dt
+import fcntl
+import json
+import logging
+import os
+import threading
+from typing import Callable, Iterable
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+
+
+def file_version_get(filename: str) -> tuple:
+    """
+    Returns what identifies a version of a file replaced atomically.
+    Saves within one file system timestamp tick share a modification
+    time, each is a new inode though.
+
+    Args:
+        filename (str): File name.
+
+    Raises:
+        OSError: The file can't be read.
+
+    Returns:
+        tuple: (inode, modification time in ns, size).
+    """
+
+    stat = os.stat(filename)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class CalendarStore:
+    """
+    Local copy of the events of several calendars, kept in step with the
+    online calendars by incremental syncs.
+
+    Calendar APIs hand out a sync token, or delta link, with each sync.
+    The next sync presents it and gets back only the events changed or
+    removed since.  Per calendar the store keeps the raw event items by
+    ID, the token and the time range it covers.
+
+    The store is saved to a JSON file.  Renders run in several worker
+    processes, so changes are made under a lock on a ".lock" file next to
+    the store: the file is reloaded, changed and written back atomically
+    before another process gets a turn.  Readers reload the file when
+    another process changed it.  Changes made within `batch` are saved
+    once, at its end.
+    """
+
+    def __init__(self, filename: str):
+        self._filename = filename
+        self._calendars = {}
+        self._version = None
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._dirty = False
+        self._lock_file = None
+        self._full = 0
+        self._incremental = 0
+        self._changed = 0
+        self._removed = 0
+
+    @property
+    def filename(self) -> str:
+        """
+        Store file.
+
+        Returns:
+            str: File name, relative to the working directory or absolute.
+        """
+
+        return self._filename
+
+    def _calendar_get(self, calendar: str) -> dict:
+        self._reload()
+        return self._calendars.get(calendar)
+
+    def calendars(self) -> list:
+        """
+        Returns the stored calendars.
+
+        Returns:
+            list: Calendar IDs, sorted.
+        """
+
+        with self._lock:
+            self._reload()
+            return sorted(self._calendars)
+
+    def token_get(self, calendar: str) -> str:
+        """
+        Returns the token for a calendar's next incremental sync.
+
+        Args:
+            calendar (str): Calendar ID.
+
+        Returns:
+            str: Sync token, or None if the calendar needs a full sync.
+        """
+
+        with self._lock:
+            state = self._calendar_get(calendar)
+            return state["token"] if state else None
+
+    def since_get(self, calendar: str) -> dt.datetime:
+        """
+        Returns the start of the time range a calendar's events cover.
+
+        Args:
+            calendar (str): Calendar ID.
+
+        Returns:
+            datetime.datetime: Start, or None if the calendar isn't stored.
+        """
+
+        with self._lock:
+            state = self._calendar_get(calendar)
+            return dt.datetime.fromisoformat(state["since"]) if state else None
+
+    def until_get(self, calendar: str) -> dt.datetime:
+        """
+        Returns the end of the time range a calendar's events cover.
+
+        Args:
+            calendar (str): Calendar ID.
+
+        Returns:
+            datetime.datetime: End, or None if the calendar isn't stored or
+                its range is open ended.
+        """
+
+        with self._lock:
+            state = self._calendar_get(calendar)
+            until = state.get("until") if state else None
+            return dt.datetime.fromisoformat(until) if until else None
+
+    def items_get(self, calendar: str) -> list:
+        """
+        Returns a calendar's stored event items.
+
+        Args:
+            calendar (str): Calendar ID.
+
+        Returns:
+            list: Event items, sorted by ID.
+        """
+
+        with self._lock:
+            state = self._calendar_get(calendar)
+            if state is None:
+                return []
+            return [state["items"][key] for key in sorted(state["items"])]
+
+    def replace(
+        self,
+        calendar: str,
+        items: Iterable[dict],
+        token: str,
+        since: dt.datetime,
+        until: dt.datetime = None,
+    ) -> None:
+        """
+        Stores the result of a full sync, replacing a calendar's events.
+
+        Args:
+            calendar (str): Calendar ID.
+            items (Iterable[dict]): Event items, each with an "id".
+            token (str): Token for the next incremental sync.
+            since (datetime.datetime): Start of the time range synced.
+            until (datetime.datetime, optional): End of the time range
+                synced. Defaults to None, open ended.
+        """
+
+        with self.batch():
+            self._calendars[calendar] = {
+                "token": token,
+                "since": since.isoformat(),
+                "until": until.isoformat() if until else None,
+                "items": {item["id"]: item for item in items},
+            }
+            self._full += 1
+            self._dirty = True
+
+    def apply(
+        self, calendar: str, changed: Iterable[dict], removed: Iterable[str], token: str
+    ) -> bool:
+        """
+        Applies the result of an incremental sync.  A sync without changes
+        keeps the stored token, which stays valid, so the store isn't
+        written.
+
+        Args:
+            calendar (str): Calendar ID.
+            changed (Iterable[dict]): New and changed event items.
+            removed (Iterable[str]): IDs of removed events.
+            token (str): Token for the next incremental sync.
+
+        Returns:
+            bool: True if applied, False if the calendar isn't stored, e.g.
+                another process dropped it, and needs a full sync.
+
+        Example:
+            >>> item = {"id": "9fh3kd0a", "summary": "Standup"}
+            >>> store.apply("primary", [item], ["5kd9cbq2"], "CPDAlvWDx70CEPDAlvWDx70CGAU=")
+            True
+        """
+
+        changed = list(changed)
+        removed = list(removed)
+        with self.batch():
+            state = self._calendars.get(calendar)
+            if state is None:
+                return False
+
+            self._incremental += 1
+            if not changed and not removed:
+                return True
+
+            items = state["items"]
+            for item in changed:
+                items[item["id"]] = item
+                self._changed += 1
+            for key in removed:
+                if items.pop(key, None) is not None:
+                    self._removed += 1
+            state["token"] = token
+            self._dirty = True
+
+        return True
+
+    def prune(self, calendar: str, keep: Callable[[dict], bool]) -> int:
+        """
+        Drops a calendar's events that are no longer needed, e.g. past ones.
+
+        Args:
+            calendar (str): Calendar ID.
+            keep (Callable): Returns True for items to keep.
+
+        Returns:
+            int: Items dropped.
+        """
+
+        with self.batch():
+            state = self._calendars.get(calendar)
+            if state is None:
+                return 0
+
+            items = state["items"]
+            drop = [key for key, item in items.items() if not keep(item)]
+            for key in drop:
+                del items[key]
+            if drop:
+                self._dirty = True
+
+        return len(drop)
+
+    def drop(self, calendar: str) -> None:
+        """
+        Forgets a calendar, e.g. when its sync token was rejected.  The
+        next sync is a full one.
+
+        Args:
+            calendar (str): Calendar ID.
+        """
+
+        with self.batch():
+            if self._calendars.pop(calendar, None) is not None:
+                self._dirty = True
+
+    def clear(self) -> None:
+        """
+        Forgets all calendars.
+        """
+
+        with self.batch():
+            self._calendars.clear()
+            self._dirty = True
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Groups changes into one update of the store file.  Holds the store
+        lock, across threads and processes, reloads the file on entry and
+        saves it once on exit if anything changed.  Batches nest.  Don't
+        wait on the network within a batch, other renders are held up.
+
+        Example:
+            >>> with store.batch():
+            ...     store.apply("primary", changed, removed, token)
+            ...     store.prune("primary", keep)
+        """
+
+        with self._lock:
+            if self._depth == 0:
+                self._lock_acquire()
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        if self._dirty:
+                            self._save()
+                    finally:
+                        self._dirty = False
+                        self._lock_release()
+
+    def _lock_acquire(self) -> None:
+        """
+        Takes the store file lock, then loads any changes by other processes.
+        """
+
+        try:
+            self._lock_file = open(f"{self._filename}.lock", "a")
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        except OSError as e:
+            logger.error(f"Failed to lock calendar store {self._filename}: {e}")
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+        self._reload()
+
+    def _lock_release(self) -> None:
+        """
+        Releases the store file lock.
+        """
+
+        if self._lock_file is None:
+            return
+
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+        self._lock_file = None
+
+    def _reload(self) -> None:
+        """
+        Loads the store file if it changed since last read or written.
+        """
+
+        try:
+            version = file_version_get(self._filename)
+        except OSError:
+            return
+
+        if version == self._version:
+            return
+
+        try:
+            with open(self._filename) as f:
+                self._calendars = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load calendar store {self._filename}: {e}")
+            return
+
+        self._version = version
+        logger.debug(f"Loaded {len(self._calendars)} calendars from: {self._filename}")
+
+    def _save(self) -> None:
+        """
+        Saves the store file, replacing it atomically.
+        """
+
+        temp = f"{self._filename}.{os.getpid()}.tmp"
+        try:
+            with open(temp, "w") as f:
+                json.dump(self._calendars, f)
+            os.replace(temp, self._filename)
+            self._version = file_version_get(self._filename)
+        except OSError as e:
+            logger.error(f"Failed to save calendar store {self._filename}: {e}")
+
+    def to_dict(self) -> dict:
+        """
+        Returns store statistics.
+
+        Returns:
+            dict: Calendars and events stored, full and incremental syncs,
+                events changed and removed.
+        """
+
+        with self._lock:
+            events = sum(len(state["items"]) for state in self._calendars.values())
+            return {
+                "calendars": len(self._calendars),
+                "events": events,
+                "full": self._full,
+                "incremental": self._incremental,
+                "changed": self._changed,
+                "removed": self._removed,
+            }
@@ -0,0 +1,388 @@
+# frame_cache.py
+# In-memory store of the latest encoded frame per device.
+
+import datetime as dt
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from frame_format import FrameEncoding, frame_encode
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+
+# Default time a frame is served before it is rendered again.
+FRAME_TTL = dt.timedelta(minutes=5)
+
+# Frames kept per device, by hash, for downloads resumed after the
+# frame was replaced.
+FRAME_HISTORY = 2
+
+
+def frame_hash(png: bytes) -> str:
+    """
+    Returns the content hash of an encoded frame.
+
+    Args:
+        png (bytes): Encoded image.
+
+    Returns:
+        str: 16 hex digit hash.
+
+    Example:
+        >>> frame_hash(b"")
+        'e4a6a0577479b2b4'
+    """
+
+    return hashlib.blake2b(png, digest_size=8).hexdigest()
+
+
+class Frame(NamedTuple):
+    """
+    Encoded frame for a device.
+    """
+
+    png: bytes
+    hash: str
+    time: dt.datetime
+    fingerprint: str = None
+    changes: tuple = ()
+
+    @property
+    def etag(self) -> str:
+        """
+        Strong HTTP entity tag, the quoted content hash.
+        """
+
+        return f'"{self.hash}"'
+
+    def etag_get(self, format: str = "png") -> str:
+        """
+        Strong HTTP entity tag for an encoding of the frame.
+
+        Args:
+            format (str, optional): Format name. Defaults to "png".
+
+        Returns:
+            str: Entity tag.  The PNG tag is the quoted hash, other
+                formats append the format name.
+        """
+
+        if format == "png":
+            return self.etag
+
+        return f'"{self.hash}-{format}"'
+
+    def etag_match(self, if_none_match: str, format: str = "png") -> bool:
+        """
+        Returns True if an If-None-Match header matches this frame.
+
+        Args:
+            if_none_match (str): Header value, may be None.
+            format (str, optional): Format name. Defaults to "png".
+
+        Returns:
+            bool: True if the client has this frame.
+
+        Example:
+            >>> frame.etag_match('W/"e4a6a0577479b2b4", "0000000000000000"')
+            True
+        """
+
+        if not if_none_match:
+            return False
+
+        etag = self.etag_get(format)
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*":
+                return True
+
+            # Weak comparison, as required for If-None-Match.
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag == etag:
+                return True
+
+        return False
+
+
+class FrameCache:
+    """
+    Latest encoded frame per device, served straight from memory.
+
+    Frames expire after a time to live, which devices can override.
+    Frame bytes are immutable and addressed by their hash, the last
+    FRAME_HISTORY per device stay available after being replaced.
+    """
+
+    def __init__(self, ttl: dt.timedelta = FRAME_TTL):
+        self._frames = {}
+        self._history = {}
+        self._encodings = {}
+        self._ttls = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+        self.ttl = ttl
+
+    @property
+    def ttl(self) -> dt.timedelta:
+        """
+        Default frame time to live.
+
+        Returns:
+            datetime.timedelta: Time to live.
+        """
+
+        return self._ttl
+
+    @ttl.setter
+    def ttl(self, value: dt.timedelta) -> None:
+        if not isinstance(value, dt.timedelta):
+            raise TypeError(f"TTL must be a datetime.timedelta, got {type(value)}")
+
+        self._ttl = value
+
+    def ttl_get(self, device: str) -> dt.timedelta:
+        """
+        Returns the frame time to live for a device.
+
+        Args:
+            device (str): Device name.
+
+        Returns:
+            datetime.timedelta: Time to live.
+        """
+
+        return self._ttls.get(device, self._ttl)
+
+    def ttl_set(self, device: str, ttl: dt.timedelta) -> None:
+        """
+        Sets the frame time to live for a device.
+
+        Args:
+            device (str): Device name.
+            ttl (datetime.timedelta): Time to live, None for the default.
+        """
+
+        if ttl is None:
+            self._ttls.pop(device, None)
+            return
+
+        if not isinstance(ttl, dt.timedelta):
+            raise TypeError(f"TTL must be a datetime.timedelta, got {type(ttl)}")
+
+        self._ttls[device] = ttl
+
+    @property
+    def hits(self) -> int:
+        """
+        Number of requests served a cached frame.
+        """
+
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """
+        Number of requests that needed a render.
+        """
+
+        return self._misses
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def frame_get(self, device: str, fresh: bool = True) -> Frame:
+        """
+        Returns the frame for a device.
+
+        Args:
+            device (str): Device name.
+            fresh (bool, optional): Only return a frame within its time to live.
+                Defaults to True.
+
+        Returns:
+            Frame: Frame, or None.
+
+        Example:
+            >>> frame_cache.frame_get("kitchen") is None
+            True
+        """
+
+        with self._lock:
+            frame = self._frames.get(device)
+            if frame is not None and fresh:
+                age = dt.datetime.now() - frame.time
+                if age >= self.ttl_get(device):
+                    logger.debug(f"Frame expired for: {device}, age: {age}")
+                    frame = None
+
+            if fresh:
+                if frame is None:
+                    self._misses += 1
+                else:
+                    self._hits += 1
+
+        return frame
+
+    def frame_put(
+        self, device: str, png: bytes, fingerprint: str = None, changes: tuple = ()
+    ) -> Frame:
+        """
+        Stores a newly rendered frame for a device.
+
+        Args:
+            device (str): Device name.
+            png (bytes): Encoded image.
+            fingerprint (str, optional): Fingerprint of the render inputs.
+                Defaults to None.
+            changes (tuple, optional): Instants the frame will change at.
+                Defaults to ().
+
+        Returns:
+            Frame: Stored frame.
+        """
+
+        frame = Frame(
+            png=png,
+            hash=frame_hash(png),
+            time=dt.datetime.now(),
+            fingerprint=fingerprint,
+            changes=tuple(changes),
+        )
+        with self._lock:
+            self._frames[device] = frame
+
+            history = self._history.setdefault(device, OrderedDict())
+            history[frame.hash] = png
+            history.move_to_end(frame.hash)
+            while len(history) > FRAME_HISTORY:
+                history.popitem(last=False)
+
+        return frame
+
+    def png_get(self, device: str, frame_hash: str) -> bytes:
+        """
+        Returns a recent frame of a device by its hash.
+
+        Args:
+            device (str): Device name.
+            frame_hash (str): Frame hash.
+
+        Returns:
+            bytes: PNG, or None if the frame is no longer held.
+
+        Example:
+            >>> frame = frame_cache.frame_get("kitchen")
+            >>> frame_cache.png_get("kitchen", frame.hash) is frame.png
+            True
+        """
+
+        with self._lock:
+            return self._history.get(device, {}).get(frame_hash)
+
+    def frame_touch(self, device: str, changes: tuple = None) -> Frame:
+        """
+        Restarts the time to live of a device's frame, for a render that
+        found its inputs unchanged.
+
+        Args:
+            device (str): Device name.
+            changes (tuple, optional): Instants the frame will change at,
+                None to keep the frame's. Defaults to None.
+
+        Returns:
+            Frame: Refreshed frame, or None if the device has no frame.
+        """
+
+        with self._lock:
+            frame = self._frames.get(device)
+            if frame is None:
+                return None
+
+            frame = frame._replace(time=dt.datetime.now())
+            if changes is not None:
+                frame = frame._replace(changes=tuple(changes))
+            self._frames[device] = frame
+
+        return frame
+
+    def encoding_get(self, device: str, frame: Frame, format: str) -> FrameEncoding:
+        """
+        Returns a frame encoded in a device format.
+
+        Each format is encoded once per frame.
+
+        Args:
+            device (str): Device name.
+            frame (Frame): Frame.
+            format (str): Format name, see frame_format.FORMATS.
+
+        Returns:
+            FrameEncoding: Encoded frame.
+
+        Example:
+            >>> frame = frame_cache.frame_get("home-office")
+            >>> frame_cache.encoding_get("home-office", frame, "1bpp-rle").media_type
+            'application/x-e-display-1bpp-rle'
+        """
+
+        with self._lock:
+            frame_hash, encodings = self._encodings.get(device, (None, {}))
+            if frame_hash == frame.hash and format in encodings:
+                return encodings[format]
+
+        encoding = frame_encode(frame.png, format)
+
+        with self._lock:
+            frame_hash, encodings = self._encodings.get(device, (None, {}))
+            if frame_hash != frame.hash:
+                encodings = {}
+                self._encodings[device] = (frame.hash, encodings)
+            encodings[format] = encoding
+
+        return encoding
+
+    def clear(self, device: str = None) -> None:
+        """
+        Drops the frame for a device, or all frames.
+
+        Args:
+            device (str, optional): Device name, None for all. Defaults to None.
+        """
+
+        with self._lock:
+            if device is None:
+                self._frames.clear()
+                self._history.clear()
+                self._encodings.clear()
+            else:
+                self._frames.pop(device, None)
+                self._history.pop(device, None)
+                self._encodings.pop(device, None)
+
+    def to_dict(self) -> dict:
+        """
+        Returns cache statistics.
+
+        Returns:
+            dict: Entry count, hits, misses and hit rate.
+        """
+
+        lookups = self._hits + self._misses
+        return {
+            "size": len(self._frames),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+        }
+
+
+# Process wide frame cache.
+frame_cache = FrameCache()
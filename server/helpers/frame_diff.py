@@ -0,0 +1,341 @@
+# frame_diff.py
+# Dirty rectangles between frames for e-ink partial refresh.
+#
+# Update body, little endian:
+#   uint16 rect count
+#   per rect:
+#     uint16 x, y, width, height   pixels, x is a multiple of 8
+#     ceil(width / 8) * height bytes of 1bpp pixels for the rect, rows
+#     top to bottom, MSB first, 1 = white (same packing as "1bpp").
+#
+# A full refresh is a single rect covering the whole frame.
+
+import logging
+import struct
+import threading
+from typing import NamedTuple
+
+import numpy as np
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+
+# Partial updates allowed before a full refresh clears ghosting.
+FULL_REFRESH_EVERY = 10
+
+# Changed fraction of the frame above which a full refresh is sent.
+FULL_REFRESH_AREA = 0.5
+
+# Unchanged rows and byte columns bridged when merging rectangles.
+# Fewer, larger rects are cheaper for the panel than many small ones.
+MERGE_ROWS = 8
+MERGE_BYTES = 2
+
+# Frames sent but not yet confirmed drawn, kept per device.
+PENDING_MAX = 2
+
+
+class PartialUpdate(NamedTuple):
+    """
+    Update taking a device from one frame to the next.
+    """
+
+    full: bool
+    rects: list
+    data: bytes
+    hash: str
+    base: str
+
+
+def dirty_rects(
+    prev: np.ndarray,
+    new: np.ndarray,
+    width: int,
+    merge_rows: int = MERGE_ROWS,
+    merge_bytes: int = MERGE_BYTES,
+) -> list:
+    """
+    Returns the rectangles that differ between two packed 1bpp frames.
+
+    Args:
+        prev (numpy.ndarray): Previous frame, uint8 (height, row bytes).
+        new (numpy.ndarray): New frame, same shape.
+        width (int): Frame width in pixels.
+        merge_rows (int, optional): Unchanged rows bridged between changes.
+            Defaults to MERGE_ROWS.
+        merge_bytes (int, optional): Unchanged byte columns bridged between
+            changes. Defaults to MERGE_BYTES.
+
+    Returns:
+        list: (x, y, width, height) rects in pixels, x byte aligned.
+
+    Example:
+        >>> prev = np.full((800, 60), 0xFF, dtype=np.uint8)
+        >>> new = prev.copy()
+        >>> new[770:790, 1:20] = 0
+        >>> dirty_rects(prev, new, 480)
+        [(8, 770, 152, 20)]
+    """
+
+    diff = prev != new
+
+    # Bands of changed rows.
+    rows = np.flatnonzero(diff.any(axis=1))
+    if rows.size == 0:
+        return []
+    bands = np.split(rows, np.flatnonzero(np.diff(rows) > merge_rows + 1) + 1)
+
+    rects = []
+    for band in bands:
+        y0 = int(band[0])
+        y1 = int(band[-1]) + 1
+
+        # Spans of changed byte columns within the band.
+        cols = np.flatnonzero(diff[y0:y1].any(axis=0))
+        spans = np.split(cols, np.flatnonzero(np.diff(cols) > merge_bytes + 1) + 1)
+        for span in spans:
+            x0 = int(span[0]) * 8
+            x1 = min((int(span[-1]) + 1) * 8, width)
+            rects.append((x0, y0, x1 - x0, y1 - y0))
+
+    return rects
+
+
+def update_encode(pixels: np.ndarray, rects: list) -> bytes:
+    """
+    Packs rects and their pixels into an update body.
+
+    Args:
+        pixels (numpy.ndarray): New frame, uint8 (height, row bytes).
+        rects (list): (x, y, width, height) rects, x byte aligned.
+
+    Returns:
+        bytes: Update body.
+    """
+
+    parts = [struct.pack("<H", len(rects))]
+    for x, y, w, h in rects:
+        parts.append(struct.pack("<4H", x, y, w, h))
+        parts.append(pixels[y:y + h, x // 8:(x + w + 7) // 8].tobytes())
+
+    return b"".join(parts)
+
+
+class PartialRefresh:
+    """
+    Tracks the frame each device shows and builds partial updates.
+
+    Frames are diffed on their packed 1bpp encoding.  A device gets a
+    full refresh when it has nothing on record, shows a different frame
+    than the server expects, has had FULL_REFRESH_EVERY partial updates,
+    or when most of the frame changed.
+
+    A frame sent is only pending until the device confirms it drew it,
+    see `confirm`.  Updates are diffed against the last confirmed frame,
+    so a failed download or draw costs a full refresh, not a device
+    drawing rects onto a frame it never showed.
+    """
+
+    def __init__(
+        self,
+        full_every: int = FULL_REFRESH_EVERY,
+        full_area: float = FULL_REFRESH_AREA,
+    ):
+        self._devices = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._partials = 0
+        self._fulls = 0
+
+        self.full_every = full_every
+        self.full_area = full_area
+
+    @property
+    def full_every(self) -> int:
+        """
+        Partial updates allowed before a full refresh.
+
+        Returns:
+            int: Partial update count.
+        """
+
+        return self._full_every
+
+    @full_every.setter
+    def full_every(self, value: int) -> None:
+        if not isinstance(value, int):
+            raise TypeError(f"Full refresh count must be an integer, got {type(value)}")
+        if value < 0:
+            raise ValueError(f"Full refresh count must be >= 0, got {value}")
+
+        self._full_every = value
+
+    @property
+    def full_area(self) -> float:
+        """
+        Changed fraction of the frame above which a full refresh is sent.
+
+        Returns:
+            float: Fraction, 0 to 1.
+        """
+
+        return self._full_area
+
+    @full_area.setter
+    def full_area(self, value: float) -> None:
+        if not isinstance(value, (int, float)):
+            raise TypeError(f"Full refresh area must be a number, got {type(value)}")
+        if not 0 <= value <= 1:
+            raise ValueError(f"Full refresh area must be between 0 and 1, got {value}")
+
+        self._full_area = float(value)
+
+    def update_get(
+        self,
+        device: str,
+        frame_hash: str,
+        packed: bytes,
+        size: tuple,
+        base: str = None,
+    ) -> PartialUpdate:
+        """
+        Returns the update taking a device to a new frame, and records
+        the new frame as pending on the device.
+
+        Args:
+            device (str): Device name.
+            frame_hash (str): New frame hash.
+            packed (bytes): New frame, packed 1bpp.
+            size (tuple): Frame (width, height).
+            base (str, optional): Hash of the frame the device shows, if
+                it reports one.  Defaults to the last frame confirmed.
+
+        Returns:
+            PartialUpdate: Update.  Empty rects if the device is up to date.
+
+        Example:
+            >>> encoding = frame_cache.encoding_get(device, frame, "1bpp")
+            >>> update = partial_refresh.update_get(device, frame.hash, encoding.data, encoding.size)
+            >>> update.full
+            True
+        """
+
+        width, height = size
+        pixels = np.frombuffer(packed, dtype=np.uint8).reshape(height, -1)
+
+        with self._lock:
+            # A reported base confirms a pending frame.
+            if base is not None:
+                self._confirm(device, base)
+
+            prev_hash, prev, count = self._devices.get(device, (None, None, 0))
+            if base is None:
+                base = prev_hash
+
+            # Device already shows this frame.
+            if base == frame_hash:
+                if prev_hash != frame_hash:
+                    self._devices[device] = (frame_hash, pixels, count)
+                return PartialUpdate(False, [], update_encode(pixels, []), frame_hash, base)
+
+            full = (
+                prev is None
+                or base != prev_hash
+                or prev.shape != pixels.shape
+                or count >= self._full_every
+            )
+
+            rects = []
+            if not full:
+                rects = dirty_rects(prev, pixels, width)
+                area = sum(w * h for _, _, w, h in rects)
+                full = area > self._full_area * width * height
+
+            if full:
+                rects = [(0, 0, width, height)]
+                count = 0
+                self._fulls += 1
+            else:
+                count += 1
+                self._partials += 1
+
+            pending = self._pending.setdefault(device, {})
+            pending.pop(frame_hash, None)
+            pending[frame_hash] = (frame_hash, pixels, count)
+            while len(pending) > PENDING_MAX:
+                del pending[next(iter(pending))]
+
+        logger.debug(
+            f"Update for {device}: {'full' if full else 'partial'}, {len(rects)} rects"
+        )
+
+        return PartialUpdate(full, rects, update_encode(pixels, rects), frame_hash, base)
+
+    def confirm(self, device: str, frame_hash: str) -> None:
+        """
+        Records that a device drew a frame, as acknowledged through
+        /displayed.  Later updates are diffed against it.
+
+        Args:
+            device (str): Device name.
+            frame_hash (str): Hash of the frame drawn.
+
+        Example:
+            >>> update = partial_refresh.update_get(device, frame.hash, encoding.data, encoding.size)
+            >>> partial_refresh.confirm(device, frame.hash)
+        """
+
+        with self._lock:
+            self._confirm(device, frame_hash)
+
+    def _confirm(self, device: str, frame_hash: str) -> None:
+        """
+        Confirms a frame, lock held.  An unknown frame leaves nothing
+        on record, the next update is full.
+        """
+
+        pending = self._pending.get(device, {})
+        shown = pending.pop(frame_hash, None)
+        if shown is not None:
+            self._devices[device] = shown
+            pending.clear()
+            return
+
+        prev = self._devices.get(device)
+        if prev is not None and prev[0] != frame_hash:
+            del self._devices[device]
+
+    def clear(self, device: str = None) -> None:
+        """
+        Forgets what a device shows, or all devices.  The next update is full.
+
+        Args:
+            device (str, optional): Device name, None for all. Defaults to None.
+        """
+
+        with self._lock:
+            if device is None:
+                self._devices.clear()
+                self._pending.clear()
+            else:
+                self._devices.pop(device, None)
+                self._pending.pop(device, None)
+
+    def to_dict(self) -> dict:
+        """
+        Returns update statistics.
+
+        Returns:
+            dict: Devices tracked, partial and full updates sent.
+        """
+
+        return {
+            "devices": len(self._devices),
+            "partial": self._partials,
+            "full": self._fulls,
+        }
+
+
+# Process wide partial refresh tracker.
+partial_refresh = PartialRefresh()
@@ -0,0 +1,134 @@
+# frame_displayed.py
+# Frames devices have confirmed they display.
+
+import datetime as dt
+import logging
+import threading
+from typing import NamedTuple
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+
+
+class Displayed(NamedTuple):
+    """
+    Frame a device confirmed it displays.
+    """
+
+    hash: str
+    time: dt.datetime
+
+
+class DisplayedFrames:
+    """
+    Per device hash of the frame the device last confirmed it displayed.
+
+    Devices acknowledge a frame after drawing it.  When the current frame
+    has the acknowledged hash the device can skip both the download and
+    the panel refresh.  A device that never acknowledges is always told
+    to redraw.
+    """
+
+    def __init__(self):
+        self._devices = {}
+        self._lock = threading.Lock()
+        self._acks = 0
+        self._skipped = 0
+        self._redraws = 0
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def ack(self, device: str, frame_hash: str) -> None:
+        """
+        Records the frame a device displays.
+
+        Args:
+            device (str): Device name.
+            frame_hash (str): Frame hash, quotes as in an ETag are dropped.
+
+        Example:
+            >>> displayed_frames.ack("kitchen", '"4a9681b6fe0ee4be"')
+            >>> displayed_frames.hash_get("kitchen")
+            '4a9681b6fe0ee4be'
+        """
+
+        frame_hash = frame_hash.strip().removeprefix("W/").strip('"')
+        if not frame_hash:
+            return
+
+        with self._lock:
+            self._devices[device] = Displayed(frame_hash, dt.datetime.now())
+            self._acks += 1
+
+        logger.debug(f"Frame displayed on {device}: {frame_hash}")
+
+    def hash_get(self, device: str) -> str:
+        """
+        Returns the hash of the frame a device displays.
+
+        Args:
+            device (str): Device name.
+
+        Returns:
+            str: Frame hash, or None if the device never acknowledged one.
+        """
+
+        displayed = self._devices.get(device)
+        return displayed.hash if displayed is not None else None
+
+    def redraw_needed(self, device: str, frame_hash: str) -> bool:
+        """
+        Returns True if a device does not display a frame.
+
+        Args:
+            device (str): Device name.
+            frame_hash (str): Current frame hash.
+
+        Returns:
+            bool: True if the device should download and draw the frame.
+        """
+
+        redraw = self.hash_get(device) != frame_hash
+        with self._lock:
+            if redraw:
+                self._redraws += 1
+            else:
+                self._skipped += 1
+
+        return redraw
+
+    def clear(self, device: str = None) -> None:
+        """
+        Forgets what a device displays, or all devices.
+
+        Args:
+            device (str, optional): Device name, None for all. Defaults to None.
+        """
+
+        with self._lock:
+            if device is None:
+                self._devices.clear()
+            else:
+                self._devices.pop(device, None)
+
+    def to_dict(self) -> dict:
+        """
+        Returns acknowledgement statistics.
+
+        Returns:
+            dict: Devices tracked, acknowledgements, redraws skipped and
+                redraws needed.
+        """
+
+        return {
+            "devices": len(self._devices),
+            "acks": self._acks,
+            "skipped": self._skipped,
+            "redraws": self._redraws,
+        }
+
+
+# Process wide displayed frame table.
+displayed_frames = DisplayedFrames()
@@ -0,0 +1,229 @@
+# frame_format.py
+# Device native encodings of rendered frames.
+#
+# Formats, all row major from the top left pixel:
+#   png      PNG, as rendered.
+#   1bpp     Packed 1 bit per pixel, MSB first, 1 = white.  Rows are
+#            padded to a whole byte.
+#   1bpp-rle The 1bpp bytes compressed with PackBits (TIFF/Apple):
+#            header byte n, 0..127 -> n + 1 literal bytes follow,
+#            129..255 -> repeat the next byte 257 - n times.
+#   gray4    Packed 4 bits per pixel grayscale, 0 = black, 15 = white,
+#            left pixel in the high nibble.  Kindle framebuffer depth.
+#
+# Raw formats carry the image size in the X-Width and X-Height headers.
+
+import io
+import logging
+from typing import NamedTuple
+
+import numpy as np
+from PIL import Image
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+
+# Format name to media type.
+FORMATS = {
+    "png": "image/png",
+    "1bpp": "application/x-e-display-1bpp",
+    "1bpp-rle": "application/x-e-display-1bpp-rle",
+    "gray4": "application/x-e-display-gray4",
+}
+
+# Default format, what existing devices expect.
+FORMAT_DEFAULT = "png"
+
+
+class FrameEncoding(NamedTuple):
+    """
+    Frame encoded in one format.
+    """
+
+    data: bytes
+    format: str
+    size: tuple
+
+    @property
+    def media_type(self) -> str:
+        """
+        HTTP media type of the encoding.
+        """
+
+        return FORMATS[self.format]
+
+
+def format_negotiate(format: str = None, accept: str = None) -> str:
+    """
+    Picks the frame format for a request.
+
+    The `format` query parameter wins over the Accept header.  Accept
+    media ranges are tried in order of quality, wildcards pick PNG, or
+    the first other format the header doesn't exclude with q=0.
+
+    Args:
+        format (str, optional): Format query parameter. Defaults to None.
+        accept (str, optional): Accept header. Defaults to None.
+
+    Returns:
+        str: Format name, or None if nothing requested is supported.
+
+    Example:
+        >>> format_negotiate(accept="application/x-e-display-1bpp-rle, image/png;q=0.5")
+        '1bpp-rle'
+        >>> format_negotiate(accept="*/*, image/png;q=0")
+        '1bpp'
+    """
+
+    if format:
+        format = format.lower()
+        return format if format in FORMATS else None
+
+    if not accept:
+        return FORMAT_DEFAULT
+
+    media_types = {media_type: name for name, media_type in FORMATS.items()}
+    ranges = []
+    excluded = set()
+    for i, item in enumerate(accept.split(",")):
+        parts = [part.strip() for part in item.split(";")]
+        media_range = parts[0].lower()
+        quality = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            ranges.append((-quality, i, media_range))
+        else:
+            excluded.add(media_range)
+
+    # Wildcard candidates, the default first.
+    candidates = [FORMAT_DEFAULT] + [name for name in FORMATS if name != FORMAT_DEFAULT]
+
+    for _, _, media_range in sorted(ranges):
+        if media_range in media_types:
+            return media_types[media_range]
+        if media_range in ("*/*", "image/*"):
+            prefix = media_range[:-1]
+            for name in candidates:
+                media_type = FORMATS[name]
+                if media_type in excluded:
+                    continue
+                if prefix == "*/" or media_type.startswith(prefix):
+                    return name
+
+    return None
+
+
+def packbits_encode(data: bytes) -> bytes:
+    """
+    Compresses bytes with PackBits.
+
+    Args:
+        data (bytes): Data.
+
+    Returns:
+        bytes: Compressed data.
+
+    Example:
+        >>> packbits_encode(b"\\xff" * 10 + b"\\x01\\x02").hex()
+        'f7ff010102'
+    """
+
+    out = bytearray()
+    n = len(data)
+    i = 0
+    while i < n:
+        # Run of a repeated byte.
+        j = i + 1
+        while j < n and j - i < 128 and data[j] == data[i]:
+            j += 1
+        if j - i >= 3:
+            out.append(257 - (j - i))
+            out.append(data[i])
+            i = j
+            continue
+
+        # Literal bytes, up to the next run of 3.
+        j = i
+        while j < n and j - i < 128:
+            if j + 2 < n and data[j] == data[j + 1] == data[j + 2]:
+                break
+            j += 1
+        out.append(j - i - 1)
+        out += data[i:j]
+        i = j
+
+    return bytes(out)
+
+
+def packbits_decode(data: bytes) -> bytes:
+    """
+    Decompresses PackBits data, the reverse of `packbits_encode`.
+
+    Args:
+        data (bytes): Compressed data.
+
+    Returns:
+        bytes: Data.
+    """
+
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        n = data[i]
+        i += 1
+        if n < 128:
+            out += data[i:i + n + 1]
+            i += n + 1
+        elif n > 128:
+            out += bytes([data[i]]) * (257 - n)
+            i += 1
+
+    return bytes(out)
+
+
+def frame_encode(png: bytes, format: str) -> FrameEncoding:
+    """
+    Encodes a rendered PNG frame in a device format.
+
+    Args:
+        png (bytes): PNG frame.
+        format (str): Format name, one of FORMATS.
+
+    Returns:
+        FrameEncoding: Encoded frame.
+
+    Example:
+        >>> encoding = frame_encode(frame.png, "1bpp")
+        >>> len(encoding.data) == (encoding.size[0] + 7) // 8 * encoding.size[1]
+        True
+    """
+
+    if format not in FORMATS:
+        raise ValueError(f"Unsupported frame format: {format}")
+
+    image = Image.open(io.BytesIO(png))
+    if format == "png":
+        return FrameEncoding(png, format, image.size)
+
+    if format in ("1bpp", "1bpp-rle"):
+        # Threshold, no dithering, so mode "1" frames pass through as is.
+        image = image.convert("L").convert("1", dither=Image.Dither.NONE)
+        data = image.tobytes("raw", "1")
+        if format == "1bpp-rle":
+            data = packbits_encode(data)
+
+    elif format == "gray4":
+        pixels = np.asarray(image.convert("L"), dtype=np.uint8) >> 4
+        if pixels.shape[1] % 2:
+            pixels = np.pad(pixels, ((0, 0), (0, 1)), constant_values=15)
+        data = ((pixels[:, 0::2] << 4) | pixels[:, 1::2]).tobytes()
+
+    logger.debug(f"Frame encoded: {format}, {image.size}, {len(png)} -> {len(data)} bytes")
+
+    return FrameEncoding(data, format, image.size)
@@ -0,0 +1,230 @@
+# glyph_cache.py
+# Cache of rasterized text masks for drawing with PIL.
+
+import logging
+import math
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw, ImageFont
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+
+
+class GlyphRunCache:
+    """
+    LRU cache of FreeType text masks, one per glyph run (line of text).
+
+    `ImageDraw.text` rasterizes every string through FreeType on every
+    call.  This cache keeps the mask produced for a (font, font mode,
+    text, sub-pixel start) and pastes it with the same ink, so repeated
+    strings are drawn pixel for pixel identically without rasterizing.
+
+    Masks are cached per run rather than per character: Pillow positions
+    glyphs within a run from the run's rounded bounding box, so pasting
+    individually rasterized characters is off by a pixel for some pairs.
+    """
+
+    def __init__(self, size_max: int = 2048):
+        self._runs = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+        self.size_max = size_max
+
+    @property
+    def size_max(self) -> int:
+        """
+        Maximum number of glyph runs held before eviction.
+
+        Returns:
+            int: Maximum number of entries.
+        """
+
+        return self._size_max
+
+    @size_max.setter
+    def size_max(self, value: int) -> None:
+        if not isinstance(value, int):
+            raise TypeError(f"Cache size must be an integer, got {type(value)}")
+        if value < 1:
+            raise ValueError(f"Cache size must be >= 1, got {value}")
+
+        self._size_max = value
+
+    @property
+    def hits(self) -> int:
+        """
+        Number of runs drawn from the cache.
+        """
+
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """
+        Number of runs that required rasterization.
+        """
+
+        return self._misses
+
+    def __len__(self) -> int:
+        return len(self._runs)
+
+    def run_get(
+        self,
+        text: str,
+        font: ImageFont.FreeTypeFont,
+        fontmode: str = "1",
+        start: tuple = (0.0, 0.0),
+    ) -> tuple:
+        """
+        Returns the rasterized mask for a single line of text.
+
+        Args:
+            text (str): Text without newlines.
+            font (ImageFont.FreeTypeFont): Font.
+            fontmode (str, optional): Font mode, `ImageDraw.fontmode`. Defaults to "1".
+            start (tuple, optional): Sub-pixel (x, y) start offset. Defaults to (0.0, 0.0).
+
+        Returns:
+            tuple: (mask, offset).  Mask is an "L" image, or None if empty.
+                Offset is the mask position relative to the text position.
+
+        Example:
+            >>> mask, offset = glyph_run_cache.run_get("9 AM", fonts["small"])
+            >>> offset
+            (0, 4)
+        """
+
+        key = (text, id(font), fontmode, start)
+        with self._lock:
+            run = self._runs.get(key)
+            if run is not None:
+                self._runs.move_to_end(key)
+                self._hits += 1
+                return run
+
+            self._misses += 1
+
+        mask, offset = font.getmask2(text, fontmode, start=start)
+        if mask.size[0] == 0 or mask.size[1] == 0:
+            run = (None, offset)
+        else:
+            run = (Image.Image()._new(mask), offset)
+
+        with self._lock:
+            self._runs[key] = run
+            self._runs.move_to_end(key)
+            while len(self._runs) > self._size_max:
+                self._runs.popitem(last=False)
+
+        return run
+
+    def text_draw(
+        self,
+        draw: ImageDraw.ImageDraw,
+        xy: tuple,
+        text: str,
+        font: ImageFont.FreeTypeFont,
+        fill: int = 0,
+    ) -> None:
+        """
+        Draws a single line of text.  Same output as `draw.text`.
+
+        Args:
+            draw (ImageDraw.ImageDraw): Drawing context.
+            xy (tuple): (x, y) position of the text's left ascender.
+            text (str): Text.  Newlines are passed on to `multiline_text_draw`.
+            font (ImageFont.FreeTypeFont): Font.
+            fill (int, optional): Ink color. Defaults to 0.
+
+        Example:
+            >>> glyph_run_cache.text_draw(draw, (10, 0), "Today", fonts["large"], Color.BLACK)
+        """
+
+        if "\n" in text:
+            self.multiline_text_draw(draw, xy, text, font, fill)
+            return
+
+        if len(text) == 0:
+            return
+
+        start = (math.modf(xy[0])[0], math.modf(xy[1])[0])
+        mask, offset = self.run_get(text, font, fontmode=draw.fontmode, start=start)
+        if mask is None:
+            return
+
+        coord = (int(xy[0]) + offset[0], int(xy[1]) + offset[1])
+        draw._image.paste(fill, coord + (coord[0] + mask.width, coord[1] + mask.height), mask)
+
+    def multiline_text_draw(
+        self,
+        draw: ImageDraw.ImageDraw,
+        xy: tuple,
+        text: str,
+        font: ImageFont.FreeTypeFont,
+        fill: int = 0,
+        spacing: float = 4,
+    ) -> None:
+        """
+        Draws left aligned multiline text.  Same output as `draw.multiline_text`.
+
+        Args:
+            draw (ImageDraw.ImageDraw): Drawing context.
+            xy (tuple): (x, y) position of the first line's left ascender.
+            text (str): Text, lines separated by newlines.
+            font (ImageFont.FreeTypeFont): Font.
+            fill (int, optional): Ink color. Defaults to 0.
+            spacing (float, optional): Spacing between lines. Defaults to 4.
+
+        Example:
+            >>> glyph_run_cache.multiline_text_draw(draw, (5, 5), "Team\\nsync", fonts["small"])
+        """
+
+        # Same line pitch as ImageDraw._prepare_multiline_text.
+        line_spacing = font.getbbox("A", draw.fontmode)[3] + spacing
+
+        x, y = xy
+        for line in text.split("\n"):
+            self.text_draw(draw, (x, y), line, font, fill)
+            y += line_spacing
+
+    def clear(self) -> None:
+        """
+        Drops all cached runs and resets hit/miss counters.
+        """
+
+        with self._lock:
+            self._runs.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def to_dict(self) -> dict:
+        """
+        Returns cache statistics.
+
+        Returns:
+            dict: Entry count, maximum size, hits, misses and hit rate.
+
+        Example:
+            >>> glyph_run_cache.to_dict()["size_max"]
+            2048
+        """
+
+        lookups = self._hits + self._misses
+        return {
+            "size": len(self._runs),
+            "size_max": self._size_max,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+        }
+
+
+# Process wide glyph run cache shared by all renderers.
+glyph_run_cache = GlyphRunCache()
+
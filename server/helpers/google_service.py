@@ -0,0 +1,329 @@
+# google_service.py
+# Process wide Google credentials and Calendar API client.
+
+import datetime as dt
+import json
+import logging
+import multiprocessing
+import os
+import threading
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+
+# If modifying these scopes, delete the token file.
+SCOPES = ["https://www.googleapis.com/auth/calendar.readonly"]
+TOKEN_FILE = "google-token.json"
+CREDENTIALS_FILE = "google-credentials.json"
+
+# Refresh the access token this long before it expires.
+REFRESH_MARGIN = dt.timedelta(minutes=5)
+
+# Checks for a refresh when the expiry is unknown, and the shortest wait
+# between tries, e.g. after a failed refresh.
+REFRESH_POLL = dt.timedelta(minutes=10)
+REFRESH_POLL_MIN = dt.timedelta(seconds=30)
+
+
+class GoogleService:
+    """
+    Google credentials and Calendar API client, set up once per process.
+
+    Loading the token file, refreshing it and building the API client
+    used to happen for every calendar instance, once per render.  Here
+    the credentials are loaded and the client built, from the discovery
+    document shipped with the client library, on first use.  In the
+    server process a background thread refreshes the access token
+    REFRESH_MARGIN before it expires, so renders don't wait on a refresh.
+
+    Render worker processes have their own instance, without the thread.
+    They pick up the tokens the server writes to the token file, which
+    is replaced atomically and only when the token actually changed.
+    Logging in needs the user, so only the server process does it.
+    """
+
+    def __init__(self, token_file: str = TOKEN_FILE, credentials_file: str = CREDENTIALS_FILE):
+        self._token_file = token_file
+        self._credentials_file = credentials_file
+        self._creds = None
+        self._service = None
+        self._token_json = None
+        self._mtime = None
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._refreshes = 0
+        self._failures = 0
+        self._writes = 0
+
+    def credentials_get(self) -> Credentials:
+        """
+        Returns the credentials, loading them on first use.  Without a
+        valid token the user is asked to log in.  Tokens another process
+        saved since are picked up.
+
+        Raises:
+            RuntimeError: No valid token in a worker process.
+
+        Returns:
+            Credentials: Credentials.
+        """
+
+        with self._lock:
+            if self._creds is None:
+                self._load()
+                if self._main_process():
+                    self._start()
+            else:
+                self._reload()
+
+            return self._creds
+
+    def service_get(self):
+        """
+        Returns the Calendar API client, building it on first use.
+
+        Returns:
+            Resource: Calendar v3 API client.
+
+        Example:
+            >>> service = google_service.service_get()
+            >>> service is google_service.service_get()
+            True
+        """
+
+        with self._lock:
+            if self._service is None:
+                self._service = build(
+                    "calendar",
+                    "v3",
+                    credentials=self.credentials_get(),
+                    static_discovery=True,
+                    cache_discovery=False,
+                )
+                logger.debug("Google Calendar client built")
+
+            return self._service
+
+    def _load(self) -> None:
+        """
+        Loads the credentials from the token file, refreshing them if
+        expired, or runs the login flow.
+        """
+
+        # The token file stores the user's access and refresh tokens, and is
+        # created automatically when the authorization flow completes for the first
+        # time.
+        if os.path.exists(self._token_file):
+            self._mtime = os.stat(self._token_file).st_mtime_ns
+            with open(self._token_file) as f:
+                self._token_json = f.read()
+            self._creds = Credentials.from_authorized_user_info(
+                json.loads(self._token_json), SCOPES
+            )
+
+            # Handle credential expiry
+            try:
+                if self._creds and self._creds.expired and self._creds.refresh_token:
+                    self._creds.refresh(Request())
+                    self._refreshes += 1
+                    self._token_save()
+            except Exception as e:
+                logger.warning(f"Error refreshing credentials: {e}")
+                if not self._main_process():
+                    raise RuntimeError(f"Google token refresh failed: {e}") from e
+                os.remove(self._token_file)
+                self._token_json = None
+
+        # If there are no (valid) credentials available, let the user log in.
+        if not self._creds or not self._creds.valid:
+            if not self._main_process():
+                raise RuntimeError(
+                    f"No valid Google token in {self._token_file}, log in from the server"
+                )
+            flow = InstalledAppFlow.from_client_secrets_file(self._credentials_file, SCOPES)
+            self._creds = flow.run_local_server(port=0)
+            self._token_save()
+
+    def _reload(self) -> bool:
+        """
+        Adopts the token in the token file if another process saved a
+        newer one since it was last read or written.
+
+        Returns:
+            bool: True if the credentials were replaced.
+        """
+
+        try:
+            mtime = os.stat(self._token_file).st_mtime_ns
+        except OSError:
+            return False
+
+        if mtime == self._mtime:
+            return False
+
+        try:
+            with open(self._token_file) as f:
+                data = f.read()
+            creds = Credentials.from_authorized_user_info(json.loads(data), SCOPES)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load Google token {self._token_file}: {e}")
+            return False
+
+        self._mtime = mtime
+        if data == self._token_json:
+            return False
+
+        # Keep our own token if it's the fresher one.
+        current = self._creds.expiry if self._creds else None
+        if current is not None and (creds.expiry is None or creds.expiry < current):
+            return False
+
+        self._creds = creds
+        self._token_json = data
+        self._service = None
+        logger.debug(f"Loaded Google token from: {self._token_file}")
+
+        return True
+
+    def _token_save(self) -> None:
+        """
+        Saves the credentials to the token file, if they changed,
+        replacing it atomically.
+        """
+
+        data = self._creds.to_json()
+        if data == self._token_json:
+            return
+
+        temp = f"{self._token_file}.{os.getpid()}.tmp"
+        with open(temp, "w") as token:
+            token.write(data)
+        os.replace(temp, self._token_file)
+
+        self._mtime = os.stat(self._token_file).st_mtime_ns
+        self._token_json = data
+        self._writes += 1
+        logger.debug(f"Saved Google token to: {self._token_file}")
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Refreshes the access token if it expires within REFRESH_MARGIN.
+        A token another process saved since is picked up first.
+
+        Args:
+            force (bool, optional): Refresh regardless of expiry.
+                Defaults to False.
+
+        Returns:
+            bool: True if the token was refreshed.
+        """
+
+        with self._lock:
+            if self._creds is None or not self._creds.refresh_token:
+                return False
+
+            # API calls may have refreshed an expired token themselves.
+            if not self._reload():
+                self._token_save()
+
+            if not force and self._wait_get() > dt.timedelta(0):
+                return False
+
+            self._creds.refresh(Request())
+            self._refreshes += 1
+            self._token_save()
+
+        logger.debug(f"Google token refreshed, expires: {self._creds.expiry}")
+
+        return True
+
+    def _wait_get(self) -> dt.timedelta:
+        """
+        Returns the time until the token is due a refresh.
+        """
+
+        expiry = self._creds.expiry
+        if expiry is None:
+            return REFRESH_POLL
+
+        # Expiry is naive UTC.
+        now = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+
+        return expiry - REFRESH_MARGIN - now
+
+    @staticmethod
+    def _main_process() -> bool:
+        """
+        Returns True in the server process, False in worker processes.
+        """
+
+        return multiprocessing.parent_process() is None
+
+    def _start(self) -> None:
+        """
+        Starts the background refresh thread.
+        """
+
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="google-token-refresh", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        """
+        Refresh thread, refreshes the token ahead of its expiry.
+        """
+
+        while True:
+            with self._lock:
+                wait = min(max(self._wait_get(), REFRESH_POLL_MIN), REFRESH_POLL)
+            if self._stop.wait(wait.total_seconds()):
+                return
+
+            try:
+                self.refresh()
+            except Exception as e:
+                self._failures += 1
+                logger.error(f"Google token refresh failed: {e}")
+
+    def shutdown(self) -> None:
+        """
+        Stops the refresh thread.
+        """
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def to_dict(self) -> dict:
+        """
+        Returns credential statistics.
+
+        Returns:
+            dict: Loaded, token expiry, refreshes, failed refreshes and
+                token file writes.
+        """
+
+        return {
+            "loaded": self._creds is not None,
+            "expiry": self._creds.expiry if self._creds else None,
+            "refreshes": self._refreshes,
+            "failures": self._failures,
+            "writes": self._writes,
+        }
+
+
+# Process wide Google credentials and client.
+google_service = GoogleService()
@@ -0,0 +1,104 @@
+# http_range.py
+# HTTP Range request parsing (RFC 9110 section 14), for resumable downloads.
+
+import logging
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+
+
+class RangeNotSatisfiable(ValueError):
+    """
+    Range is malformed or lies outside the resource, answered with a 416.
+    """
+
+
+def range_parse(header: str, size: int, if_range: str = None, etag: str = None) -> tuple:
+    """
+    Parses a Range header for a resource of a given size.
+
+    Only single byte ranges are served.  Multiple ranges and other units
+    are ignored, as the RFC allows, and the whole resource is sent.  So is
+    the whole resource when If-Range is sent and doesn't name the current
+    entity tag: the client's partial copy is of another frame.
+
+    Args:
+        header (str): Range header value, may be None.
+        size (int): Resource size in bytes.
+        if_range (str, optional): If-Range header value. Defaults to None.
+        etag (str, optional): Strong entity tag of the resource. Defaults
+            to None.
+
+    Raises:
+        RangeNotSatisfiable: The byte range is malformed, or starts past
+            the end of the resource.
+
+    Returns:
+        tuple: (start, end) byte offsets, end inclusive, or None to send
+            the whole resource.
+
+    Example:
+        >>> range_parse("bytes=1000-", 4096)
+        (1000, 4095)
+        >>> range_parse("bytes=-96", 4096)
+        (4000, 4095)
+        >>> range_parse("bytes=0-99", 4096, if_range='"5d41402a"', etag='"7fc56270"') is None
+        True
+    """
+
+    if not header:
+        return None
+
+    if if_range and if_range.strip() != etag:
+        logger.debug(f"If-Range {if_range} doesn't match {etag}, sending all")
+        return None
+
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    first, sep, last = spec.strip().partition("-")
+    first = first.strip()
+    last = last.strip()
+    digits = first + last
+    if not sep or not digits or not (digits.isascii() and digits.isdigit()):
+        raise RangeNotSatisfiable(f"Malformed range: {header}")
+
+    if first:
+        start = int(first)
+        end = int(last) if last else size - 1
+        if end < start:
+            raise RangeNotSatisfiable(f"Malformed range: {header}")
+    else:
+        # Suffix range, the last n bytes.
+        suffix = int(last)
+        if suffix == 0:
+            raise RangeNotSatisfiable(f"Empty suffix range: {header}")
+        start = max(size - suffix, 0)
+        end = size - 1
+
+    if start >= size:
+        raise RangeNotSatisfiable(f"Range {header} outside {size} bytes")
+
+    return start, min(end, size - 1)
+
+
+def content_range(start: int, end: int, size: int) -> str:
+    """
+    Returns the Content-Range header value for a served range.
+
+    Args:
+        start (int): First byte offset.
+        end (int): Last byte offset, inclusive.
+        size (int): Resource size in bytes.
+
+    Returns:
+        str: Header value.
+
+    Example:
+        >>> content_range(1000, 4095, 4096)
+        'bytes 1000-4095/4096'
+    """
+
+    return f"bytes {start}-{end}/{size}"
@@ -0,0 +1,335 @@
+# icon_atlas.py
+# Pre-rasterized icon sprite sheet.
+#
+# Build the atlas from the server directory after adding or changing icons:
+#   python helpers/icon_atlas.py
+#
+# The sheet is raw RGBA so it can be memory mapped at startup without
+# libvips.  Icons not in the atlas fall back to IconCache rasterization.
+
+import bisect
+import json
+import logging
+import mmap
+import os
+import sys
+from pathlib import Path
+from typing import Union
+
+from PIL import Image
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+
+# Default icon directory, relative to the server directory.
+ICON_PATH = Path("icons")
+
+# Weather icon sizes built into the atlas, in pixels.
+# Weather.Render fits icons to roughly 80% of an hour row, which on the
+# 800 pixel tall portrait display lands in this range.
+WEATHER_ICON_SIZES = range(48, 81, 2)
+
+# Sheet width in pixels.  Sprites are packed into rows of this width.
+SHEET_WIDTH = 1024
+
+
+class IconAtlas:
+    """
+    Memory mapped sprite sheet of pre-rasterized icons.
+
+    The index file maps (icon, scale) to a rectangle in the sheet and also
+    carries the NWS weather icon map, so neither libvips nor the weather
+    JSON is needed at render time.
+    """
+
+    def __init__(self, filename: Union[str, Path] = ICON_PATH / "icon-atlas.json"):
+        filename = Path(filename).with_suffix(".json")
+        if not filename.exists():
+            raise FileNotFoundError(f"Icon atlas index not found: {filename}")
+
+        with open(filename) as fp:
+            index = json.load(fp)
+
+        self._filename = filename
+        self._dpi = index["dpi"]
+        self._native = {name: tuple(sz) for name, sz in index["native"].items()}
+        self._weather_map = index["weather"]
+
+        # Sprites per icon as (scales, rects), sorted by scale for fit lookups.
+        sprites = {}
+        for sprite in index["sprites"]:
+            entries = sprites.setdefault(sprite["icon"], [])
+            entries.append((sprite["scale"], tuple(sprite["rect"])))
+        self._sprites = {}
+        for name, entries in sprites.items():
+            entries.sort()
+            self._sprites[name] = ([e[0] for e in entries], [e[1] for e in entries])
+
+        # Map the sheet, PIL reads pixels straight from the mapping.
+        filename_sheet = filename.with_suffix(".rgba")
+        with open(filename_sheet, "rb") as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._sheet = Image.frombuffer(
+            "RGBA", tuple(index["size"]), self._mmap, "raw", "RGBA", 0, 1
+        )
+
+        self._crops = {}
+
+    @classmethod
+    def from_file(
+        cls, filename: Union[str, Path] = ICON_PATH / "icon-atlas.json"
+    ) -> "IconAtlas":
+        """
+        Loads an atlas if one has been built.
+
+        Args:
+            filename (Union[str, Path], optional): Atlas index file.
+                Defaults to icons/icon-atlas.json.
+
+        Returns:
+            IconAtlas: Loaded atlas, or None if no atlas has been built.
+
+        Example:
+            >>> atlas = IconAtlas.from_file()
+            >>> atlas is None or atlas.dpi > 0
+            True
+        """
+
+        try:
+            return cls(filename)
+        except (FileNotFoundError, KeyError, ValueError) as e:
+            logger.info(f"Icon atlas not loaded: {e}")
+            return None
+
+    @property
+    def dpi(self) -> int:
+        """
+        DPI the atlas was rasterized at.
+
+        Returns:
+            int: DPI.
+        """
+
+        return self._dpi
+
+    @property
+    def weather_map(self) -> dict:
+        """
+        NWS forecast short name to day/night icon file map.
+
+        Returns:
+            dict: Contents of weather-icon-map.json.
+        """
+
+        return self._weather_map
+
+    def icon_get(
+        self, filename: Union[str, Path], dpi: int, scale: float
+    ) -> Image.Image:
+        """
+        Returns the sprite for an icon at an exact scale.
+
+        Args:
+            filename (Union[str, Path]): SVG file name.  Only the name is used.
+            dpi (int): Rasterization DPI.
+            scale (float): Scale factor.
+
+        Returns:
+            PIL.Image.Image: RGBA sprite, or None if not in the atlas.
+
+        Example:
+            >>> atlas.icon_get("icons/ic_battery_50_48px.svg", 110, 0.4).mode
+            'RGBA'
+        """
+
+        if dpi != self._dpi:
+            return None
+
+        name = Path(filename).name
+        if name not in self._sprites:
+            return None
+
+        scales, rects = self._sprites[name]
+        idx = bisect.bisect_left(scales, scale - 1e-6)
+        if idx < len(scales) and abs(scales[idx] - scale) < 1e-6:
+            return self._crop(rects[idx])
+
+        return None
+
+    def icon_fit_get(
+        self,
+        filename: Union[str, Path],
+        dpi: int,
+        box: tuple,
+        fill: float = 1.0,
+    ) -> Image.Image:
+        """
+        Returns the largest sprite for an icon that fits within a box.
+
+        Sizes are quantized to the sizes built into the atlas.  Boxes
+        needing an icon more than a size step above the largest sprite
+        get None, the caller rasterizes those.
+
+        Args:
+            filename (Union[str, Path]): SVG file name.  Only the name is used.
+            dpi (int): Rasterization DPI.
+            box (tuple): Box (width, height) in pixels.
+            fill (float, optional): Fraction of the box to fill. Defaults to 1.0.
+
+        Returns:
+            PIL.Image.Image: RGBA sprite, or None if nothing fits.
+
+        Example:
+            >>> atlas.icon_fit_get("icons/wi-day-sunny.svg", 110, (90, 90), 0.8).width <= 72
+            True
+        """
+
+        if dpi != self._dpi:
+            return None
+
+        name = Path(filename).name
+        if name not in self._native or name not in self._sprites:
+            return None
+
+        native = self._native[name]
+        scale = min(box[0] / native[0], box[1] / native[1]) * fill
+
+        scales, rects = self._sprites[name]
+        idx = bisect.bisect_right(scales, scale + 1e-6)
+        if idx == 0:
+            return None
+
+        # Above the built sizes, the largest sprite is too small.
+        if idx == len(scales):
+            excess = (scale - scales[-1]) * max(native)
+            if excess > WEATHER_ICON_SIZES.step:
+                return None
+
+        return self._crop(rects[idx - 1])
+
+    def _crop(self, rect: tuple) -> Image.Image:
+        """
+        Crops and memoizes a sprite from the sheet.
+        """
+
+        sprite = self._crops.get(rect)
+        if sprite is None:
+            x, y, w, h = rect
+            sprite = self._sheet.crop((x, y, x + w, y + h))
+            self._crops[rect] = sprite
+
+        return sprite
+
+    @classmethod
+    def build(
+        cls,
+        filename: Union[str, Path] = ICON_PATH / "icon-atlas.json",
+        dpi: int = 110,
+        battery_scale: float = 0.4,
+        weather_sizes: range = WEATHER_ICON_SIZES,
+    ) -> Path:
+        """
+        Rasterizes the battery and weather icons into a sprite sheet.
+
+        Requires libvips.  Writes the index (.json) and the raw RGBA
+        sheet (.rgba) side by side.
+
+        Args:
+            filename (Union[str, Path], optional): Atlas index file.
+                Defaults to icons/icon-atlas.json.
+            dpi (int, optional): Rasterization DPI. Defaults to 110.
+            battery_scale (float, optional): Battery icon scale. Defaults to 0.4.
+            weather_sizes (range, optional): Weather icon sizes in pixels.
+                Defaults to WEATHER_ICON_SIZES.
+
+        Returns:
+            pathlib.Path: Atlas index file name.
+
+        Example:
+            >>> IconAtlas.build(dpi=110)
+            PosixPath('icons/icon-atlas.json')
+        """
+
+        from icon_cache import IconCache
+
+        filename = Path(filename).with_suffix(".json")
+        icon_dir = filename.parent
+        cache = IconCache(size_max=4096)
+
+        with open(icon_dir / "weather-icon-map.json") as fp:
+            weather_map = json.load(fp)
+
+        # Rasterize every (icon, scale) the renderers use.
+        sprites = []
+        native = {}
+        for path in sorted(icon_dir.glob("ic_battery_*.svg")):
+            image = cache.icon_get(path, dpi=dpi, scale=battery_scale)
+            sprites.append((path.name, battery_scale, image))
+
+        weather_files = {
+            icon
+            for forecast in weather_map.values()
+            for key, icon in forecast.items()
+            if key in ("day", "night")
+        }
+        for name in sorted(weather_files):
+            path = icon_dir / name
+            image = cache.icon_get(path, dpi=dpi, scale=1.0)
+            native[name] = image.size
+
+            for size in weather_sizes:
+                scale = size / max(image.size)
+                sprite = cache.icon_get(path, dpi=dpi, scale=scale)
+                sprites.append((name, scale, sprite))
+
+        # Shelf pack, tallest first.
+        sprites.sort(key=lambda s: s[2].height, reverse=True)
+        x = y = shelf = 0
+        placed = []
+        for name, scale, image in sprites:
+            if x + image.width > SHEET_WIDTH:
+                x = 0
+                y += shelf
+                shelf = 0
+            placed.append((name, scale, image, (x, y, image.width, image.height)))
+            x += image.width
+            shelf = max(shelf, image.height)
+        height = y + shelf
+
+        sheet = Image.new("RGBA", (SHEET_WIDTH, height), (0, 0, 0, 0))
+        index = {
+            "dpi": dpi,
+            "size": [SHEET_WIDTH, height],
+            "native": native,
+            "weather": weather_map,
+            "sprites": [],
+        }
+        for name, scale, image, rect in placed:
+            sheet.paste(image, rect[:2])
+            index["sprites"].append({"icon": name, "scale": scale, "rect": rect})
+
+        with open(filename.with_suffix(".rgba"), "wb") as fp:
+            fp.write(sheet.tobytes("raw", "RGBA"))
+        with open(filename, "w") as fp:
+            json.dump(index, fp, indent=1)
+
+        logger.info(
+            f"Icon atlas: {len(placed)} sprites, {SHEET_WIDTH}x{height} -> {filename}"
+        )
+
+        return filename
+
+
+if __name__ == "__main__":
+    # Server directory on the search path for device constants.
+    parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if parent_dir not in sys.path:
+        sys.path.insert(0, parent_dir)
+
+    from trmnl_7_5in import ResolutionPortrait
+    from renderer import BATTERY_ICON_SCALE
+
+    logging.basicConfig()
+    fn = IconAtlas.build(dpi=ResolutionPortrait.PPI, battery_scale=BATTERY_ICON_SCALE)
+    print(f"Icon atlas written: {fn}")
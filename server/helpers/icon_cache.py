@@ -0,0 +1,261 @@
+# icon_cache.py
+# Process wide, in-memory cache of rasterized SVG icons.
+
+# NOTE: Rasterization requires install of libvips
+#       sudo apt install libvips
+#       Icons found in a pre-built IconAtlas do not.
+
+import io
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Union
+
+from PIL import Image
+
+from icon_atlas import IconAtlas
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+
+
+class IconCache:
+    """
+    LRU cache of SVG icons rasterized to RGBA PIL images.
+
+    Icons are first looked up in the pre-built IconAtlas, if any.  Others
+    are rasterized with pyvips straight into memory, so rendering never
+    writes to or reads from the icons directory.  Returned images are
+    shared between callers and must be treated as read-only, which is the
+    case for `Image.paste` sources and masks.
+    """
+
+    def __init__(self, size_max: int = 128, atlas: IconAtlas = None):
+        self._icons = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+        self.size_max = size_max
+        self.atlas = atlas
+
+    @property
+    def size_max(self) -> int:
+        """
+        Maximum number of rasterized icons held before eviction.
+
+        Returns:
+            int: Maximum number of entries.
+        """
+
+        return self._size_max
+
+    @size_max.setter
+    def size_max(self, value: int) -> None:
+        if not isinstance(value, int):
+            raise TypeError(f"Cache size must be an integer, got {type(value)}")
+        if value < 1:
+            raise ValueError(f"Cache size must be >= 1, got {value}")
+
+        self._size_max = value
+
+    @property
+    def atlas(self) -> IconAtlas:
+        """
+        Pre-built sprite atlas consulted before rasterizing.
+
+        Returns:
+            IconAtlas: Atlas, or None.
+        """
+
+        return self._atlas
+
+    @atlas.setter
+    def atlas(self, atlas: IconAtlas) -> None:
+        if atlas is not None and not isinstance(atlas, IconAtlas):
+            raise TypeError(f"Atlas must be an IconAtlas, got {type(atlas)}")
+
+        self._atlas = atlas
+
+    @property
+    def hits(self) -> int:
+        """
+        Number of lookups served from the cache.
+
+        Returns:
+            int: Hit count.
+        """
+
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """
+        Number of lookups that required rasterization.
+
+        Returns:
+            int: Miss count.
+        """
+
+        return self._misses
+
+    def __len__(self) -> int:
+        return len(self._icons)
+
+    def icon_get(
+        self,
+        filename: Union[str, Path],
+        dpi: int = 72,
+        scale: float = 1.0,
+    ) -> Image.Image:
+        """
+        Returns an SVG icon rasterized at the given DPI and scale.
+
+        Args:
+            filename (Union[str, Path]): SVG file name.
+            dpi (int, optional): Rasterization DPI. Defaults to 72.
+            scale (float, optional): Scale factor applied on top of DPI. Defaults to 1.0.
+
+        Returns:
+            PIL.Image.Image: RGBA icon image.
+
+        Example:
+            >>> icon = icon_cache.icon_get("icons/wi-day-sunny.svg", dpi=110, scale=0.4)
+            >>> icon.mode
+            'RGBA'
+        """
+
+        filename = Path(filename)
+        key = (str(filename), int(dpi), float(scale))
+
+        if self._atlas is not None:
+            icon = self._atlas.icon_get(filename, dpi=dpi, scale=scale)
+            if icon is not None:
+                self._hits += 1
+                return icon
+
+        with self._lock:
+            icon = self._icons.get(key)
+            if icon is not None:
+                self._icons.move_to_end(key)
+                self._hits += 1
+                return icon
+
+            self._misses += 1
+
+        # Rasterize outside of the lock, concurrent misses on the same key
+        # just produce identical images.
+        icon = self._rasterize(filename, dpi=dpi, scale=scale)
+
+        with self._lock:
+            self._icons[key] = icon
+            self._icons.move_to_end(key)
+            while len(self._icons) > self._size_max:
+                self._icons.popitem(last=False)
+
+        return icon
+
+    def icon_fit_get(
+        self,
+        filename: Union[str, Path],
+        dpi: int = 72,
+        box: tuple = (100, 100),
+        fill: float = 1.0,
+    ) -> Image.Image:
+        """
+        Returns an SVG icon scaled to fit within a box.
+
+        The icon is scaled so that its larger relative dimension fills
+        `fill` of the box, preserving aspect ratio.
+
+        Args:
+            filename (Union[str, Path]): SVG file name.
+            dpi (int, optional): Rasterization DPI. Defaults to 72.
+            box (tuple, optional): Box (width, height) in pixels. Defaults to (100, 100).
+            fill (float, optional): Fraction of the box to fill. Defaults to 1.0.
+
+        Returns:
+            PIL.Image.Image: RGBA icon image.
+
+        Example:
+            >>> icon = icon_cache.icon_fit_get("icons/wi-day-sunny.svg", 110, (90, 80), 0.8)
+            >>> icon.width <= 90 * 0.8
+            True
+        """
+
+        if self._atlas is not None:
+            icon = self._atlas.icon_fit_get(filename, dpi=dpi, box=box, fill=fill)
+            if icon is not None:
+                self._hits += 1
+                return icon
+
+        # Native size at this DPI is itself a cached entry.
+        native = self.icon_get(filename, dpi=dpi, scale=1.0)
+
+        scale_x = box[0] / native.width
+        scale_y = box[1] / native.height
+        scale = min(scale_x, scale_y) * fill
+        logger.debug(
+            f"Icon box: {box}, Native size: {native.size}, Scale: {scale}"
+        )
+
+        return self.icon_get(filename, dpi=dpi, scale=scale)
+
+    def clear(self) -> None:
+        """
+        Drops all cached icons and resets hit/miss counters.
+
+        Example:
+            >>> icon_cache.clear()
+            >>> len(icon_cache)
+            0
+        """
+
+        with self._lock:
+            self._icons.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def to_dict(self) -> dict:
+        """
+        Returns cache statistics.
+
+        Returns:
+            dict: Entry count, maximum size, hits, misses and hit rate.
+
+        Example:
+            >>> icon_cache.to_dict()["size_max"]
+            128
+        """
+
+        lookups = self._hits + self._misses
+        return {
+            "size": len(self._icons),
+            "size_max": self._size_max,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+        }
+
+    @staticmethod
+    def _rasterize(filename: Path, dpi: int, scale: float) -> Image.Image:
+        """
+        Rasterizes an SVG file into an RGBA PIL image in memory.
+        """
+
+        # Imported on first use, so atlas-only processes never load libvips.
+        import pyvips
+
+        icon = pyvips.Image.new_from_file(str(filename), dpi=dpi, scale=scale)
+        data = icon.write_to_buffer(".png")
+
+        image = Image.open(io.BytesIO(data))
+        image.load()
+
+        return image.convert("RGBA")
+
+
+# Process wide icon cache shared by all renderers.
+icon_cache = IconCache(atlas=IconAtlas.from_file())
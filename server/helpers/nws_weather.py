@@ -1,9 +1,7 @@
 # Description: Get weather forecast from National Weather Service.
 
-# NOTE: Image processing required install of libvips
-#       sudo apt install libvips
-
 import datetime as dt
+import functools
 import json
 import os
 
@@ -11,8 +9,11 @@ import dateutil.parser
 from dateutil import tz
 
 import requests
-from PIL import Image, ImageDraw
-import pyvips
+from PIL import ImageDraw
+
+from icon_cache import icon_cache
+from text_layout import text_layout_cache
+from glyph_cache import glyph_run_cache
 
 import logging
 
@@ -55,6 +56,31 @@ def ForecastUrl(lat: float, lon: float) -> str:
     return res.json()["properties"]["forecastHourly"]
 
 
+@functools.cache
+def icon_map_get(icon_path: str = "./icons/") -> dict:
+    """
+    Returns the NWS icon name to icon file map.
+    Read from the icon atlas index if built, otherwise from
+    weather-icon-map.json.  Loaded once per process.
+
+    Args:
+        icon_path (str, optional): Icon directory. Defaults to "./icons/".
+
+    Returns:
+        dict: Forecast short name to {"day": file, "night": file}.
+
+    Example:
+        >>> icon_map_get()["skc"]["day"]
+        'wi-day-sunny.svg'
+    """
+
+    if icon_cache.atlas is not None:
+        return icon_cache.atlas.weather_map
+
+    with open(os.path.join(icon_path, "weather-icon-map.json")) as fp:
+        return json.load(fp)
+
+
 class Weather:
     def __init__(self, lat: float = None, lon: float = None):
         self._file_config = __file__.replace(".py", ".json")
@@ -134,6 +160,22 @@ class Weather:
 
         return self._forecast
 
+    def forecast_hours(self, start: dt.datetime, hours: int = 1) -> list:
+        """
+        Returns the forecast records for consecutive hours.
+
+        Args:
+            start (datetime.datetime): First hour, timezone aware.
+            hours (int, optional): Number of hours. Defaults to 1.
+
+        Returns:
+            list: Forecast record per hour, None for hours not in the forecast.
+        """
+
+        forecast = self.forecast
+
+        return [forecast.get(start + dt.timedelta(hours=i)) for i in range(hours)]
+
     @property
     def temperature_current(self) -> int:
         """
@@ -163,8 +205,7 @@ class Weather:
 
         # Mapping from NWS icon names to icon files
         ICON_PATH = "./icons/"
-        with open(ICON_PATH + "weather-icon-map.json") as fp:
-            icons = json.load(fp)
+        icons = icon_map_get(ICON_PATH)
 
         if draw is None:
             return ValueError("Image.Draw context must be provided.")
@@ -183,10 +224,12 @@ class Weather:
         # Add temperature string to bottom of image
         fontsz = "small"
         datastr = f"{self._forecast[hour]['temperature']}°F"
-        datasz = fonts[fontsz].getbbox(datastr)
+        datasz = text_layout_cache.bbox_get(datastr, fonts[fontsz])
         x = x_base + round((width - datasz[2]) / 2) - 5
         y = y_base + height - datasz[3] - 1.5 * y_pad
-        draw.text((x, y), datastr, font=fonts[fontsz], fill=Color.BLACK)
+        glyph_run_cache.text_draw(
+            draw, (x, y), datastr, font=fonts[fontsz], fill=Color.BLACK
+        )
 
         # Icon size
         height_remaining = height - datasz[1] - y_pad
@@ -207,31 +250,13 @@ class Weather:
 
         # Load icon and scale to fit
         icon_path_svg = os.path.join(ICON_PATH, icon_file)
-        icon_path_png = icon_path_svg.replace(".svg", ".png")
-        icon = pyvips.Image.new_from_file(
-            icon_path_svg,
-            dpi=ResolutionPortrait.PPI,
-            scale=1
-        )
-
-        # Determine scale factor
-        icon_size = (icon.width, icon.height)
-        scale_x = icon_space[0] / icon_size[0]
-        scale_y = icon_space[1] / icon_size[1]
-        scale = min(scale_x, scale_y) * 0.8
-        logger.debug(
-            f"Icon space min dim: {icon_space}, Current size: {icon_size}, Scale: {scale}"
-        )
-        # Reload with updated scale
-        icon = pyvips.Image.new_from_file(
+        icon_png = icon_cache.icon_fit_get(
             icon_path_svg,
             dpi=ResolutionPortrait.PPI,
-            scale=scale
+            box=icon_space,
+            fill=0.8,
         )
-        icon.write_to_file(icon_path_png)
-        icon_png = Image.open(icon_path_png)
-        logger.debug(f"   scaled size: ({icon.width},{icon.height})")
-        logger.debug(f"   png    size: ({icon_png.width},{icon_png.height})")
+        logger.debug(f"   icon   size: ({icon_png.width},{icon_png.height})")
 
         x = x_base + round((width - icon_png.width) / 2)
         y = y_base + 2 * y_pad  # round((height - icon_png.height)/2)
@@ -0,0 +1,389 @@
+# render_pool.py
+# Process pool for rendering device images off the event loop.
+
+import asyncio
+import concurrent.futures
+import importlib
+import io
+import logging
+import multiprocessing
+import os
+from typing import Iterable
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.DEBUG)
+
+# Number of render worker processes.
+RENDER_WORKERS = min(4, os.cpu_count() or 1)
+
+# Seconds to wait for a render before giving up on it.
+RENDER_TIMEOUT = 120.0
+
+# Modules every worker imports at startup, device fonts are loaded on import.
+PRELOAD_MODULES = ["trmnl_7_5in", "kindle", "renderer"]
+
+# Per worker process renderer instances, by renderer class.
+_renderers = {}
+
+# Render caches reported by the workers, module and instance name by
+# cache name.  Each worker process has its own.
+RENDER_CACHES = {
+    "text_layout": ("text_layout", "text_layout_cache"),
+    "glyph_runs": ("glyph_cache", "glyph_run_cache"),
+    "icons": ("icon_cache", "icon_cache"),
+    "backgrounds": ("background_cache", "background_cache"),
+}
+
+
+def _worker_init(modules: list) -> None:
+    """
+    Worker process initializer.  Imports renderer modules and fonts once.
+    """
+
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            # Render jobs needing the module will report the error.
+            logger.error(f"Render worker failed to import {module}: {e}")
+
+    logger.debug(f"Render worker {os.getpid()} ready, preloaded: {modules}")
+
+
+def _cache_stats() -> dict:
+    """
+    Returns the render cache statistics of the calling worker process.
+    """
+
+    stats = {}
+    for name, (module, instance) in RENDER_CACHES.items():
+        cache = getattr(importlib.import_module(module), instance)
+        stats[name] = cache.to_dict()
+
+    return stats
+
+
+def _render(renderer_cls: type, device: str, fingerprint: str = None) -> tuple:
+    """
+    Renders an image in a worker process.
+
+    Returns:
+        tuple: (png, fingerprint, changes, pid, caches).  PNG bytes, or
+            None if the render inputs match `fingerprint`, the instants
+            the frame will change at, and the worker's process ID and
+            render cache statistics.
+    """
+
+    renderer = _renderers.get(renderer_cls)
+    if renderer is None:
+        renderer = renderer_cls()
+        _renderers[renderer_cls] = renderer
+
+    buf = io.BytesIO()
+    fingerprint_new = renderer.render(
+        device=device, filename=buf, fingerprint=fingerprint
+    )
+    png = buf.getvalue()
+    if fingerprint is not None and fingerprint_new == fingerprint:
+        png = None
+
+    return png, fingerprint_new, renderer.changes, os.getpid(), _cache_stats()
+
+
+class RenderPool:
+    """
+    Renders device images in a pool of worker processes.
+
+    Rendering fetches calendars and weather over the network and draws
+    with PIL, all of it blocking.  Running it in worker processes keeps
+    the event loop responsive and lets devices render in parallel.
+
+    Workers import the renderer modules, and with them the fonts, once at
+    startup.  Renderers are passed to workers by class, each worker keeps
+    one instance per class.
+
+    Renders are single-flight per device and input fingerprint: callers
+    asking for a render already in progress await it and share its result
+    instead of starting another.
+
+    The render caches live in the workers.  Each render returns its
+    worker's cache statistics, the latest per worker are kept and summed
+    in `to_dict`.
+    """
+
+    def __init__(self, workers: int = RENDER_WORKERS, timeout: float = RENDER_TIMEOUT):
+        self._executor = None
+        self._modules = list(PRELOAD_MODULES)
+        self._inflight = {}
+        self._renders = 0
+        self._coalesced = 0
+        self._unchanged = 0
+        self._failures = 0
+        self._caches = {}
+
+        self.workers = workers
+        self.timeout = timeout
+
+    @property
+    def workers(self) -> int:
+        """
+        Number of worker processes.
+
+        Returns:
+            int: Worker count.
+        """
+
+        return self._workers
+
+    @workers.setter
+    def workers(self, value: int) -> None:
+        if not isinstance(value, int):
+            raise TypeError(f"Worker count must be an integer, got {type(value)}")
+        if value < 1:
+            raise ValueError(f"Worker count must be >= 1, got {value}")
+
+        self._workers = value
+
+    @property
+    def timeout(self) -> float:
+        """
+        Seconds to wait for a render.
+
+        Returns:
+            float: Timeout in seconds.
+        """
+
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, value: float) -> None:
+        if not isinstance(value, (int, float)):
+            raise TypeError(f"Timeout must be a number, got {type(value)}")
+        if value <= 0:
+            raise ValueError(f"Timeout must be > 0, got {value}")
+
+        self._timeout = float(value)
+
+    def start(self, modules: Iterable[str] = ()) -> None:
+        """
+        Starts the worker processes.
+
+        Args:
+            modules (Iterable[str], optional): Renderer modules for workers
+                to import at startup, in addition to PRELOAD_MODULES.
+                Defaults to ().
+
+        Example:
+            >>> render_pool.start(modules=["renderer_calendar_outlook"])
+        """
+
+        for module in modules:
+            if module not in self._modules:
+                self._modules.append(module)
+
+        if self._executor is not None:
+            return
+
+        # Cache statistics are per worker, new workers start empty.
+        self._caches.clear()
+
+        # Spawn rather than fork, the server process runs threads.
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self._workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_worker_init,
+            initargs=(self._modules,),
+        )
+        logger.debug(f"Render pool started, {self._workers} workers")
+
+    def shutdown(self) -> None:
+        """
+        Stops the worker processes.  Pending renders are cancelled.
+        """
+
+        if self._executor is None:
+            return
+
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        logger.debug("Render pool stopped")
+
+    @property
+    def renders(self) -> int:
+        """
+        Number of renders started.
+        """
+
+        return self._renders
+
+    @property
+    def coalesced(self) -> int:
+        """
+        Number of requests served by joining a render in progress.
+        """
+
+        return self._coalesced
+
+    @property
+    def unchanged(self) -> int:
+        """
+        Number of renders skipped because their inputs were unchanged.
+        """
+
+        return self._unchanged
+
+    def inflight(self, device: str) -> bool:
+        """
+        Returns True if a render for the device is in progress.
+
+        Args:
+            device (str): Device name.
+
+        Returns:
+            bool: Render in progress.
+        """
+
+        return any(key[0] == device for key in self._inflight)
+
+    async def render(self, renderer, device: str, fingerprint: str = None) -> tuple:
+        """
+        Renders the image for a device in a worker process.
+
+        If a render for the device with the same `fingerprint` is already
+        in progress, waits for it and returns its result.  A render given
+        no fingerprint always draws, so it never joins one that may skip
+        drawing.  Cancelling one caller does not cancel the render for the
+        others.
+
+        Args:
+            renderer (RendererBase): Device renderer.
+            device (str): Device name.
+            fingerprint (str, optional): Input fingerprint of the device's
+                last frame.  Defaults to None.
+
+        Raises:
+            TimeoutError: Render took longer than `timeout`.  The worker
+                finishes the job in the background, the result is dropped.
+
+        Returns:
+            tuple: (png, fingerprint, changes).  PNG bytes, or None if the
+                render inputs match `fingerprint` and nothing was drawn, and
+                the instants the frame will change at.
+
+        Example:
+            >>> png, fingerprint, changes = await render_pool.render(renderer, "kitchen")
+            >>> png[:4]
+            b'\\x89PNG'
+        """
+
+        key = (device, fingerprint)
+        task = self._inflight.get(key)
+        if task is not None:
+            self._coalesced += 1
+            logger.debug(f"Render for {device} in progress, waiting on it")
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(self._render(renderer, device, fingerprint))
+        self._inflight[key] = task
+        self._renders += 1
+
+        def done(task: asyncio.Task) -> None:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+            if task.cancelled() or task.exception() is not None:
+                self._failures += 1
+            elif task.result()[0] is None:
+                self._unchanged += 1
+
+        task.add_done_callback(done)
+
+        return await asyncio.shield(task)
+
+    async def _render(self, renderer, device: str, fingerprint: str) -> tuple:
+        """
+        Submits a render to the workers and waits for it.
+        """
+
+        if self._executor is None:
+            self.start()
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(
+                self._executor, _render, type(renderer), device, fingerprint
+            )
+        except concurrent.futures.BrokenExecutor:
+            # A worker died, e.g. killed for memory.  Start a fresh pool.
+            logger.error("Render pool broken, restarting")
+            self._executor = None
+            self.start()
+            future = loop.run_in_executor(
+                self._executor, _render, type(renderer), device, fingerprint
+            )
+
+        try:
+            png, fingerprint, changes, pid, caches = await asyncio.wait_for(
+                future, timeout=self._timeout
+            )
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                f"Render for {device} timed out after {self._timeout} seconds"
+            )
+
+        self._caches[pid] = caches
+
+        return png, fingerprint, changes
+
+    def caches_get(self) -> dict:
+        """
+        Returns the render cache statistics summed over the workers.
+
+        Returns:
+            dict: Per cache, as in RENDER_CACHES, the entries, maximum
+                entries, hits and misses over all workers, and the hit rate.
+
+        Example:
+            >>> render_pool.caches_get()["glyph_runs"]["hit_rate"] > 0.9
+            True
+        """
+
+        totals = {}
+        for name in RENDER_CACHES:
+            total = {"size": 0, "size_max": 0, "hits": 0, "misses": 0}
+            for caches in self._caches.values():
+                for key in total:
+                    total[key] += caches[name][key]
+            lookups = total["hits"] + total["misses"]
+            total["hit_rate"] = total["hits"] / lookups if lookups else 0.0
+            totals[name] = total
+
+        return totals
+
+    def to_dict(self) -> dict:
+        """
+        Returns render statistics.
+
+        Returns:
+            dict: Worker count, renders started, in progress, coalesced
+                requests, unchanged renders, failures and the render cache
+                statistics of the workers.
+
+        Example:
+            >>> render_pool.to_dict()["coalesced"]
+            0
+        """
+
+        return {
+            "workers": self._workers,
+            "renders": self._renders,
+            "inflight": len(self._inflight),
+            "coalesced": self._coalesced,
+            "unchanged": self._unchanged,
+            "failures": self._failures,
+            "caches": self.caches_get(),
+        }
+
+
+# Process wide render pool.
+render_pool = RenderPool()
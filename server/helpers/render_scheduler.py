@@ -0,0 +1,390 @@
+# render_scheduler.py
+# Time ordered scheduler for frame pre-renders.
+
+import asyncio
+import datetime as dt
+import heapq
+import itertools
+import json
+import logging
+import math
+import os
+from collections import deque
+from typing import Awaitable, Callable, NamedTuple
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+
+# Render budget, pre-renders start only while fewer renders than this
+# are running.
+SCHEDULER_CONCURRENCY = 2
+
+# Seconds between checks while other renders fill the budget.
+BUDGET_POLL = 1.0
+
+# Pre-render start times kept for the load histogram.
+LOAD_HISTORY = 1000
+LOAD_WINDOW = dt.timedelta(days=1)
+
+# File holding pending jobs across restarts.
+SCHEDULE_FILE = "render-schedule.json"
+
+
+class Job(NamedTuple):
+    """
+    Pending pre-render, ordered by time.
+    """
+
+    time: dt.datetime
+    seq: int
+    device: str
+
+
+class RenderScheduler:
+    """
+    Runs pre-renders at set times, at most one pending job per device.
+
+    Jobs sit in a heap ordered by time.  Scheduling a device that already
+    has a job replaces it, the old heap entry is skipped when it comes
+    up.  A single runner task sleeps until the earliest job is due, or
+    until a new job is earlier, and starts due jobs with at most
+    `concurrency` running.  Given a `busy` count of all renders in
+    progress, due jobs also wait while other renders, e.g. for waking
+    devices, fill the budget.
+
+    Pending jobs are saved to a file on every change and loaded on
+    start, jobs that came due while the server was down run at once.
+    """
+
+    def __init__(self, concurrency: int = SCHEDULER_CONCURRENCY):
+        self._heap = []
+        self._jobs = {}
+        self._running = set()
+        self._seq = itertools.count()
+        self._render = None
+        self._busy = None
+        self._filename = None
+        self._runner = None
+        self._wakeup = None
+        self._semaphore = None
+        self._runs = 0
+        self._replaced = 0
+        self._failures = 0
+        self._starts = deque(maxlen=LOAD_HISTORY)
+
+        self.concurrency = concurrency
+
+    @property
+    def concurrency(self) -> int:
+        """
+        Render budget, maximum number of renders running at once.
+
+        Returns:
+            int: Job count.
+        """
+
+        return self._concurrency
+
+    @concurrency.setter
+    def concurrency(self, value: int) -> None:
+        if not isinstance(value, int):
+            raise TypeError(f"Concurrency must be an integer, got {type(value)}")
+        if value < 1:
+            raise ValueError(f"Concurrency must be >= 1, got {value}")
+        if self._runner is not None:
+            raise RuntimeError("Concurrency can't be changed while running")
+
+        self._concurrency = value
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def start(
+        self,
+        render: Callable[[str], Awaitable],
+        filename: str = None,
+        busy: Callable[[], int] = None,
+    ) -> None:
+        """
+        Loads saved jobs and starts running them.  Must be called from
+        the event loop.
+
+        Args:
+            render (Callable): Coroutine function rendering a device's frame,
+                called with the device name.
+            filename (str, optional): Schedule file. Defaults to
+                SCHEDULE_FILE in the working directory.
+            busy (Callable, optional): Returns the number of renders in
+                progress, pre-renders included.  Defaults to None, only
+                pre-renders count against the budget.
+
+        Example:
+            >>> render_scheduler.start(render=frame_render)
+        """
+
+        self._render = render
+        self._busy = busy
+        self._filename = filename or os.path.join(os.getcwd(), SCHEDULE_FILE)
+        if self._runner is not None:
+            return
+
+        self.load()
+
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self._concurrency)
+        self._runner = asyncio.ensure_future(self._run())
+        logger.debug(f"Render scheduler started, {len(self._jobs)} jobs pending")
+
+    def shutdown(self) -> None:
+        """
+        Stops running jobs.  Pending jobs stay saved for the next start.
+        """
+
+        if self._runner is None:
+            return
+
+        self._runner.cancel()
+        self._runner = None
+        self.save()
+        logger.debug("Render scheduler stopped")
+
+    def schedule(self, device: str, time: dt.datetime) -> Job:
+        """
+        Schedules a pre-render for a device, replacing any pending one.
+
+        Args:
+            device (str): Device name.
+            time (datetime.datetime): When to render.
+
+        Returns:
+            Job: Scheduled job.
+
+        Example:
+            >>> job = render_scheduler.schedule("kitchen", dt.datetime.now() + delay)
+            >>> render_scheduler.job_get("kitchen") == job
+            True
+        """
+
+        job = Job(time, next(self._seq), device)
+        if device in self._jobs:
+            self._replaced += 1
+        self._jobs[device] = job
+        heapq.heappush(self._heap, job)
+        self.save()
+
+        # Runner may be sleeping on a later job.
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+        logger.debug(f"Pre-render scheduled for: {device} at {time}")
+
+        return job
+
+    def cancel(self, device: str) -> bool:
+        """
+        Cancels the pending pre-render of a device.
+
+        Args:
+            device (str): Device name.
+
+        Returns:
+            bool: True if a job was pending.
+        """
+
+        if self._jobs.pop(device, None) is None:
+            return False
+
+        self.save()
+        return True
+
+    def job_get(self, device: str) -> Job:
+        """
+        Returns the pending pre-render of a device.
+
+        Args:
+            device (str): Device name.
+
+        Returns:
+            Job: Job, or None.
+        """
+
+        return self._jobs.get(device)
+
+    def jobs(self) -> list:
+        """
+        Returns the pending pre-renders, earliest first.
+
+        Returns:
+            list: Jobs.
+        """
+
+        return sorted(self._jobs.values())
+
+    def running(self) -> list:
+        """
+        Returns the devices with a pre-render in progress.
+
+        Returns:
+            list: Device names.
+        """
+
+        return sorted(self._running)
+
+    def load_histogram(self, bucket: dt.timedelta = dt.timedelta(minutes=1)) -> list:
+        """
+        Returns pre-render starts over the last LOAD_WINDOW by time past
+        the hour, showing whether wakes bunch up.
+
+        Args:
+            bucket (datetime.timedelta, optional): Bucket width, dividing
+                an hour. Defaults to 1 minute.
+
+        Returns:
+            list: Start count per bucket, from the top of the hour.
+
+        Example:
+            >>> len(render_scheduler.load_histogram(dt.timedelta(minutes=5)))
+            12
+        """
+
+        hour = dt.timedelta(hours=1)
+        counts = [0] * math.ceil(hour / bucket)
+        since = dt.datetime.now() - LOAD_WINDOW
+        for time in self._starts:
+            if time < since:
+                continue
+            past = time - time.replace(minute=0, second=0, microsecond=0)
+            counts[past // bucket] += 1
+
+        return counts
+
+    def _due_pop(self) -> Job:
+        """
+        Pops replaced and cancelled entries off the heap and returns the
+        earliest live job, left on the heap, or None.
+        """
+
+        while self._heap:
+            job = self._heap[0]
+            if self._jobs.get(job.device) is job:
+                return job
+            heapq.heappop(self._heap)
+
+        return None
+
+    async def _run(self) -> None:
+        """
+        Runner task, starts jobs as they come due.
+        """
+
+        while True:
+            job = self._due_pop()
+            timeout = None
+            if job is not None:
+                timeout = (job.time - dt.datetime.now()).total_seconds()
+
+            if timeout is None or timeout > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._semaphore.acquire()
+            while self._busy is not None and self._busy() >= self._concurrency:
+                await asyncio.sleep(BUDGET_POLL)
+
+            # Job may have been replaced while waiting for a slot.
+            if self._due_pop() is not job:
+                self._semaphore.release()
+                continue
+
+            heapq.heappop(self._heap)
+            del self._jobs[job.device]
+            self.save()
+
+            self._running.add(job.device)
+            self._starts.append(dt.datetime.now())
+            asyncio.ensure_future(self._job_run(job))
+
+    async def _job_run(self, job: Job) -> None:
+        """
+        Runs one pre-render.
+        """
+
+        prefix = "*BG*:"
+        logger.debug(f"{prefix} Background rendering image for: {job.device}")
+        try:
+            self._runs += 1
+            await self._render(job.device)
+        except Exception as e:
+            self._failures += 1
+            logger.error(f"{prefix} Background render failed for: {job.device}: {e}")
+        finally:
+            self._running.discard(job.device)
+            self._semaphore.release()
+
+    def load(self) -> None:
+        """
+        Loads pending jobs from the schedule file, keeping any scheduled
+        since.
+        """
+
+        if not self._filename or not os.path.exists(self._filename):
+            return
+
+        try:
+            with open(self._filename) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load render schedule {self._filename}: {e}")
+            return
+
+        for device, time in saved.items():
+            if device in self._jobs:
+                continue
+
+            job = Job(dt.datetime.fromisoformat(time), next(self._seq), device)
+            self._jobs[device] = job
+            heapq.heappush(self._heap, job)
+
+        logger.debug(f"Loaded {len(saved)} jobs from: {self._filename}")
+
+    def save(self) -> None:
+        """
+        Saves pending jobs to the schedule file.
+        """
+
+        if not self._filename:
+            return
+
+        saved = {job.device: job.time.isoformat() for job in self.jobs()}
+        try:
+            with open(self._filename, "w") as f:
+                json.dump(saved, f, indent=2)
+        except OSError as e:
+            logger.error(f"Failed to save render schedule {self._filename}: {e}")
+
+    def to_dict(self) -> dict:
+        """
+        Returns scheduler statistics.
+
+        Returns:
+            dict: Concurrency, pending and running jobs, jobs run,
+                replaced and failed.
+        """
+
+        return {
+            "concurrency": self._concurrency,
+            "pending": len(self._jobs),
+            "running": len(self._running),
+            "runs": self._runs,
+            "replaced": self._replaced,
+            "failures": self._failures,
+        }
+
+
+# Process wide pre-render scheduler.
+render_scheduler = RenderScheduler()
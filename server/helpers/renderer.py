@@ -3,11 +3,18 @@
 
 # imports
 import datetime as dt
+import hashlib
+import json
 import logging
 import os
 
-import pyvips
-from PIL import Image, ImageDraw, ImageFont
+from PIL import ImageDraw, ImageFont
+
+from background_cache import background_cache
+from icon_cache import icon_cache
+from text_layout import text_layout_cache
+from glyph_cache import glyph_run_cache
+from sleep_policy import boundary_next, change_times
 
 # from kindle import Color, ResolutionPortrait, fonts
 from trmnl_7_5in import Color, ResolutionPortrait, fonts
@@ -18,6 +25,7 @@ logger.setLevel(level=logging.DEBUG)
 
 # Battery icon path
 ICON_PATH = "./icons/"
+BATTERY_ICON_SCALE = 0.4
 
 
 class RendererBase:
@@ -25,19 +33,106 @@ class RendererBase:
     Base class for display image renderer.
     """
 
+    # Bump when a renderer changes what it draws into its static layers,
+    # so that cached base images are redrawn.
+    LAYOUT_VERSION = 1
+
+    # Footer "Updated:" time policy.  The time is part of the render
+    # fingerprint at this resolution, so an unchanged frame rendered in a
+    # later period is redrawn to refresh it.  The period boundaries are
+    # not frame changes a device wakes for, the time only moves on frames
+    # rendered for other reasons.  None leaves the time out, the footer
+    # then shows when the content last changed.
+    UPDATED_TIME_RESOLUTION = dt.timedelta(hours=1)
+
     def __init__(self, name: str = None):
         self._image = None
         self._draw = None
         self._font = None
+        self._changes = ()
 
-    def render(self, device: str, filename: str):
+    def render(self, device: str, filename: str, fingerprint: str = None) -> str:
         """
         Renders the image.
+
+        Renderers gather their inputs first and compare their fingerprint
+        against `fingerprint`.  If they match, nothing is drawn and the
+        file is not written.
+
+        Args:
+            device (str): Device name.
+            filename (str): Output file name or file object.
+            fingerprint (str, optional): Fingerprint of the last frame. Defaults to None.
+
+        Returns:
+            str: Fingerprint of this render's inputs.
         """
 
         # Note, if you need the device name, it is in the renederer.name field.
         raise RuntimeError("Base class render called.")
 
+    @property
+    def changes(self) -> tuple:
+        """
+        Instants at which the last rendered frame would next change.
+
+        Returns:
+            tuple: Naive local times, earliest first.
+        """
+
+        return self._changes
+
+    def changes_set(self, *times, now: dt.datetime = None) -> None:
+        """
+        Records the instants the frame will change at, from the render's
+        inputs, e.g. event starts and ends.  Renderers call this before
+        the fingerprint check, so unchanged renders report them too.
+
+        The next day, for the header date, is always included.  The
+        footer time period (UPDATED_TIME_RESOLUTION) is not, so it doesn't
+        set the wake cadence.
+
+        Args:
+            *times: Instants, naive local or timezone aware.
+            now (datetime.datetime, optional): Current local time. Defaults to now.
+        """
+
+        if now is None:
+            now = dt.datetime.now()
+
+        times = [*times, boundary_next(dt.timedelta(days=1), now)]
+        self._changes = change_times(times, now)
+
+    def fingerprint_get(self, device: str, *inputs) -> str:
+        """
+        Returns a stable fingerprint of everything a render draws.
+
+        Combines the renderer, layout version, device and footer time
+        (per UPDATED_TIME_RESOLUTION) with the renderer's inputs.
+
+        Args:
+            device (str): Device name.
+            *inputs: Render inputs.  Events, dates, dicts, lists and
+                scalars are reduced to plain values.
+
+        Returns:
+            str: Fingerprint.
+
+        Example:
+            >>> renderer.fingerprint_get("kitchen", (99, 72, "10.0.0.5"), events)
+            '5be2c0cfa8e8e31d'
+        """
+
+        time = None
+        if self.UPDATED_TIME_RESOLUTION:
+            resolution = self.UPDATED_TIME_RESOLUTION
+            time = dt.datetime.min + ((dt.datetime.now() - dt.datetime.min) // resolution) * resolution
+
+        values = [type(self).__name__, self.LAYOUT_VERSION, device, time, *inputs]
+        text = json.dumps(fingerprint_values(values), separators=(",", ":"))
+
+        return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+
     def render_battery(self, battery_soc: int = 100, position: tuple = (0, 0)) -> None:
         """
         Renders battery state of charge icon and text.
@@ -70,16 +165,11 @@ class RendererBase:
 
         # Load icon
         icon_path_svg = os.path.join(ICON_PATH, icon_file)
-        icon_path_png = icon_path_svg.replace(".svg", ".png")
-        icon = pyvips.Image.new_from_file(
+        icon_png = icon_cache.icon_get(
             icon_path_svg,
             dpi=ResolutionPortrait.PPI,
-            scale=0.4
+            scale=BATTERY_ICON_SCALE
         )
-        # Resize icon
-        # icon = icon.rotate(270)  # Ensure correct orientation
-        icon.write_to_file(icon_path_png)
-        icon_png = Image.open(icon_path_png)
 
         # Render icon
         self._draw._image.paste(icon_png, position, icon_png)
@@ -87,7 +177,7 @@ class RendererBase:
         # Battery percentage text
         fontsz = "tiny"
         battery_text = f"{battery_soc}%"
-        text_bbox = fonts[fontsz].getbbox(battery_text)
+        text_bbox = text_layout_cache.bbox_get(battery_text, fonts[fontsz])
         text_width = text_bbox[2] - text_bbox[0]
         icon_width = icon_png.width
 
@@ -95,7 +185,8 @@ class RendererBase:
         x_status_field = position[0] + (icon_width - text_width) // 2
         y_status = position[1] + 28
 
-        self._draw.text(
+        glyph_run_cache.text_draw(
+            self._draw,
             (x_status_field, y_status),
             battery_text,
             font=fonts[fontsz],
@@ -103,6 +194,73 @@ class RendererBase:
             fill=Color.BLACK,
         )
 
+    def image_new(
+        self,
+        device: str,
+        mode: str,
+        size: tuple,
+        background: int,
+        layout: tuple = (),
+        layers: list = (),
+    ) -> None:
+        """
+        Creates the image and drawing context for a render.
+
+        The image starts as a copy of the cached base holding the static
+        layers, so only dynamic content needs drawing.  Layers must only
+        depend on the device and `layout`.
+
+        Args:
+            device (str): Device name.
+            mode (str): Image mode.
+            size (tuple): Image (width, height).
+            background (int): Background color.
+            layout (tuple, optional): Layout positions the layers depend on. Defaults to ().
+            layers (list, optional): Static layer drawing functions. Defaults to ().
+
+        Returns: None
+        """
+
+        key = (type(self).__name__, self.LAYOUT_VERSION, device) + tuple(layout)
+        self._image = background_cache.base_get(key, mode, size, background, layers)
+        self._draw = ImageDraw.Draw(self._image)  # drawing context
+
+    def header_layout_get(self) -> tuple:
+        """
+        Returns the header text and the y position of the separator line.
+
+        Returns:
+            tuple: (day_str, y_separator).
+        """
+
+        y = 0
+        y_pad = 4
+
+        # Date
+        today = dt.datetime.today()
+        day_str = f"{today.strftime('%A')}, {today.strftime('%B %-d')}"
+        y += text_layout_cache.bbox_get(day_str, fonts["large"])[3] + y_pad
+
+        return day_str, y
+
+    def render_header_static(
+        self,
+        draw: ImageDraw.ImageDraw,
+        width: int = ResolutionPortrait.HORIZ,
+        y_separator: int = 0,
+    ) -> None:
+        """
+        Static header layer, the separator line.
+        """
+
+        x = 10
+
+        # Separator line
+        draw.line((x, y_separator, width - 2 * x, y_separator),
+                  # fill=Color.GRAY_MID
+                  fill=Color.BLACK
+                  )
+
     def render_header(
         self,
         width: int = ResolutionPortrait.HORIZ,
@@ -112,30 +270,51 @@ class RendererBase:
         y = 0
         y_pad = 4
 
-        # Date
-        today = dt.datetime.today()
-
         # Header
-        day_str = f"{today.strftime('%A')}, {today.strftime('%B %-d')}"
+        day_str, y_separator = self.header_layout_get()
         logger.debug(f"Day string: {day_str}")
         fontsz = "large"
-        self._draw.text((x, y), day_str, font=fonts[fontsz], fill=Color.BLACK)
-
-        y += fonts[fontsz].getbbox(day_str)[3] + y_pad
+        glyph_run_cache.text_draw(
+            self._draw, (x, y), day_str, font=fonts[fontsz], fill=Color.BLACK
+        )
 
         # Battery status
         pos = (width - 42, 0)
         self.render_battery(battery_soc=battery_soc, position=pos)
 
-        # Separator line
-        self._draw.line((x, y, width - 2 * x, y),
-                        # fill=Color.GRAY_MID
-                        fill=Color.BLACK
-                        )
-        y += y_pad
+        # Separator line is in the static layer.
+        y = y_separator + y_pad
 
         return y
 
+    def render_footer_static(
+        self,
+        draw: ImageDraw.ImageDraw,
+        device: str = None,
+        y: int = None,
+        width: int = ResolutionPortrait.HORIZ,
+    ) -> None:
+        """
+        Static footer layer, the device name field.
+        """
+
+        fontsz = "tiny"
+        x_pad = 5
+
+        # Device Name field
+        device_field = f"Device Name: {device}"
+        x_device_field = width
+        x_device_field -= text_layout_cache.bbox_get(device_field, fonts[fontsz])[2]
+        x_device_field -= 4 * x_pad
+        glyph_run_cache.text_draw(
+            draw,
+            (x_device_field, y),
+            device_field,
+            font=fonts[fontsz],
+            # fill.Color.GRAY_DARK,
+            fill=Color.BLACK,
+        )
+
     def render_footer(
         self,
         device: str = None,
@@ -145,18 +324,18 @@ class RendererBase:
     ) -> int:
         # Configure footer
         fontsz = "tiny"
-        x_pad = 5
         y_pad = 4
 
         if y is None:
             y = ResolutionPortrait.VERT - fonts[fontsz].getsize("X")[1] - 4 * y_pad
 
-        # Update Status & Device Name
+        # Update Status
         x_status_field = 15
         now = dt.datetime.now()
         time_str = f'{now.strftime("%-I:%M %p")}'
         update_str = "Updated: " + time_str
-        self._draw.text(
+        glyph_run_cache.text_draw(
+            self._draw,
             (x_status_field, y),
             update_str,
             font=fonts[fontsz],
@@ -165,9 +344,10 @@ class RendererBase:
         )
 
         # Device IP field
-        sz = fonts[fontsz].getbbox(device_ip)
+        sz = text_layout_cache.bbox_get(device_ip, fonts[fontsz])
         x_device_ip = round(width - sz[2]) / 2
-        self._draw.text(
+        glyph_run_cache.text_draw(
+            self._draw,
             (x_device_ip, y),
             device_ip,
             font=fonts[fontsz],
@@ -175,18 +355,7 @@ class RendererBase:
             fill=Color.BLACK,
         )
 
-        # Device Name field
-        device_field = f"Device Name: {device}"
-        x_device_field = width
-        x_device_field -= fonts[fontsz].getbbox(device_field)[2]
-        x_device_field -= 4 * x_pad
-        self._draw.text(
-            (x_device_field, y),
-            device_field,
-            font=fonts[fontsz],
-            # fill.Color.GRAY_DARK,
-            fill=Color.BLACK,
-        )
+        # Device Name field is in the static layer.
 
 
 # ------------------------------------------------------------
@@ -194,6 +363,41 @@ class RendererBase:
 # ------------------------------------------------------------
 
 
+def fingerprint_values(value):
+    """
+    Reduces render inputs to JSON serializable values for fingerprinting.
+
+    Args:
+        value: Render input.
+
+    Returns:
+        Plain value.
+    """
+
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+
+    if isinstance(value, (dt.datetime, dt.date, dt.time)):
+        return value.isoformat()
+
+    if isinstance(value, dt.timedelta):
+        return value.total_seconds()
+
+    if isinstance(value, dict):
+        return {str(k): fingerprint_values(v) for k, v in sorted(value.items(), key=str)}
+
+    if isinstance(value, (list, tuple)):
+        return [fingerprint_values(v) for v in value]
+
+    # Calendar events.
+    if all(hasattr(value, attr) for attr in ("summary", "start", "end", "all_day")):
+        return fingerprint_values(
+            [value.summary, value.start, value.end, value.all_day]
+        )
+
+    return repr(value)
+
+
 def test_text() -> str:
     """
     Returns a string of test text for text_fill_box.
@@ -233,6 +437,9 @@ def text_fill_box(
         width (int, optional): Box width. Defaults to 100.
         height (int, optional): Box height. Defaults to 50.
         spacing (int): Spacing between lines. Defaults to 2.
+
+    Returns:
+        str: Text with newlines inserted.
     """
 
     if draw is None or not isinstance(draw, ImageDraw.ImageDraw):
@@ -241,63 +448,13 @@ def text_fill_box(
     if font is None or not isinstance(font, ImageFont.FreeTypeFont):
         raise ValueError("font parameter must be of type ImageFont.FreeTypeFont")
 
-    words = text.split()
-    word_cnt_total = len(words)
-    word_cnt_cur = 0
-    line_cnt = 1
-    fit_text = ""
-
-    logger.debug(f"Box size: {width}x{height}")
-
-    def multiline_textsz(text: str, font: ImageFont.FreeTypeFont, spacing: int):
-        sz = draw.multiline_textbbox((0, 0), text, font=font, spacing=spacing)
-        return (sz[2] - sz[0], sz[3] - sz[1])
-
-    while word_cnt_cur < word_cnt_total:
-        # Try to add words to this line.
-        first_word_of_line = True
-        # while draw.multiline_textsize(fit_text, font=font, spacing=spacing)[0] <= width:
-        while multiline_textsz(fit_text, font=font, spacing=spacing)[0] <= width:
-            if first_word_of_line:
-                fit_text += words[word_cnt_cur]
-                first_word_of_line = False
-            else:
-                fit_text += " " + words[word_cnt_cur]
-
-            word_cnt_cur += 1
-
-            logger.debug("")
-            logger.debug(f"Fit text:|{fit_text}|")
-            logger.debug(f"Word count: {word_cnt_cur}:{word_cnt_total}")
-            logger.debug(
-                f"Word add sz: {multiline_textsz(fit_text, font=font, spacing=spacing)}"
-            )
-
-            # If we added all the words, we're done.
-            if word_cnt_cur == word_cnt_total:
-                if multiline_textsz(fit_text, font=font, spacing=spacing)[0] <= width:
-                    return fit_text
-
-        # Drop the last word added & add a newline
-        fit_text = fit_text.rsplit(" ", 1)[0]
-        word_cnt_cur -= 1
-
-        logger.debug(f"   Box size: {width}x{height}")
-        logger.debug(
-            f"   Accepted Line:{multiline_textsz(fit_text, font=font, spacing=spacing)} |{fit_text}|"
-        )
-        logger.debug(f"   Word count: {word_cnt_cur}:{word_cnt_total}")
-
-        fit_text += "\n"
-        line_cnt += 1
-
-        if multiline_textsz(fit_text, font=font, spacing=spacing)[0] > width:
-            raise ValueError("Text too long for box width.")
-
-        # If we've exceeded the height, we're done.
-        # print(
-        #     f'Line add sz: {draw.multiline_textsize(fit_text, font=font, spacing=spacing)}')
-        if multiline_textsz(fit_text, font=font, spacing=spacing)[1] > height:
-            break
+    layout = text_layout_cache.layout_get(
+        text,
+        font,
+        width=width,
+        height=height,
+        spacing=spacing,
+        fontmode=draw.fontmode,
+    )
 
-    return fit_text
+    return layout.text
@@ -11,7 +11,9 @@ from db import DB, DeviceState
 
 from kindle import Color, fonts, ResolutionLandscape
 from renderer import RendererBase, text_fill_box
-from PIL import Image, ImageDraw, ImageFont
+from text_layout import text_layout_cache
+from glyph_cache import glyph_run_cache
+from PIL import ImageDraw
 
 CALENDARS = [
     "primary",
@@ -32,19 +34,16 @@ class RendererCalendarGoogle(RendererBase):
     def __init__(self, name: str = None):
         super().__init__(name=name)
 
-    def render(self, device: str, filename: str):
+    def render(self, device: str, filename: str, fingerprint: str = None) -> str:
         """
         Renders an image for the device.
+        Skips drawing if the inputs match `fingerprint`.
         """
 
-        # Create the new, base image, landscape
+        # Image mode & size, landscape
         mode = "L"  # 8-bit grayscale.
         background = Color.WHITE
-        self._image = Image.new(
-            mode, (ResolutionLandscape.HORIZ, ResolutionLandscape.VERT), background
-        )
-
-        self._draw = ImageDraw.Draw(self._image)  # drawing context
+        size = (ResolutionLandscape.HORIZ, ResolutionLandscape.VERT)
         self._image_needs_rotation = True
 
         # Get device info.
@@ -75,20 +74,20 @@ class RendererCalendarGoogle(RendererBase):
         x_pad = 5
         y_pad = 4
 
-        # Header
-        y = self.render_header(
-            width=ResolutionLandscape.HORIZ, battery_soc=data.battery_soc
-        )
+        # Header layout
+        day_str_header, y_separator = self.header_layout_get()
+        y = y_separator + y_pad
 
-        # List events for next several days.
+        # Column layout for the next several days.
         n_days = 7
         days = [today + dt.timedelta(days=i) for i in range(n_days)]
+        events_by_day = cal.events_range_query(start=today, days=n_days)
         col_width = 260
         row_height = 100
         y_day = y
+        columns = []
         for i, day in enumerate(days):
             # Day header
-            fontsz = "medium_small"
             if i == 0:
                 day_str = "Today"
             else:
@@ -99,18 +98,62 @@ class RendererCalendarGoogle(RendererBase):
                 x = 10 + col_width
                 y_day = ResolutionLandscape.VERT // 2
 
-            self._draw.text((x, y_day), day_str, font=fonts[fontsz], fill=Color.BLACK)
-            y = y_day + fonts[fontsz].getbbox(day_str)[3] + y_pad
-
-            # Event list
             # Events for the day
-            cal.clear()
-            cal.events_query(date=day)
+            events = events_by_day[day.date()]
+
+            columns.append((day, day_str, x, y_day, events))
 
-            events = cal.events
+            # Next column x
+            x += col_width
+
+        # Footer layout
+        height_footer = text_layout_cache.bbox_get("X", fonts["tiny"])[3]
+        y_footer = ResolutionLandscape.VERT - height_footer - 4 * y_pad
+
+        # Skip drawing if nothing on the frame changed.
+        fingerprint_new = self.fingerprint_get(
+            device,
+            (data.battery_soc, data.ipaddr),
+            day_str_header,
+            [(day_str, events) for _, day_str, _, _, events in columns],
+        )
+
+        # Frame changes with the day, columns list whole days of events.
+        self.changes_set()
+
+        if fingerprint_new == fingerprint:
+            logger.debug(f"Render inputs unchanged for: {device}")
+            return fingerprint_new
+
+        # Start from the static layers: header separator, day headers and
+        # device name.  Day headers change once a day.
+        layers = [
+            lambda draw: self.render_header_static(
+                draw, width=ResolutionLandscape.HORIZ, y_separator=y_separator
+            ),
+            lambda draw: self.render_columns_static(draw, columns),
+            lambda draw: self.render_footer_static(
+                draw, device=device, y=y_footer, width=ResolutionLandscape.HORIZ
+            ),
+        ]
+        layout = (y_separator, y_footer, today.date())
+        self.image_new(device, mode, size, background, layout=layout, layers=layers)
+
+        # Header
+        self.render_header(
+            width=ResolutionLandscape.HORIZ, battery_soc=data.battery_soc
+        )
+
+        # List events for next several days.
+        for day, day_str, x, y_day, events in columns:
+            fontsz = "medium_small"
+            y = y_day + text_layout_cache.bbox_get(day_str, fonts[fontsz])[3] + y_pad
+
+            # Event list
             fontsz = "tiny"
             if not events:
-                self._draw.text(
+                glyph_run_cache.text_draw(
+                    self._draw,
                     (x, y), "No Events", font=fonts[fontsz], fill=Color.BLACK
                 )
             else:
@@ -120,7 +163,7 @@ class RendererCalendarGoogle(RendererBase):
                         text = event.summary
 
                         # Add in box
-                        sz_text = fonts[fontsz].getbbox(text)
+                        sz_text = text_layout_cache.bbox_get(text, fonts[fontsz])
                         self._draw.rounded_rectangle(
                             (
                                 x - x_pad,
@@ -142,7 +185,8 @@ class RendererCalendarGoogle(RendererBase):
                             height=row_height,
                         )
 
-                        self._draw.text(
+                        glyph_run_cache.text_draw(
+                            self._draw,
                             (x, y), text, font=fonts[fontsz], fill=Color.WHITE
                         )
                         y += sz_text[3] + y_pad
@@ -155,10 +199,11 @@ class RendererCalendarGoogle(RendererBase):
                         # Row with start and end times
                         text = f"{event.start.strftime('%-I:%M %p')} - "
                         text += f"{event.end.strftime('%-I:%M %p')}"
-                        self._draw.text(
+                        glyph_run_cache.text_draw(
+                            self._draw,
                             (x, y), text, font=fonts[fontsz], fill=Color.BLACK
                         )
-                        y += fonts[fontsz].getbbox(text)[3] + y_pad
+                        y += text_layout_cache.bbox_get(text, fonts[fontsz])[3] + y_pad
 
                         # Inset summary
                         text = f"{event.summary}"
@@ -179,29 +224,26 @@ class RendererCalendarGoogle(RendererBase):
                             height=row_height,
                         )
 
-                        self._draw.text(
+                        glyph_run_cache.text_draw(
+                            self._draw,
                             (x + inset, y), text, font=fonts[fontsz], fill=Color.BLACK
                         )
 
-                        def multiline_textsz(text: str, font: ImageFont.FreeTypeFont):
-                            sz = self._draw.multiline_textbbox((0, 0), text, font=font)
-                            return (sz[2] - sz[0], sz[3] - sz[1])
-
-                        y += multiline_textsz(text, font=fonts[fontsz])[1] + y_pad
+                        sz = text_layout_cache.layout_get(
+                            text, fonts[fontsz], fontmode=self._draw.fontmode
+                        ).bbox
+                        y += sz[3] - sz[1] + y_pad
 
                     y += y_pad
 
-            # Next column x
-            x += col_width
-
         # -------------------------------------------------------------
         # Footer
         # -------------------------------------------------------------
-        # Update Status & Device Name
+        # Update Status, Device Name is in the static layer
         self.render_footer(
             device=device,
             width=ResolutionLandscape.HORIZ,
-            y=ResolutionLandscape.VERT - fonts[fontsz].getbbox("X")[3] - 4 * y_pad,
+            y=y_footer,
             device_ip=data.ipaddr,
         )
 
@@ -212,6 +254,19 @@ class RendererCalendarGoogle(RendererBase):
         # Generate PNG
         self._image.save(filename, "PNG")
 
+        return fingerprint_new
+
+    def render_columns_static(self, draw: ImageDraw.ImageDraw, columns: list) -> None:
+        """
+        Static column layer, the day headers.
+        """
+
+        fontsz = "medium_small"
+        for _, day_str, x, y_day, _ in columns:
+            glyph_run_cache.text_draw(
+                draw, (x, y_day), day_str, font=fonts[fontsz], fill=Color.BLACK
+            )
+
 
 if __name__ == "__main__":
     renderer = RendererCalendarGoogle()
@@ -14,6 +14,8 @@ from trmnl_7_5in import ResolutionPortrait as Resolution
 from nws_weather import Weather
 from db import DB, DeviceState
 from renderer import RendererBase, text_fill_box
+from text_layout import text_layout_cache
+from glyph_cache import glyph_run_cache
 
 from calendar_outlook_msal import CalendarOutlook
 
@@ -32,9 +34,10 @@ class RendererCalendarOutlook(RendererBase):
     def __init__(self, name: str = None):
         super().__init__(name=name)
 
-    def render(self, device: str, filename: str):
+    def render(self, device: str, filename: str, fingerprint: str = None) -> str:
         """
         Renders an image for the device.
+        Skips drawing if the inputs match `fingerprint`.
         """
 
         # Get device info.
@@ -70,8 +73,11 @@ class RendererCalendarOutlook(RendererBase):
         # mode = "L"  # 8-bit grayscale.
         mode = "1"  # 1-bit pixels, black and white, stored with one pixel per byte.
         background = Color.WHITE
-        self._image = Image.new(mode, (Resolution.HORIZ, Resolution.VERT), background)
-        self._draw = ImageDraw.Draw(self._image)  # drawing context
+        size = (Resolution.HORIZ, Resolution.VERT)
+
+        # Measuring context until the layout is known, the all-day
+        # section height decides where the time grid goes.
+        draw_layout = ImageDraw.Draw(Image.new(mode, (1, 1), background))
 
         # TODO: Put resolution into constructor.
 
@@ -81,12 +87,14 @@ class RendererCalendarOutlook(RendererBase):
         y_pad = 4
 
         # Header
-        y = self.render_header(width=Resolution.HORIZ, battery_soc=data.battery_soc)
+        day_str, y_separator = self.header_layout_get()
+        y = y_separator + y_pad
 
-        # Render all-day events (comma-separated, left-justified on same line as temperature)
+        # Size all-day events (comma-separated, left-justified on same line as temperature)
         x = 10
-        y_allday_start = y
+        y_allday = y
         max_height_this_section = 0
+        wrapped_text = None
 
         if cal.upcoming:
             all_day_events = [event for event in cal.upcoming if event.all_day]
@@ -99,12 +107,12 @@ class RendererCalendarOutlook(RendererBase):
                 if data.temperature is not None:
                     fontsz = "medium_small"
                     datastr = f"{data.temperature}°F"
-                    temp_width = fonts[fontsz].getbbox(datastr)[2] + 20  # temp + padding
+                    temp_width = text_layout_cache.bbox_get(datastr, fonts[fontsz])[2] + 20  # temp + padding
                 available_width = Resolution.HORIZ - 20 - temp_width  # 20 = left + right padding
 
                 # Wrap text to fit
                 wrapped_text = text_fill_box(
-                    draw=self._draw,
+                    draw=draw_layout,
                     text=all_day_text,
                     font=fonts[fontsz_allday],
                     width=available_width,
@@ -112,38 +120,20 @@ class RendererCalendarOutlook(RendererBase):
                     spacing=2,
                 )
 
-                # Render the all-day events text
-                self._draw.multiline_text(
-                    (x, y + y_pad),
-                    wrapped_text,
-                    font=fonts[fontsz_allday],
-                    fill=Color.BLACK,
-                    align="left",
-                    spacing=2,
-                )
-
                 # Calculate height of all-day events text
-                text_bbox = self._draw.multiline_textbbox(
-                    (x, y + y_pad),
+                text_bbox = text_layout_cache.layout_get(
                     wrapped_text,
-                    font=fonts[fontsz_allday],
+                    fonts[fontsz_allday],
                     spacing=2,
-                )
+                    fontmode=draw_layout.fontmode,
+                ).bbox_at((x, y + y_pad))
                 max_height_this_section = text_bbox[3] - text_bbox[1]
 
         # Device state info (temperature - right justified on same line)
         if data.temperature is not None:
             fontsz = "medium_small"
-
-            # Field - right justified
             datastr = f"{data.temperature}°F"
-            text_width = fonts[fontsz].getbbox(datastr)[2]
-            x_temp = Resolution.HORIZ - text_width - 20  # 20 pixels padding from right edge
-            self._draw.text(
-                (x_temp, y + y_pad), datastr, font=fonts[fontsz], fill=Color.BLACK
-            )
-
-            temp_height = fonts[fontsz].getbbox(datastr)[3]
+            temp_height = text_layout_cache.bbox_get(datastr, fonts[fontsz])[3]
             max_height_this_section = max(max_height_this_section, temp_height)
 
         # Update y position based on the taller of the two elements
@@ -161,15 +151,95 @@ class RendererCalendarOutlook(RendererBase):
                     cal_timed.add(event)
 
         bottom_margin = 4
-        TimeGrid(
-            draw=self._draw,
-            weather=weather,
-            calendar=cal_timed,
+        height_footer = text_layout_cache.bbox_get("X", fonts[fontsz])[3]
+        y_footer = Resolution.VERT - height_footer - bottom_margin + y_pad
+        grid = dict(
             timeframe_hours=7,
             x_base=0,
             y_base=y,
             width=Resolution.HORIZ,
-            height=Resolution.VERT - y - fonts[fontsz].getbbox("X")[3] - bottom_margin,
+            height=Resolution.VERT - y - height_footer - bottom_margin,
+            start=TimeGridStart(),
+        )
+
+        # Skip drawing if nothing on the frame changed.
+        weather_hours = None
+        if weather is not None and not DEBUG:
+            weather_hours = [
+                (record["temperature"], record["icon"]) if record else None
+                for record in weather.forecast_hours(
+                    grid["start"], grid["timeframe_hours"]
+                )
+            ]
+        fingerprint_new = self.fingerprint_get(
+            device,
+            (data.battery_soc, data.temperature, data.ipaddr),
+            day_str,
+            cal.upcoming,
+            weather_hours,
+            grid,
+        )
+
+        # Frame changes with the time grid.  Event starts and ends only
+        # show at hour boundaries, `upcoming` and the grid both work from
+        # the start of the hour, as does the hourly weather.
+        self.changes_set(grid["start"] + dt.timedelta(hours=1))
+
+        if fingerprint_new == fingerprint:
+            logger.debug(f"Render inputs unchanged for: {device}")
+            return fingerprint_new
+
+        # Start from the static layers: header separator, time grid lines
+        # and hour labels, device name.  Grid position changes with the
+        # all-day section height, the hour labels once an hour.
+        layers = [
+            lambda draw: self.render_header_static(
+                draw, width=Resolution.HORIZ, y_separator=y_separator
+            ),
+            lambda draw: TimeGridStatic(draw=draw, **grid),
+            lambda draw: self.render_footer_static(
+                draw, device=device, y=y_footer, width=Resolution.HORIZ
+            ),
+        ]
+        layout = (
+            y_separator,
+            y_footer,
+            grid["y_base"],
+            grid["height"],
+            grid["start"].hour,
+        )
+        self.image_new(device, mode, size, background, layout=layout, layers=layers)
+
+        # Header
+        self.render_header(width=Resolution.HORIZ, battery_soc=data.battery_soc)
+
+        # All-day events text
+        if wrapped_text is not None:
+            glyph_run_cache.multiline_text_draw(
+                self._draw,
+                (x, y_allday + y_pad),
+                wrapped_text,
+                font=fonts[fontsz_allday],
+                fill=Color.BLACK,
+                spacing=2,
+            )
+
+        # Temperature field - right justified
+        if data.temperature is not None:
+            fontsz = "medium_small"
+            datastr = f"{data.temperature}°F"
+            text_width = text_layout_cache.bbox_get(datastr, fonts[fontsz])[2]
+            x_temp = Resolution.HORIZ - text_width - 20  # 20 pixels padding from right edge
+            glyph_run_cache.text_draw(
+                self._draw,
+                (x_temp, y_allday + y_pad), datastr, font=fonts[fontsz], fill=Color.BLACK
+            )
+
+        TimeGrid(
+            draw=self._draw,
+            weather=weather,
+            calendar=cal_timed,
+            **grid,
         )
 
         # Footer
@@ -178,27 +248,41 @@ class RendererCalendarOutlook(RendererBase):
         self.render_footer(
             device=device,
             width=Resolution.HORIZ,
-            y=Resolution.VERT - fonts[fontsz].getbbox("X")[3] - bottom_margin + y_pad,
+            y=y_footer,
             device_ip=data.ipaddr,
         )
 
         # Generate PNG
         self._image.save(filename, "PNG")
 
+        return fingerprint_new
 
-def TimeGrid(
+
+def TimeGridStart() -> dt.datetime:
+    """
+    Returns the start of the current hour, the first row of the time grid.
+    """
+
+    tz = dt.datetime.now().astimezone().tzinfo
+    now = dt.datetime.now(tz=tz)
+    if DEBUG:
+        now = DEBUG_NOW
+
+    return now.replace(minute=0, second=0, microsecond=0)
+
+
+def TimeGridStatic(
     draw: ImageDraw = None,
-    weather: Weather = None,
-    calendar: CalendarOutlook = None,
     timeframe_hours: int = 6,
     x_base: int = 0,
     y_base: int = 0,
     width: int = 100,
     height: int = 100,
-) -> None:
+    start: dt.datetime = None,
+) -> int:
     """
-    Draws a grid of calendar events and weather conditions
-    for the next few hours
+    Draws the static part of the time grid: row lines, mid lines and
+    hour labels.  Returns the x position of the mid lines.
     """
 
     # Layout constants
@@ -213,12 +297,9 @@ def TimeGrid(
     # Draw the grid
     y = y_base
     fontsz = "small"
-    tz = dt.datetime.now().astimezone().tzinfo
-    now = dt.datetime.now(tz=tz)
-    if DEBUG:
-        now = DEBUG_NOW
+    if start is None:
+        start = TimeGridStart()
 
-    now = now.replace(minute=0, second=0, microsecond=0)
     for i in range(timeframe_hours):
         # Top Line
         draw.line((x_base + x_pad, y, x_base + width - x_pad, y),
@@ -227,15 +308,16 @@ def TimeGrid(
                   )
 
         # Hour string
-        hour = now + dt.timedelta(hours=i)
+        hour = start + dt.timedelta(hours=i)
         hour_str = hour.strftime("%-I %p")
-        draw.text(
+        glyph_run_cache.text_draw(
+            draw,
             (x_base + 3 * x_pad, y + y_pad),
             hour_str,
             font=fonts[fontsz],
             fill=Color.BLACK,
         )
-        x_offset = fonts[fontsz].getbbox(hour_str)[2] + 2 * x_pad
+        x_offset = text_layout_cache.bbox_get(hour_str, fonts[fontsz])[2] + 2 * x_pad
 
         # Mid line
         y_mid = y + row_height / 2
@@ -244,7 +326,57 @@ def TimeGrid(
                 #   fill=Color.GRAY_LIGHT
                   )
 
-        # Weather forecast
+        y += row_height
+
+    # Bottom line
+    draw.line((x_base + x_pad, y, x_base + width - x_pad, y),
+              fill=Color.BLACK
+            #   fill=Color.GRAY_MID
+              )
+
+    return x_offset
+
+
+def TimeGrid(
+    draw: ImageDraw = None,
+    weather: Weather = None,
+    calendar: CalendarOutlook = None,
+    timeframe_hours: int = 6,
+    x_base: int = 0,
+    y_base: int = 0,
+    width: int = 100,
+    height: int = 100,
+    start: dt.datetime = None,
+) -> None:
+    """
+    Draws a grid of calendar events and weather conditions
+    for the next few hours.  The grid lines and hour labels are
+    drawn by TimeGridStatic.
+    """
+
+    # Layout constants
+    x_pad = 5
+    y_pad = 3
+    width_weather = 100
+    x_weather = x_base + width - width_weather
+
+    # Size the rows for hours
+    row_height = height / timeframe_hours
+
+    fontsz = "small"
+    tz = dt.datetime.now().astimezone().tzinfo
+    if start is None:
+        start = TimeGridStart()
+    now = start
+
+    # Event x position follows the last hour label, as in TimeGridStatic.
+    hour_str = (now + dt.timedelta(hours=timeframe_hours - 1)).strftime("%-I %p")
+    x_offset = text_layout_cache.bbox_get(hour_str, fonts[fontsz])[2] + 2 * x_pad
+
+    # Weather forecast
+    y = y_base
+    for i in range(timeframe_hours):
+        hour = now + dt.timedelta(hours=i)
         if weather is not None and not DEBUG:
             weather.Render(
                 draw=draw,
@@ -257,11 +389,13 @@ def TimeGrid(
 
         y += row_height
 
-    # Bottom line
-    draw.line((x_base + x_pad, y, x_base + width - x_pad, y),
-              fill=Color.BLACK
-            #   fill=Color.GRAY_MID
-              )
+        # Icons may reach over the line below the row, which was always
+        # drawn over them.
+        if weather is not None and not DEBUG:
+            draw.line((x_base + x_pad, y, x_base + width - x_pad, y),
+                      fill=Color.BLACK
+                    #   fill=Color.GRAY_MID
+                      )
 
     # Draw in events
     if calendar.upcoming is None:
@@ -361,12 +495,12 @@ def TimeGrid(
         # Draw white background behind text to cover hatching
         text_x = x_event + x_pad
         text_y = y_start + 1
-        text_bbox = draw.multiline_textbbox(
-            (text_x, text_y),
+        text_bbox = text_layout_cache.layout_get(
             text,
-            font=fonts[fontsz],
+            fonts[fontsz],
             spacing=2,
-        )
+            fontmode=draw.fontmode,
+        ).bbox_at((text_x, text_y))
         # Add small padding around text
         text_padding = 2
         draw.rectangle(
@@ -375,11 +509,11 @@ def TimeGrid(
             fill=Color.WHITE,
         )
 
-        draw.multiline_text(
+        glyph_run_cache.multiline_text_draw(
+            draw,
             (text_x, text_y),
             text,
             font=fonts[fontsz],
             fill=Color.BLACK,
-            align="left",
             spacing=2,
         )
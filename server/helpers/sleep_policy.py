@@ -0,0 +1,151 @@
+# sleep_policy.py
+# Sleep delays that wake a device when its frame will next change.
+
+import datetime as dt
+import hashlib
+import logging
+from typing import Iterable
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+
+# Longest sleep when nothing on the frame is due to change.  Catches
+# changes no render input predicts, e.g. events added to a calendar.
+SLEEP_MAX = dt.timedelta(hours=1)
+
+# Wake this long after a change so the pre-render, scheduled a minute
+# before the wake, already sees it.
+WAKE_MARGIN = dt.timedelta(minutes=2)
+
+# Window device wakes on the same schedule are spread over, each device
+# at its own fixed offset.  Keeps a fleet from waking, and pre-rendering,
+# in the same second.
+JITTER_WINDOW = dt.timedelta(minutes=5)
+
+
+def change_times(times: Iterable[dt.datetime], now: dt.datetime = None) -> tuple:
+    """
+    Normalizes the instants a frame changes at.
+
+    Args:
+        times (Iterable[datetime.datetime]): Instants, naive local or
+            timezone aware.  None entries are skipped.
+        now (datetime.datetime, optional): Current local time. Defaults to now.
+
+    Returns:
+        tuple: Future instants as naive local times, sorted, no duplicates.
+
+    Example:
+        >>> now = dt.datetime(2025, 3, 4, 9, 20)
+        >>> change_times([dt.datetime(2025, 3, 4, 10), dt.datetime(2025, 3, 4, 9)], now)
+        (datetime.datetime(2025, 3, 4, 10, 0),)
+    """
+
+    if now is None:
+        now = dt.datetime.now()
+
+    changes = set()
+    for time in times:
+        if time is None:
+            continue
+        if time.tzinfo is not None:
+            time = time.astimezone().replace(tzinfo=None)
+        if time > now:
+            changes.add(time)
+
+    return tuple(sorted(changes))
+
+
+def boundary_next(resolution: dt.timedelta, now: dt.datetime = None) -> dt.datetime:
+    """
+    Returns the next multiple of a time resolution, e.g. the next hour.
+
+    Args:
+        resolution (datetime.timedelta): Resolution.
+        now (datetime.datetime, optional): Current local time. Defaults to now.
+
+    Returns:
+        datetime.datetime: Next boundary after `now`.
+
+    Example:
+        >>> boundary_next(dt.timedelta(hours=1), dt.datetime(2025, 3, 4, 9, 20))
+        datetime.datetime(2025, 3, 4, 10, 0)
+    """
+
+    if now is None:
+        now = dt.datetime.now()
+
+    return dt.datetime.min + ((now - dt.datetime.min) // resolution + 1) * resolution
+
+
+def phase_offset(device: str, window: dt.timedelta = None) -> dt.timedelta:
+    """
+    Returns a device's wake offset within the jitter window.
+
+    The offset is derived from the device name, so it is the same across
+    wakes and restarts and devices spread evenly over the window.
+
+    Args:
+        device (str): Device name.
+        window (datetime.timedelta, optional): Jitter window. Defaults to
+            JITTER_WINDOW.
+
+    Returns:
+        datetime.timedelta: Offset, whole seconds less than the window.
+
+    Example:
+        >>> phase_offset("kitchen")
+        datetime.timedelta(seconds=115)
+    """
+
+    if window is None:
+        window = JITTER_WINDOW
+
+    seconds = int(window.total_seconds())
+    if seconds <= 0:
+        return dt.timedelta(0)
+
+    digest = hashlib.blake2b(device.encode(), digest_size=8).digest()
+
+    return dt.timedelta(seconds=int.from_bytes(digest, "big") % seconds)
+
+
+def delay_get(
+    changes: Iterable[dt.datetime],
+    sleep_max: dt.timedelta = SLEEP_MAX,
+    now: dt.datetime = None,
+) -> dt.timedelta:
+    """
+    Returns the sleep delay until a device's frame next changes.
+
+    Args:
+        changes (Iterable[datetime.datetime]): Instants the frame changes
+            at, naive local times as from `change_times`.
+        sleep_max (datetime.timedelta, optional): Longest delay.
+            Defaults to SLEEP_MAX.
+        now (datetime.datetime, optional): Current local time. Defaults to now.
+
+    Returns:
+        datetime.timedelta: Delay to the next change plus WAKE_MARGIN,
+            at most `sleep_max`.
+
+    Example:
+        >>> now = dt.datetime(2025, 3, 4, 9, 20)
+        >>> delay_get([dt.datetime(2025, 3, 4, 10)], now=now)
+        datetime.timedelta(seconds=2520)
+    """
+
+    if now is None:
+        now = dt.datetime.now()
+
+    upcoming = [time for time in changes if time > now]
+    if not upcoming:
+        logger.debug(f"No frame changes due, sleeping {sleep_max}")
+        return sleep_max
+
+    change = min(upcoming)
+    delay = min(change - now + WAKE_MARGIN, sleep_max)
+    logger.debug(f"Next frame change: {change}, sleeping {delay}")
+
+    return delay
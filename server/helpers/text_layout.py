@@ -0,0 +1,473 @@
+# text_layout.py
+# Text wrapping for rendering with PIL.
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from PIL import ImageFont
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+
+
+class TextWrapper:
+    """
+    Wraps text into a box for one font and font mode.
+
+    Produces the same line breaks as measuring the whole string with
+    `ImageDraw.multiline_textbbox` after every word, but measures each
+    candidate line once and tracks the multiline bounding box
+    arithmetically.  Line measurements are cached per wrapper, and
+    wrappers are shared per (font, font mode) via `from_font`.
+
+    Font mode matters: mode "1" images use monochrome hinting, which can
+    change glyph advances.
+    """
+
+    _wrappers = {}
+
+    # Maximum number of cached line measurements per wrapper.
+    LINE_CACHE_MAX = 4096
+
+    def __init__(self, font: ImageFont.FreeTypeFont = None, fontmode: str = "L"):
+        if font is None or not isinstance(font, ImageFont.FreeTypeFont):
+            raise ValueError("font parameter must be of type ImageFont.FreeTypeFont")
+
+        self._font = font
+        self._fontmode = fontmode
+        self._line_bboxes = {}
+
+    @classmethod
+    def from_font(
+        cls, font: ImageFont.FreeTypeFont, fontmode: str = "L"
+    ) -> "TextWrapper":
+        """
+        Returns the shared wrapper for a font and font mode.
+
+        Args:
+            font (ImageFont.FreeTypeFont): Font.
+            fontmode (str, optional): Font mode of the drawing context,
+                `ImageDraw.fontmode`. Defaults to "L".
+
+        Returns:
+            TextWrapper: Shared wrapper.
+
+        Example:
+            >>> wrapper = TextWrapper.from_font(fonts["small"], draw.fontmode)
+            >>> wrapper is TextWrapper.from_font(fonts["small"], draw.fontmode)
+            True
+        """
+
+        # Fonts are long lived module level objects, and the wrapper holds
+        # a reference so the id is not reused.
+        key = (id(font), fontmode)
+        wrapper = cls._wrappers.get(key)
+        if wrapper is None:
+            wrapper = cls(font, fontmode)
+            cls._wrappers[key] = wrapper
+
+        return wrapper
+
+    @property
+    def font(self) -> ImageFont.FreeTypeFont:
+        """
+        Font used for measurement (read-only).
+        """
+
+        return self._font
+
+    @property
+    def fontmode(self) -> str:
+        """
+        Font mode used for measurement (read-only).
+        """
+
+        return self._fontmode
+
+    def line_bbox_get(self, line: str) -> tuple:
+        """
+        Bounding box of a single line of text drawn at (0, 0).
+
+        Args:
+            line (str): Text without newlines.
+
+        Returns:
+            tuple: (left, top, right, bottom) in pixels.
+
+        Example:
+            >>> wrapper.line_bbox_get("Hello world")
+            (0, 3, 82, 14)
+        """
+
+        bbox = self._line_bboxes.get(line)
+        if bbox is None:
+            if len(self._line_bboxes) >= self.LINE_CACHE_MAX:
+                self._line_bboxes.clear()
+
+            bbox = self._font.getbbox(line, self._fontmode)
+            self._line_bboxes[line] = bbox
+
+        return bbox
+
+    def line_spacing_get(self, spacing: float = 4) -> float:
+        """
+        Distance between line tops, as used by `ImageDraw.multiline_text`.
+
+        Args:
+            spacing (float, optional): Extra spacing between lines. Defaults to 4.
+
+        Returns:
+            float: Line pitch in pixels.
+
+        Example:
+            >>> wrapper.line_spacing_get(2)
+            16
+        """
+
+        return self.line_bbox_get("A")[3] + spacing
+
+    def text_bbox_get(self, text: str, spacing: float = 4) -> tuple:
+        """
+        Bounding box of (possibly multiline) text drawn at (0, 0).
+        Matches `ImageDraw.multiline_textbbox` with left alignment.
+
+        Args:
+            text (str): Text, lines separated by newlines.
+            spacing (float, optional): Extra spacing between lines. Defaults to 4.
+
+        Returns:
+            tuple: (left, top, right, bottom) in pixels.
+
+        Example:
+            >>> wrapper.text_bbox_get("Hello\\nworld", spacing=2)
+            (0, 3, 41, 30)
+        """
+
+        if "\n" not in text:
+            return self.line_bbox_get(text)
+
+        line_spacing = self.line_spacing_get(spacing)
+        bbox = None
+        y_line = 0
+        for line in text.split("\n"):
+            l, t, r, b = self.line_bbox_get(line)
+            t += y_line
+            b += y_line
+            if bbox is None:
+                bbox = (l, t, r, b)
+            else:
+                bbox = (min(bbox[0], l), min(bbox[1], t), max(bbox[2], r), max(bbox[3], b))
+            y_line += line_spacing
+
+        return bbox
+
+    def box_fill(
+        self,
+        text: str = "",
+        width: int = 100,
+        height: int = 50,
+        spacing: float = 2,
+    ) -> str:
+        """
+        Fills a box with left justified text, wrapping and truncating as necessary.
+        Will write a minimum of 1 line and 1 word.
+        All size information in image pixels.
+
+        Args:
+            text (str): Text to wrap. Defaults to ''.
+            width (int, optional): Box width. Defaults to 100.
+            height (int, optional): Box height. Defaults to 50.
+            spacing (float): Spacing between lines. Defaults to 2.
+
+        Raises:
+            ValueError: If a single word does not fit the box width.
+
+        Returns:
+            str: Text with newlines inserted.
+
+        Example:
+            >>> wrapper.box_fill("Weekly project sync with the team", width=80, height=40)
+            'Weekly\\nproject\\nsync with\\n'
+        """
+
+        words = text.split()
+        word_cnt_total = len(words)
+        word_cnt_cur = 0
+        line_spacing = self.line_spacing_get(spacing)
+
+        # Completed lines, the line being filled, and the union of the
+        # completed line boxes.  The full text is "\n".join(lines + [line]).
+        lines = []
+        line = ""
+        done = None
+        y_line = 0
+
+        def bbox_union(a: tuple, b: tuple) -> tuple:
+            if a is None:
+                return b
+            return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+        def bbox_text(line: str) -> tuple:
+            # Multiline box of the completed lines plus this line.
+            bbox = self.line_bbox_get(line)
+            bbox = (bbox[0], bbox[1] + y_line, bbox[2], bbox[3] + y_line)
+            return bbox_union(done, bbox)
+
+        def lines_set(text: str) -> None:
+            # Rebuild line state from a full text string.
+            nonlocal lines, line, done, y_line
+            parts = text.split("\n")
+            lines = []
+            done = None
+            y_line = 0
+            for part in parts[:-1]:
+                done = bbox_text(part)
+                lines.append(part)
+                y_line += line_spacing
+            line = parts[-1]
+
+        while word_cnt_cur < word_cnt_total:
+            # Try to add words to this line.
+            first_word_of_line = True
+            while True:
+                bbox = bbox_text(line)
+                if bbox[2] - bbox[0] > width:
+                    break
+
+                if first_word_of_line:
+                    line += words[word_cnt_cur]
+                    first_word_of_line = False
+                else:
+                    line += " " + words[word_cnt_cur]
+
+                word_cnt_cur += 1
+
+                # If we added all the words, we're done.
+                if word_cnt_cur == word_cnt_total:
+                    bbox = bbox_text(line)
+                    if bbox[2] - bbox[0] <= width:
+                        return "\n".join(lines + [line])
+
+            # Drop the last word added & add a newline.
+            # A single word that is too wide leaves no space on the current
+            # line, in which case the original rsplit reached back into
+            # earlier lines.  Keep that behavior.
+            if " " in line:
+                line = line.rsplit(" ", 1)[0]
+            else:
+                lines_set("\n".join(lines + [line]).rsplit(" ", 1)[0])
+            word_cnt_cur -= 1
+
+            done = bbox_text(line)
+            lines.append(line)
+            line = ""
+            y_line += line_spacing
+
+            bbox = bbox_text(line)
+            if bbox[2] - bbox[0] > width:
+                raise ValueError("Text too long for box width.")
+
+            # If we've exceeded the height, we're done.
+            if bbox[3] - bbox[1] > height:
+                break
+
+        return "\n".join(lines + [line])
+
+
+class TextLayout(NamedTuple):
+    """
+    Laid out text: the (wrapped) text and its bounding box at (0, 0).
+    """
+
+    text: str
+    bbox: tuple
+
+    def bbox_at(self, xy: tuple) -> tuple:
+        """
+        Bounding box with the text drawn at a position.
+
+        Args:
+            xy (tuple): (x, y) text position.
+
+        Returns:
+            tuple: (left, top, right, bottom) in pixels.
+
+        Example:
+            >>> TextLayout("Hi", (0, 3, 12, 14)).bbox_at((10, 20))
+            (10, 23, 22, 34)
+        """
+
+        x, y = xy
+        return (self.bbox[0] + x, self.bbox[1] + y, self.bbox[2] + x, self.bbox[3] + y)
+
+
+class TextLayoutCache:
+    """
+    Bounded LRU cache of text layouts, shared across renders.
+
+    Keyed by (text, font, font mode, width, height, spacing).  Day headers,
+    hour labels, footer strings and most event summaries repeat from one
+    render to the next, so their wrapping and measurement is done once.
+    """
+
+    def __init__(self, size_max: int = 1024):
+        self._layouts = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+        self.size_max = size_max
+
+    @property
+    def size_max(self) -> int:
+        """
+        Maximum number of layouts held before eviction.
+
+        Returns:
+            int: Maximum number of entries.
+        """
+
+        return self._size_max
+
+    @size_max.setter
+    def size_max(self, value: int) -> None:
+        if not isinstance(value, int):
+            raise TypeError(f"Cache size must be an integer, got {type(value)}")
+        if value < 1:
+            raise ValueError(f"Cache size must be >= 1, got {value}")
+
+        self._size_max = value
+
+    @property
+    def hits(self) -> int:
+        """
+        Number of lookups served from the cache.
+        """
+
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """
+        Number of lookups that required layout.
+        """
+
+        return self._misses
+
+    def __len__(self) -> int:
+        return len(self._layouts)
+
+    def layout_get(
+        self,
+        text: str,
+        font: ImageFont.FreeTypeFont,
+        width: int = None,
+        height: int = None,
+        spacing: float = 4,
+        fontmode: str = "",
+    ) -> TextLayout:
+        """
+        Returns the layout of text, wrapped to a box if width is given.
+
+        Args:
+            text (str): Text.
+            font (ImageFont.FreeTypeFont): Font.
+            width (int, optional): Box width to wrap to. Defaults to None, no wrapping.
+            height (int, optional): Box height to truncate to. Required with width.
+            spacing (float, optional): Spacing between lines. Defaults to 4.
+            fontmode (str, optional): Font mode, `ImageDraw.fontmode` for
+                drawing context measurements, "" for `font.getbbox`. Defaults to "".
+
+        Raises:
+            ValueError: If wrapping and a single word does not fit the box width.
+
+        Returns:
+            TextLayout: Text and bounding box.
+
+        Example:
+            >>> text_layout_cache.layout_get("9 AM", fonts["small"]).bbox
+            (0, 4, 36, 14)
+        """
+
+        key = (text, id(font), fontmode, width, height, spacing)
+        with self._lock:
+            layout = self._layouts.get(key)
+            if layout is not None:
+                self._layouts.move_to_end(key)
+                self._hits += 1
+                return layout
+
+            self._misses += 1
+
+        wrapper = TextWrapper.from_font(font, fontmode)
+        if width is not None:
+            text = wrapper.box_fill(text=text, width=width, height=height, spacing=spacing)
+        layout = TextLayout(text, wrapper.text_bbox_get(text, spacing=spacing))
+
+        with self._lock:
+            self._layouts[key] = layout
+            self._layouts.move_to_end(key)
+            while len(self._layouts) > self._size_max:
+                self._layouts.popitem(last=False)
+
+        return layout
+
+    def bbox_get(
+        self, text: str, font: ImageFont.FreeTypeFont, fontmode: str = ""
+    ) -> tuple:
+        """
+        Cached equivalent of `font.getbbox(text)`.
+
+        Args:
+            text (str): Single line of text.
+            font (ImageFont.FreeTypeFont): Font.
+            fontmode (str, optional): Font mode. Defaults to "".
+
+        Returns:
+            tuple: (left, top, right, bottom) in pixels.
+
+        Example:
+            >>> text_layout_cache.bbox_get("Today", fonts["medium_small"])[3]
+            21
+        """
+
+        return self.layout_get(text, font, fontmode=fontmode).bbox
+
+    def clear(self) -> None:
+        """
+        Drops all cached layouts and resets hit/miss counters.
+        """
+
+        with self._lock:
+            self._layouts.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def to_dict(self) -> dict:
+        """
+        Returns cache statistics.
+
+        Returns:
+            dict: Entry count, maximum size, hits, misses and hit rate.
+
+        Example:
+            >>> text_layout_cache.to_dict()["size_max"]
+            1024
+        """
+
+        lookups = self._hits + self._misses
+        return {
+            "size": len(self._layouts),
+            "size_max": self._size_max,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+        }
+
+
+# Process wide layout cache shared by all renderers.
+text_layout_cache = TextLayoutCache()
+
@@ -0,0 +1,197 @@
+# wake_arrivals.py
+# Observed device arrival times, for timing frame pre-renders.
+
+import datetime as dt
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+# Logging config
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+
+# Arrival offsets kept per device.
+ARRIVAL_HISTORY = 50
+
+# Offsets needed before they move the pre-render.
+ARRIVAL_SAMPLES_MIN = 5
+
+# Percentile of the arrival offset the frame is ready for.  Low, so the
+# frame is ready for all but the earliest arrivals.
+ARRIVAL_PERCENTILE = 10
+
+# Time a render is given before the device is expected.
+PRERENDER_LEAD = dt.timedelta(minutes=1)
+
+
+class WakeArrivals:
+    """
+    Learns when each device actually arrives after a sleep.
+
+    When a device is handed a sleep delay it is expected back at the end
+    of it.  Wi-Fi join time, RTC drift and battery state move the real
+    arrival, the offset from the expected time is kept per device.  The
+    pre-render is scheduled at a low percentile of the recent offsets, so
+    the frame is ready just before the device, with data as fresh as it
+    can be.
+
+    Each arrival also records whether a fresh pre-rendered frame was
+    waiting, the "ready before arrival" hit rate.
+    """
+
+    def __init__(self):
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def _device_get(self, device: str) -> dict:
+        return self._devices.setdefault(
+            device,
+            {
+                "expected": None,
+                "since": None,
+                "offsets": deque(maxlen=ARRIVAL_HISTORY),
+                "hits": 0,
+                "misses": 0,
+            },
+        )
+
+    def expect(self, device: str, time: dt.datetime) -> None:
+        """
+        Records when a device is expected back.
+
+        Args:
+            device (str): Device name.
+            time (datetime.datetime): Expected arrival.
+        """
+
+        with self._lock:
+            state = self._device_get(device)
+            state["expected"] = time
+            state["since"] = dt.datetime.now()
+
+    def arrive(self, device: str, time: dt.datetime, frame_time: dt.datetime = None) -> None:
+        """
+        Records a device's arrival.
+
+        Args:
+            device (str): Device name.
+            time (datetime.datetime): Arrival time.
+            frame_time (datetime.datetime, optional): Render time of the
+                fresh frame waiting for the device, None if there was none.
+                Defaults to None.
+
+        Example:
+            >>> wake_arrivals.expect("kitchen", dt.datetime(2025, 3, 4, 10, 2))
+            >>> wake_arrivals.arrive("kitchen", dt.datetime(2025, 3, 4, 10, 2, 9))
+            >>> wake_arrivals.to_dict()["kitchen"]["samples"]
+            1
+        """
+
+        with self._lock:
+            state = self._device_get(device)
+            expected = state["expected"]
+            if expected is None:
+                return
+
+            offset = (time - expected).total_seconds()
+            state["offsets"].append(offset)
+
+            # Ready if rendered for this wake, not left over from the last.
+            if frame_time is not None and frame_time >= state["since"]:
+                state["hits"] += 1
+            else:
+                state["misses"] += 1
+
+            state["expected"] = None
+
+        logger.debug(f"Arrival of {device}: {offset:+.1f} seconds from expected")
+
+    def offset_get(self, device: str, percentile: float = ARRIVAL_PERCENTILE) -> dt.timedelta:
+        """
+        Returns a percentile of a device's recent arrival offsets.
+
+        Args:
+            device (str): Device name.
+            percentile (float, optional): Percentile. Defaults to
+                ARRIVAL_PERCENTILE.
+
+        Returns:
+            datetime.timedelta: Offset, negative for early.  Zero with
+                fewer than ARRIVAL_SAMPLES_MIN arrivals.
+        """
+
+        with self._lock:
+            state = self._devices.get(device)
+            offsets = list(state["offsets"]) if state else []
+
+        if len(offsets) < ARRIVAL_SAMPLES_MIN:
+            return dt.timedelta(0)
+
+        return dt.timedelta(seconds=float(np.percentile(offsets, percentile)))
+
+    def prerender_time_get(self, device: str, expected: dt.datetime) -> dt.datetime:
+        """
+        Returns when to pre-render for a device expected back at a time.
+
+        Args:
+            device (str): Device name.
+            expected (datetime.datetime): Expected arrival.
+
+        Returns:
+            datetime.datetime: Pre-render time.
+
+        Example:
+            >>> wake_arrivals.prerender_time_get("kitchen", dt.datetime(2025, 3, 4, 11, 2))
+            datetime.datetime(2025, 3, 4, 11, 1)
+        """
+
+        return expected + self.offset_get(device) - PRERENDER_LEAD
+
+    def clear(self, device: str = None) -> None:
+        """
+        Forgets the arrivals of a device, or all devices.
+
+        Args:
+            device (str, optional): Device name, None for all. Defaults to None.
+        """
+
+        with self._lock:
+            if device is None:
+                self._devices.clear()
+            else:
+                self._devices.pop(device, None)
+
+    def to_dict(self) -> dict:
+        """
+        Returns arrival statistics per device.
+
+        Returns:
+            dict: Per device arrivals, offset percentile and median in
+                seconds, frames ready, missed, and the hit rate.
+        """
+
+        with self._lock:
+            devices = {
+                device: (list(state["offsets"]), state["hits"], state["misses"])
+                for device, state in self._devices.items()
+            }
+
+        stats = {}
+        for device, (offsets, hits, misses) in devices.items():
+            arrivals = hits + misses
+            stats[device] = {
+                "samples": len(offsets),
+                "offset": float(np.percentile(offsets, ARRIVAL_PERCENTILE)) if offsets else 0.0,
+                "median": float(np.median(offsets)) if offsets else 0.0,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / arrivals if arrivals else 0.0,
+            }
+
+        return stats
+
+
+# Process wide arrival tracker.
+wake_arrivals = WakeArrivals()
@@ -10,7 +10,10 @@ from nicegui import ui
 from typing import Union
 
 import paths
+from battery_model import battery_models
+from frame_cache import frame_cache
 from renderer import RendererBase
+import sleep_policy
 from db import DB, DeviceState
 
 logger = logging.getLogger(__name__)
@@ -143,6 +146,8 @@ class DeviceItem(ItemBase):
         self._sleep_delay_enabled = True
         self._sleep_delay = dt.timedelta(hours=1)
         self._sleep_delay_fcn = None
+        self._sleep_until_change = False
+        self._battery_runtime_target = None
 
         self._name = name
 
@@ -172,6 +177,9 @@ class DeviceItem(ItemBase):
             "sleep_delay_enabled": self.sleep_delay_enabled,
             "sleep_delay": int(self.sleep_delay.total_seconds()),
             "sleep_delay_fcn": fcn,
+            "sleep_until_change": self.sleep_until_change,
+            "sleep_phase": int(self.sleep_phase.total_seconds()),
+            "battery_runtime_target": str(self.battery_runtime_target),
         }
 
     @property
@@ -225,6 +233,14 @@ class DeviceItem(ItemBase):
         """
         Device sleep delay.
 
+        With `sleep_until_change`, the delay runs to the next instant the
+        device's frame changes, at most the configured delay.  With a
+        `battery_runtime_target` the delay is stretched when the battery
+        would not last until then.
+
+        Delays from a delay function or frame changes fall on shared
+        boundaries, they are shifted by the device's `sleep_phase`.
+
         Returns:
             datetime.timedelta: Sleep time delay.
         """
@@ -233,9 +249,39 @@ class DeviceItem(ItemBase):
             return dt.timedelta(seconds=0)
 
         if self._sleep_delay_fcn:
-            return self._sleep_delay_fcn()
+            delay = self._sleep_delay_fcn()
+        else:
+            delay = self._sleep_delay
+
+        if self._sleep_until_change:
+            frame = frame_cache.frame_get(self.text, fresh=False)
+            if frame is not None:
+                delay = sleep_policy.delay_get(frame.changes, sleep_max=delay)
+
+        if self._battery_runtime_target:
+            multiplier = battery_models.delay_multiplier_get(
+                self.text, delay, self._battery_runtime_target
+            )
+            if multiplier > 1:
+                logger.debug(f"Battery low for {self.text}, delay x{multiplier:.2f}")
+                delay *= multiplier
+
+        if self._sleep_delay_fcn or self._sleep_until_change:
+            delay += self.sleep_phase
+
+        return delay
+
+    @property
+    def sleep_phase(self) -> dt.timedelta:
+        """
+        Offset of the device's wakes within the jitter window, see
+        sleep_policy.phase_offset.
+
+        Returns:
+            datetime.timedelta: Wake offset.
+        """
 
-        return self._sleep_delay
+        return sleep_policy.phase_offset(self.text)
 
     @sleep_delay.setter
     def sleep_delay(self, value: dt.timedelta) -> None:
@@ -247,6 +293,63 @@ class DeviceItem(ItemBase):
 
         self._sleep_delay = value
 
+    @property
+    def frame_ttl(self) -> dt.timedelta:
+        """
+        Time a rendered frame is served before rendering a new one.
+
+        Returns:
+            datetime.timedelta: Frame time to live.
+        """
+
+        return frame_cache.ttl_get(self.text)
+
+    @frame_ttl.setter
+    def frame_ttl(self, value: dt.timedelta) -> None:
+        if not isinstance(value, dt.timedelta):
+            raise TypeError("Frame TTL must be a datetime.timedelta object.")
+
+        if value.total_seconds() < 0:
+            raise ValueError("Frame TTL must not be negative.")
+
+        frame_cache.ttl_set(self.text, value)
+
+    @property
+    def sleep_until_change(self) -> bool:
+        """
+        Sleep until the device's frame changes, up to the sleep delay.
+
+        Returns:
+            bool: True if enabled, False otherwise.
+        """
+
+        return self._sleep_until_change
+
+    @sleep_until_change.setter
+    def sleep_until_change(self, value: bool) -> None:
+        if not isinstance(value, bool):
+            raise TypeError("Sleep until change must be a boolean.")
+
+        self._sleep_until_change = value
+
+    @property
+    def battery_runtime_target(self) -> dt.timedelta:
+        """
+        Battery runtime the device should reach from now, None for no target.
+
+        Returns:
+            datetime.timedelta: Runtime target.
+        """
+
+        return self._battery_runtime_target
+
+    @battery_runtime_target.setter
+    def battery_runtime_target(self, value: dt.timedelta) -> None:
+        if value is not None and not isinstance(value, dt.timedelta):
+            raise TypeError("Battery runtime target must be a datetime.timedelta object.")
+
+        self._battery_runtime_target = value
+
     @property
     def sleep_delay_enabled(self) -> bool:
         """
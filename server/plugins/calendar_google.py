@@ -12,21 +12,25 @@
 from calendar_base import CalendarBase, EventBase
 import datetime as dt
 import os
-from glob import glob
 import os.path
 from typing import Union
 import logging
 import json
+import threading
 
 from nicegui import ui, APIRouter, app
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.errors import HttpError
 
 import theme
+from calendar_fetch import calendar_fetcher
+from calendar_sync import CalendarStore
+from frame_cache import frame_cache
+from google_service import google_service
 from plugin_base import PluginBase, MenuItem
+from string_filters import StringFilterManager
 
 # Logging config
 logger = logging.getLogger(__name__)
@@ -45,49 +49,105 @@ mnu.sort_order = 40
 plugin = PluginBase()
 plugin += mnu
 
+# Per thread HTTP clients, httplib2 isn't thread safe.
+_http_local = threading.local()
 
-class CalendarGoogle(CalendarBase):
-    def __init__(self, test: bool = False):
-        super().__init__(test=test)
+# Local copy of the calendars' events, kept up to date by incremental syncs.
+google_events = CalendarStore("google-events.json")
 
-        if test:
-            return
+# Past and future events kept in the local store, from midnight today.
+# Queries reaching outside go to the API.  Renders show the week ahead.
+SYNC_PAST = dt.timedelta(days=1)
+SYNC_FUTURE = dt.timedelta(days=14)
 
-        # If modifying these scopes, delete the file token.json.
-        SCOPES = ["https://www.googleapis.com/auth/calendar.readonly"]
-        TOKEN_FILE = "google-token.json"
-        CREDENTIALS_FILE = "google-credentials.json"
 
-        self._creds = None
-        # The file token.json stores the user's access and refresh tokens, and is
-        # created automatically when the authorization flow completes for the first
-        # time.
-        if os.path.exists(TOKEN_FILE):
-            self._creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+def string_filters_get() -> StringFilterManager:
+    """
+    Returns the event summary filters.
+
+    The server sets them on the app at startup.  Renders run in worker
+    processes where the app was never set up, so there they are loaded
+    from the filter file.
+
+    Returns:
+        StringFilterManager: Filters.
+    """
+
+    fm = getattr(app, "string_filter_manager", None)
+    if fm is not None:
+        return fm
+
+    fm = StringFilterManager()
+    filter_file = os.path.join(os.getcwd(), "string-filters.json")
+    if os.path.exists(filter_file):
+        fm.load(filename=filter_file)
+
+    return fm
 
-            # Handle credential expiry
-            try:
-                if self._creds and self._creds.expired and self._creds.refresh_token:
-                    self._creds.refresh(Request())
 
-                # Save the refreshed credentials to the token file
-                if self._creds:
-                    with open(TOKEN_FILE, "w") as token:
-                        token.write(self._creds.to_json())
-            except Exception as e:
-                logger.warning(f"Error refreshing credentials: {e}")
-                os.remove(TOKEN_FILE)
+def item_time(value: dict, tz: dt.tzinfo) -> dt.datetime:
+    """
+    Converts an event item start or end to naive local time.
+
+    Args:
+        value (dict): Item "start" or "end", with a "date" for all-day
+            events, else a "dateTime".
+        tz (datetime.tzinfo): Local timezone.
+
+    Returns:
+        datetime.datetime: Time.
+    """
+
+    time = value.get("date")
+    if not time:
+        time = value.get("dateTime").replace("Z", "+00:00")
+
+    # Convert to local timezone, then drop timezones.
+    return dt.datetime.fromisoformat(time).astimezone(tz).replace(tzinfo=None)
+
+
+def event_from_item(item: dict, tz: dt.tzinfo, fm: StringFilterManager) -> EventBase:
+    """
+    Converts an event item from the API to an event.
+
+    Args:
+        item (dict): Event item.
+        tz (datetime.tzinfo): Local timezone.
+        fm (StringFilterManager): Summary filters.
+
+    Returns:
+        EventBase: Event in naive local time, or None if the filtered
+            summary is empty.
+    """
 
-        # If there are no (valid) credentials available, let the user log in.
-        if not self._creds or not self._creds.valid:
-            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
-            self._creds = flow.run_local_server(port=0)
+    # Determine if event is all day
+    all_day = bool(item.get("start").get("date"))
+    start = item_time(item.get("start"), tz)
+    end = item_time(item.get("end"), tz)
 
-            # Save the credentials for the next run
-            with open(TOKEN_FILE, "w") as token:
-                token.write(self._creds.to_json())
+    summary = item.get("summary", "").strip()
+    summary = fm.apply(summary)
+    if len(summary) == 0:
+        return None
 
-        self._service = build("calendar", "v3", credentials=self._creds)
+    return EventBase(
+        summary=summary,
+        start=start,
+        end=end,
+        all_day=all_day,
+    )
+
+
+class CalendarGoogle(CalendarBase):
+    def __init__(self, test: bool = False):
+        super().__init__(test=test)
+
+        if test:
+            return
+
+        # Credentials and client are shared by the process.
+        self._creds = google_service.credentials_get()
+        self._service = google_service.service_get()
 
         # Stored data
         self._events = None
@@ -117,84 +177,299 @@ class CalendarGoogle(CalendarBase):
         if not isinstance(date, dt.datetime):
             raise TypeError("Date must be a datetime object")
 
-        # Start and end times for date
-        timezone = dt.datetime.now().astimezone().tzinfo
-        date = dt.datetime(date.year, date.month, date.day, tzinfo=timezone)
-        # print(f"Local timezone: {timezone}")
-        t_start = date.replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
-        t_end = date.replace(
-            hour=23, minute=59, second=59, microsecond=999999
-        ).isoformat()
+        self.events_range_query(start=date, days=1)
+        self.sort()
+
+    def events_range_query(self, start: dt.datetime, days: int = 7) -> dict:
+        """
+        Returns the events over a range of days, from the local store.
+        The active calendars are synced first, pulling only the events
+        changed since their last sync.  Ranges reaching outside the store
+        are queried from the API, one request per calendar.  The events
+        are added to the calendar.
+
+        Args:
+            start (datetime.datetime): First day of the range.
+            days (int, optional): Number of days. Defaults to 7.
+
+        Returns:
+            dict: Events by day.  Keys are the datetime.date of every day in
+                the range, values lists of events sorted by start time.
+                Events spanning several days, e.g. all-day events, are
+                listed on each day they cover.
+
+        Example:
+            >>> by_day = cal.events_range_query(dt.datetime(2025, 3, 3), days=7)
+            >>> sorted(by_day)[-1]
+            datetime.date(2025, 3, 9)
+        """
 
-        # print(f"t_start: {t_start}")
-        # print(f"t_end: {t_end}")
+        if not isinstance(start, dt.datetime):
+            raise TypeError("Start must be a datetime object")
+        if not isinstance(days, int):
+            raise TypeError(f"Days must be an integer, got {type(days)}")
+        if days < 1:
+            raise ValueError(f"Days must be >= 1, got {days}")
 
         # Local timezone
         tz = dt.datetime.now().astimezone().tzinfo
 
-        # Grab events for each calendar
-        fm = app.string_filter_manager
-        for cal_name in self._calendars:
-            if self._calendars[cal_name]["active"] is False:
-                continue
+        # Start and end times for the range
+        t_start = dt.datetime(start.year, start.month, start.day, tzinfo=tz)
+        t_end = t_start + dt.timedelta(days=days)
+        day_first = t_start.replace(tzinfo=None)
+        day_last = t_end.replace(tzinfo=None)
+
+        def items_get(calendar_id: str) -> list:
+            return self.items_query(calendar_id, t_start.isoformat(), t_end.isoformat())
+
+        # Grab events for each calendar, concurrently.
+        calendar_ids = [
+            values["id"]
+            for values in self._calendars.values()
+            if values["active"] is not False
+        ]
+        if day_first < self.sync_since_get() or day_last > self.sync_until_get():
+            results = calendar_fetcher.map("google", items_get, calendar_ids)
+        else:
+            results = self.items_sync(calendar_ids)
+
+        # Merge in calendar order, keeping the events in the range.
+        fm = string_filters_get()
+        events = []
+        for items in results:
+            for item in items:
+                evt = event_from_item(item, tz, fm)
+                if evt is None:
+                    continue
+                if evt.start < day_last and (evt.end > day_first or evt.start >= day_first):
+                    events.append(evt)
+
+        # Same order as the events list, start time then calendar.
+        events.sort(key=lambda x: x.start)
+        for evt in events:
+            self.add(evt)
+
+        # Bucket by day, an event covers a day if it overlaps it.  As with
+        # the API, an event ending at midnight doesn't cover the next day.
+        by_day = {}
+        for i in range(days):
+            day_start = dt.datetime(start.year, start.month, start.day) + dt.timedelta(days=i)
+            day_end = day_start + dt.timedelta(days=1)
+            by_day[day_start.date()] = [
+                evt
+                for evt in events
+                if evt.start < day_end and (evt.end > day_start or evt.start >= day_start)
+            ]
+
+        logger.debug(f"Queried {len(events)} events from {t_start} for {days} days")
+
+        return by_day
+
+    def items_query(self, calendar_id: str, t_start: str, t_end: str) -> list:
+        """
+        Queries one calendar for the raw event items in a time range,
+        following result pages.  Safe to call from several threads.
 
-            events_result = (
-                self._service.events()
-                .list(
-                    calendarId=self._calendars[cal_name]["id"],
-                    timeMin=t_start,
-                    timeMax=t_end,
-                    singleEvents=True,
-                    maxResults=9999,
-                    orderBy="startTime",
+        Args:
+            calendar_id (str): Calendar ID.
+            t_start (str): Range start, ISO format with timezone.
+            t_end (str): Range end, ISO format with timezone.
+
+        Returns:
+            list: Event items as returned by the API.
+        """
+
+        events = self._service.events()
+        request = events.list(
+            calendarId=calendar_id,
+            timeMin=t_start,
+            timeMax=t_end,
+            singleEvents=True,
+            maxResults=2500,
+            orderBy="startTime",
+        )
+
+        http = self.http_get()
+        items = []
+        while request is not None:
+            result = request.execute(http=http)
+            items.extend(result.get("items", []))
+            request = events.list_next(request, result)
+
+        return items
+
+    @staticmethod
+    def sync_since_get() -> dt.datetime:
+        """
+        Returns the start of the time range kept in the local store.
+
+        Returns:
+            datetime.datetime: Start, naive local time.
+        """
+
+        today = dt.datetime.today()
+        return dt.datetime(today.year, today.month, today.day) - SYNC_PAST
+
+    @staticmethod
+    def sync_until_get() -> dt.datetime:
+        """
+        Returns the end of the time range kept in the local store.
+
+        Returns:
+            datetime.datetime: End, naive local time.
+        """
+
+        today = dt.datetime.today()
+        return dt.datetime(today.year, today.month, today.day) + SYNC_FUTURE
+
+    def items_sync(self, calendar_ids: list) -> list:
+        """
+        Syncs calendars into the local store and returns their events.
+
+        With a sync token from the last sync only the events changed or
+        deleted since are pulled.  Without one, when Google rejects it as
+        expired (HTTP 410), or once a day as the store's time range moves
+        on, all events in the range are pulled.  The calendars are fetched
+        concurrently, then the store is updated once for all of them.
+
+        Args:
+            calendar_ids (list): Calendar IDs.
+
+        Returns:
+            list: Stored event items, a list per calendar in calendar order.
+
+        Example:
+            >>> [len(items) for items in cal.items_sync(["primary", "Family"])]
+            [42, 7]
+        """
+
+        since = self.sync_since_get()
+        until = self.sync_until_get()
+        tz = dt.datetime.now().astimezone().tzinfo
+
+        def fetch(calendar_id: str) -> tuple:
+            return self.items_fetch(calendar_id, since, until)
+
+        pending = list(calendar_ids)
+        while pending:
+            results = calendar_fetcher.map("google", fetch, pending)
+            retry = []
+            with google_events.batch():
+                for calendar_id, (full, changed, removed, token) in zip(pending, results):
+                    if full:
+                        google_events.replace(calendar_id, changed, token, since, until)
+                        logger.debug(f"Full sync of {calendar_id}: {len(changed)} events")
+                    elif not google_events.apply(calendar_id, changed, removed, token):
+                        # Dropped by another process meanwhile.
+                        retry.append(calendar_id)
+                        continue
+
+                    # Changes anywhere in the calendar come through, keep
+                    # the range.  Drop instances of deleted recurring events.
+                    removed = set(removed)
+                    google_events.prune(
+                        calendar_id,
+                        keep=lambda item: item.get("recurringEventId") not in removed
+                        and item_time(item["end"], tz) >= since
+                        and item_time(item["start"], tz) < until,
+                    )
+            pending = retry
+
+        return [google_events.items_get(calendar_id) for calendar_id in calendar_ids]
+
+    def items_fetch(self, calendar_id: str, since: dt.datetime, until: dt.datetime) -> tuple:
+        """
+        Pulls one calendar's events for a sync, leaving the store as is.
+        Safe to call from several threads.
+
+        Args:
+            calendar_id (str): Calendar ID.
+            since (datetime.datetime): Start of the store's range, naive
+                local time.
+            until (datetime.datetime): End of the store's range, naive
+                local time.
+
+        Returns:
+            tuple: (full, changed, removed, token).  True for a full sync,
+                event items, IDs of deleted events and the token for the
+                next sync.
+        """
+
+        events = self._service.events()
+        token = google_events.token_get(calendar_id)
+        if token is not None and google_events.until_get(calendar_id) == until:
+            try:
+                changed, removed, token = self.items_list(
+                    events.list(
+                        calendarId=calendar_id,
+                        singleEvents=True,
+                        maxResults=2500,
+                        syncToken=token,
+                    )
                 )
-                .execute()
+                return False, changed, removed, token
+            except HttpError as e:
+                if e.resp.status != 410:
+                    raise
+                logger.info(f"Sync token expired, full sync of: {calendar_id}")
+
+        # Sync tokens can't be combined with a time range, later syncs
+        # return changes anywhere in the calendar.
+        changed, _, token = self.items_list(
+            events.list(
+                calendarId=calendar_id,
+                timeMin=since.astimezone().isoformat(),
+                timeMax=until.astimezone().isoformat(),
+                singleEvents=True,
+                maxResults=2500,
             )
-            events = events_result.get("items", [])
-
-            for event in events:
-                # Determine if event is all day
-                all_day = True
-                start = event.get("start").get("date")
-                end = event.get("end").get("date")
-
-                # Check for non-ful day events
-                if not start:
-                    all_day = False
-                    start = event.get("start").get("dateTime").replace("Z", "+00:00")
-                    end = event.get("end").get("dateTime").replace("Z", "+00:00")
-
-                # Convert to datetimes.
-                start = dt.datetime.fromisoformat(start)
-                end = dt.datetime.fromisoformat(end)
-
-                # Convert to local timezone
-                start = start.astimezone(tz)
-                end = end.astimezone(tz)
-
-                # Now, drop timezones.
-                start = start.replace(tzinfo=None)
-                end = end.replace(tzinfo=None)
-
-                # If we got an all day event that's over, skip it.
-                # if end < date:
-                #     continue
-
-                summary = event["summary"].strip()
-                summary = fm.apply(summary)
-                if len(summary) == 0:
-                    continue
+        )
 
-                evt = EventBase(
-                    summary=summary,
-                    start=start,
-                    end=end,
-                    all_day=all_day,
-                )
+        return True, changed, [], token
+
+    def items_list(self, request) -> tuple:
+        """
+        Runs an events list request for a sync, following result pages.
 
-                self.add(evt)
+        Args:
+            request (HttpRequest): First page request.
 
-        self.sort()
+        Returns:
+            tuple: (changed, removed, token).  Changed event items, IDs
+                of deleted events and the token for the next sync.
+        """
+
+        events = self._service.events()
+        http = self.http_get()
+        changed = []
+        removed = []
+        while request is not None:
+            result = request.execute(http=http)
+            for item in result.get("items", []):
+                if item.get("status") == "cancelled":
+                    removed.append(item["id"])
+                else:
+                    changed.append(item)
+            token = result.get("nextSyncToken")
+            request = events.list_next(request, result)
+
+        return changed, removed, token
+
+    def http_get(self) -> AuthorizedHttp:
+        """
+        Returns the calling thread's authorized HTTP client.
+
+        Returns:
+            AuthorizedHttp: HTTP client for the current credentials.
+        """
+
+        http = getattr(_http_local, "http", None)
+        if http is None or http.credentials is not self._creds:
+            http = AuthorizedHttp(self._creds, http=httplib2.Http())
+            _http_local.http = http
+
+        return http
 
     def calendars_query(self, merge: bool = True) -> dict:
         """
@@ -454,10 +729,8 @@ def calendars_list():
             # Store out data, as the render creates its own instance.
             cal.to_file()
 
-            # Delete any existing PNG files, as they may not longer be valid.
-            image_files = glob("*.png")
-            for file in image_files:
-                os.remove(file)
+            # Drop cached frames, as they may not longer be valid.
+            frame_cache.clear()
 
         grid.on("click", handler=on_click)
 
@@ -16,8 +16,16 @@ import sys
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
+helpers_dir = os.path.join(parent_dir, "helpers")
+if helpers_dir not in sys.path:
+    sys.path.insert(0, helpers_dir)
 
 from calendar_base import CalendarBase, EventBase
+from calendar_fetch import calendar_fetcher
+from calendar_sync import CalendarStore
+
+# Local copy of the calendar's events, one calendarView delta per day.
+outlook_events = CalendarStore(str(Path(__file__).parent / "outlook-events.json"))
 
 # TODO: Use pexect like calendar_outlook.py for authentication UI to capture URL & code.
 
@@ -130,13 +138,23 @@ class CalendarOutlook(CalendarBase):
 
         return self._authenticated
 
-    def query(self, date: dt.datetime | None = None) -> Self:
+    def query(
+        self, date: dt.datetime | None = None, days: int = 1, incremental: bool = True
+    ) -> Self:
         """
         Queries the online database for events on the specified date.
+        Each day of a multi-day query is fetched concurrently.
+
+        In incremental mode events are read from the local store, after
+        pulling the changes since the last query from the calendarView
+        delta endpoint.
 
         Args:
             date (datetime.datetime, optional): Date of events.
                                                 Defaults to datetime.date.today().
+            days (int, optional): Number of days from date. Defaults to 1.
+            incremental (bool, optional): Sync the local store rather than
+                                          fetch every event. Defaults to True.
         """
 
         if not self.is_authenticated:
@@ -149,8 +167,7 @@ class CalendarOutlook(CalendarBase):
 
         # Prepare date range for the query
         start_of_day = date.replace(hour=0, minute=0, second=0, microsecond=0) # type: ignore
-        end_of_day = start_of_day + timedelta(days=1) - timedelta(seconds=1)
-        self._logger.debug(f"Querying events for: {start_of_day}")
+        self._logger.debug(f"Querying events for: {start_of_day}, {days} days")
 
         # Get system timezone for MS Graph API
         local_tz = datetime.now().astimezone().tzinfo
@@ -180,9 +197,67 @@ class CalendarOutlook(CalendarBase):
         headers = self._headers.copy()
         headers["Prefer"] = f'outlook.timezone="{windows_tz}"'
 
+        # One calendarView per day, each followed through its pages.
+        ranges = []
+        for i in range(days):
+            day = start_of_day + timedelta(days=i)
+            ranges.append((day, day + timedelta(days=1) - timedelta(seconds=1)))
+
+        fetch = self.view_sync if incremental else self.view_query
+        pages = calendar_fetcher.map(
+            "outlook", lambda r: fetch(headers, r[0], r[1]), ranges
+        )
+        if any(page is None for page in pages):
+            return self
+
+        # Merge in day order.  Events spanning days come back for each day.
+        events_data: list[dict[str, Any]] = []
+        seen = set()
+        for page in pages:
+            for item in page:
+                item_id = item.get("id")
+                if item_id is not None:
+                    if item_id in seen:
+                        continue
+                    seen.add(item_id)
+                events_data.append(item)
+
+        for item in events_data:
+            # print("")
+            # print(item["subject"])
+            # print(f"  Start: {item['start']['dateTime']} ({item['start']['timeZone']})")
+            # print(f"  End:   {item['end']['dateTime']} ({item['end']['timeZone']})")
+            # print(f"  All Day Event: {item.get('isAllDay', False)}\n")
+
+            event = EventBase(
+                summary=item.get("subject", "No Subject"),
+                start=dt.datetime.fromisoformat(item["start"]["dateTime"]),
+                end=dt.datetime.fromisoformat(item["end"]["dateTime"]),
+                all_day=item.get("isAllDay", False) )
+            if not item.get('isCancelled', False):
+                self.add(event)
+        self._logger.debug(f"Retrieved {len(events_data)} events from MS Graph")
+        self.sort()
+
+    def view_query(
+        self, headers: dict[str, str], start: datetime, end: datetime
+    ) -> list[dict[str, Any]] | None:
+        """
+        Queries the calendarView for a time range, following every page.
+        Safe to call from several threads.
+
+        Args:
+            headers (dict): Request headers.
+            start (datetime.datetime): Range start, timezone aware.
+            end (datetime.datetime): Range end, timezone aware.
+
+        Returns:
+            list: Event items, or None on an error.
+        """
+
         # Convert to UTC for the API (MS Graph expects UTC times in the URL)
-        start_utc = start_of_day.astimezone(dt.timezone.utc)
-        end_utc = end_of_day.astimezone(dt.timezone.utc)
+        start_utc = start.astimezone(dt.timezone.utc)
+        end_utc = end.astimezone(dt.timezone.utc)
 
         # Query MS Graph for events (handle pagination so recurring instances are not skipped)
         url = (
@@ -199,28 +274,109 @@ class CalendarOutlook(CalendarBase):
                 self._logger.debug(
                     f"Error fetching events: {resp.status_code} {resp.text}"
                 )
-                return self
+                return None
 
             page = resp.json()
             events_data.extend(page.get("value", []))
             next_url = page.get("@odata.nextLink")
 
-        for item in events_data:
-            # print("")
-            # print(item["subject"])
-            # print(f"  Start: {item['start']['dateTime']} ({item['start']['timeZone']})")
-            # print(f"  End:   {item['end']['dateTime']} ({item['end']['timeZone']})")
-            # print(f"  All Day Event: {item.get('isAllDay', False)}\n")
+        return events_data
 
-            event = EventBase(
-                summary=item.get("subject", "No Subject"),
-                start=dt.datetime.fromisoformat(item["start"]["dateTime"]),
-                end=dt.datetime.fromisoformat(item["end"]["dateTime"]),
-                all_day=item.get("isAllDay", False) )
-            if not item['isCancelled']:
-                self.add(event)
-        self._logger.debug(f"Retrieved {len(events_data)} events from MS Graph")
-        self.sort()
+    def view_sync(
+        self, headers: dict[str, str], start: datetime, end: datetime
+    ) -> list[dict[str, Any]] | None:
+        """
+        Syncs the local store with the calendarView for a day and returns
+        the day's events.  Safe to call from several threads.
+
+        The delta link saved by the last sync returns only the events
+        added, changed or removed since.  Without one, or when Graph has
+        expired it (HTTP 410), the whole day is fetched again.  Days
+        before today are dropped from the store.
+
+        Args:
+            headers (dict): Request headers.
+            start (datetime.datetime): Start of the day, timezone aware.
+            end (datetime.datetime): End of the day, timezone aware.
+
+        Returns:
+            list: Event items, or None on an error.
+        """
+
+        # A delta link is bound to its time range, so each day is its own
+        # calendar in the store.
+        key = start.date().isoformat()
+        today = datetime.now().date().isoformat()
+        with outlook_events.batch():
+            for old in outlook_events.calendars():
+                if old < today:
+                    outlook_events.drop(old)
+
+        link = outlook_events.token_get(key)
+        if link is not None:
+            status, changed, removed, link = self.delta_get(link, headers)
+            if status == 410:
+                self._logger.debug(f"Delta link expired, full sync of: {key}")
+                outlook_events.drop(key)
+                link = None
+            elif status != 200:
+                return None
+            elif not outlook_events.apply(key, changed, removed, link):
+                # Dropped by another process meanwhile.
+                link = None
+
+        if link is None:
+            start_utc = start.astimezone(dt.timezone.utc)
+            end_utc = end.astimezone(dt.timezone.utc)
+            url = (
+                f"{self.MS_GRAPH_BASE_URL}/me/calendarView/delta"
+                f"?startDateTime={start_utc.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+                f"&endDateTime={end_utc.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+            )
+            status, changed, _, link = self.delta_get(url, headers)
+            if status != 200:
+                return None
+            outlook_events.replace(key, changed, link, start)
+            self._logger.debug(f"Full sync of {key}: {len(changed)} events")
+
+        return outlook_events.items_get(key)
+
+    def delta_get(self, url: str, headers: dict[str, str]) -> tuple:
+        """
+        Runs a calendarView delta request, following every page.
+
+        Args:
+            url (str): Delta request, or the delta link of the last sync.
+            headers (dict): Request headers.
+
+        Returns:
+            tuple: (status, changed, removed, link).  HTTP status, 200 on
+                success, changed event items, IDs of removed events and
+                the delta link for the next sync.
+        """
+
+        changed: list[dict[str, Any]] = []
+        removed: list[str] = []
+        link: str | None = None
+        next_url: str | None = url
+        while next_url:
+            resp = requests.get(next_url, headers=headers)
+            if resp.status_code != 200:
+                self._logger.debug(
+                    f"Error fetching event changes: {resp.status_code} {resp.text}"
+                )
+                return resp.status_code, [], [], None
+
+            page = resp.json()
+            for item in page.get("value", []):
+                if "@removed" in item:
+                    removed.append(item["id"])
+                else:
+                    changed.append(item)
+            next_url = page.get("@odata.nextLink")
+            link = page.get("@odata.deltaLink", link)
+
+        return 200, changed, removed, link
 
 if __name__ == "__main__":
 
@@ -1,18 +1,20 @@
+import datetime as dt
+
 from plugin_base import PluginBase, DeviceItem
 from renderer_calendar_outlook import RendererCalendarOutlook
 from device_sleep_workweek import delay_get
 from mqtt import state_post_handler
-from pathlib import Path
 
 # Device registration
 device = DeviceItem("home-office")
 device.renderer = RendererCalendarOutlook()
 device.sleep_delay_fcn = delay_get
+# Wake when the frame changes, at the latest on the workweek schedule,
+# which picks up calendar edits.
+device.sleep_until_change = True
+# Wake less often when the battery would not last two weeks.
+device.battery_runtime_target = dt.timedelta(days=14)
 device.state_post_handler = state_post_handler
 
 plugin = PluginBase()
 plugin += device
-
-dev_image_path = Path("image-home-office.png")
-if dev_image_path.exists():
-    dev_image_path.unlink()
@@ -3,9 +3,10 @@ from renderer_calendar_google import RendererCalendarGoogle
 from mqtt import state_post_handler
 
 # Device registration
-# Uses default sleep delay of 1 hour.
+# Wakes when the frame changes, at most the default sleep delay of 1 hour.
 device = DeviceItem("kitchen")
 device.renderer = RendererCalendarGoogle()
+device.sleep_until_change = True
 device.state_post_handler = state_post_handler
 
 plugin = PluginBase()
@@ -5,12 +5,10 @@ import asyncio
 import datetime as dt
 import logging
 import traceback
-import os
-import glob
 
 from db import DB, DeviceState
 from fastapi import Request
-from fastapi.responses import FileResponse, PlainTextResponse
+from fastapi.responses import PlainTextResponse, Response
 
 from pydantic import BaseModel
 
@@ -19,6 +17,15 @@ import paths
 
 import theme
 from plugin_base import PluginBase, TabItem, MenuItem
+from battery_model import battery_models, soc_from_voltage
+from frame_cache import Frame, frame_cache
+from frame_diff import partial_refresh
+from frame_displayed import displayed_frames
+from frame_format import FORMATS, format_negotiate
+from http_range import RangeNotSatisfiable, content_range, range_parse
+from render_pool import render_pool
+from render_scheduler import render_scheduler
+from wake_arrivals import wake_arrivals
 
 
 # Logger config
@@ -32,7 +39,7 @@ router = APIRouter(tags=["devices"])
 def battery_voltage_to_soc(voltage: float) -> int:
     """
     Convert battery voltage to state of charge percentage.
-    Based on LiPo battery discharge curve.
+    Interpolated along the LiPo discharge curve, see battery_model.SOC_CURVE.
 
     Args:
         voltage: Battery voltage in volts
@@ -40,16 +47,7 @@ def battery_voltage_to_soc(voltage: float) -> int:
     Returns:
         State of charge as percentage (0-100)
     """
-    if voltage >= 3.65:
-        return 100
-    elif voltage >= 3.3:
-        return 80
-    elif voltage >= 3.2:
-        return 50
-    elif voltage >= 3.0:
-        return 20
-    else:
-        return 5
+    return round(soc_from_voltage(voltage))
 
 ROUTE_DEVICE_DELAY_MGR = "/device_delay_manager"
 ROUTE_DEVICE_MAIN_PAGE = "/"
@@ -72,24 +70,106 @@ plugin += menu
 device_data = {}
 
 
-# Function to pre-render images
-async def image_render_schedule(device: str, delay: dt.timedelta):
-    prefix = "*BG*:"
-    logger.debug(f"{prefix} Background rendering scheduled for: {device} in {delay}")
-    await asyncio.sleep(delay.total_seconds())
+async def frame_render(device: str) -> Frame:
+    """
+    Renders a new frame for a device and stores it in the frame cache.
+
+    Args:
+        device (str): Device name.
 
-    logger.debug(f"{prefix} Background rendering image for: {device}")
-    fn = f"image-{device}.png"
+    Returns:
+        Frame: New frame, or None if the device has no renderer or no
+            frame came back.
+    """
 
-    # Get renderer
     renderer = app.plugin_manager.renderer_get(device)
-    if renderer:
-        renderer.render(device=device, filename=fn)
-    else:
-        logger.error(f"{prefix} Renderer not found for: {device}")
-        return
+    if not renderer:
+        logger.error(f"Renderer not found for: {device}")
+        return None
+
+    # Render in the worker pool, off the event loop.  The worker skips
+    # drawing if the inputs match the last frame.
+    frame = frame_cache.frame_get(device, fresh=False)
+    fingerprint = frame.fingerprint if frame is not None else None
+    png, fingerprint, changes = await render_pool.render(renderer, device, fingerprint)
+    if png is None:
+        frame = frame_cache.frame_touch(device, changes)
+        if frame is not None:
+            logger.debug(f"Render inputs unchanged, reusing frame for: {device}")
+            return frame
+
+        # Frame dropped while rendering, e.g. cleared from the UI.
+        png, fingerprint, changes = await render_pool.render(renderer, device)
+        if png is None:
+            logger.error(f"Render returned no frame for: {device}")
+            return None
+
+    return frame_cache.frame_put(device, png, fingerprint, changes)
+
+
+async def frame_fresh_get(device: str) -> Frame:
+    """
+    Returns the cached frame for a device if it is recent, else renders one.
+
+    Args:
+        device (str): Device name.
+
+    Returns:
+        Frame: Frame, or None if the device has no renderer.
+    """
+
+    frame = frame_cache.frame_get(device)
+    if frame is not None:
+        logger.debug(f"Using cached image for: {device}")
+        return frame
+
+    # Draw it
+    frame = await frame_render(device)
+    if frame is not None:
+        logger.debug(f"Image created for: {device}")
+
+    return frame
+
+
+def range_response(request: Request, data: bytes, media_type: str, headers: dict) -> Response:
+    """
+    Returns frame bytes, or the byte range the request asks for.
+
+    A range is only served if If-Range, when sent, names the frame in
+    `headers`, otherwise the whole frame is sent.
+
+    Args:
+        request (Request): HTTP request.
+        data (bytes): Frame bytes.
+        media_type (str): Media type.
+        headers (dict): Response headers, including the ETag.
+
+    Returns:
+        Response: 200 with the frame, 206 with a range, or 416.
+    """
 
-    logger.debug(f"{prefix} Background image created for: {device}")
+    headers = dict(headers, **{"Accept-Ranges": "bytes"})
+
+    try:
+        byte_range = range_parse(
+            request.headers.get("range"),
+            len(data),
+            if_range=request.headers.get("if-range"),
+            etag=headers.get("ETag"),
+        )
+    except RangeNotSatisfiable as e:
+        logger.debug(f"{e}")
+        headers["Content-Range"] = f"bytes */{len(data)}"
+        return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        return Response(content=data, media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = content_range(start, end, len(data))
+    return Response(
+        content=data[start:end + 1], status_code=206, media_type=media_type, headers=headers
+    )
 
 
 class StatePayload(BaseModel):
@@ -97,6 +177,7 @@ class StatePayload(BaseModel):
     temp: str = ""
     battery: str = ""
     battery_voltage: str = ""
+    displayed: str = ""
 
 
 @router.page(ROUTE_DEVICE_MAIN_PAGE, favicon=theme.PAGE_ICON)
@@ -116,6 +197,16 @@ async def index():
             ui.markdown(f"* Temperature: {data.temperature}")
             ui.markdown(f"* Battery Voltage: {data.battery_voltage} [V]")
             ui.markdown(f"* Battery SOC: {data.battery_soc}")
+            model = battery_models.model_get(device)
+            item = app.plugin_manager.device_get(device)
+            if model is not None and item is not None:
+                delay = item.sleep_delay
+                runtime = model.runtime_get(delay) if delay else None
+                drain = f"{model.wake:.3f}% per wake, {model.idle:.3f}% per hour"
+                ui.markdown(f"* Battery Drain: {drain}")
+                if runtime is not None:
+                    hours = runtime.seconds // 3600
+                    ui.markdown(f"* Projected Runtime: {runtime.days} days {hours} hours")
             ui.markdown(f"* IP Address: {data.ipaddr}")
             ui.link("Image", f"/image/{data.device}", new_tab=True)
 
@@ -142,88 +233,206 @@ async def index():
         ui.tree(tree, label_key="id")  # , on_select=lambda e: ui.notify(e.value))
 
         # Clear cached images
-        # TODO: Use butter to watch for files, enable/disable button accordingly: https://pypi.org/project/butter/
-        logger.debug(f"Images: {glob.glob('image-*.png')}")
-        ui.button("Clear Cached Images", on_click=lambda: os.system("rm image-*.png"))
+        logger.debug(f"Images: {len(frame_cache)}")
+        ui.button("Clear Cached Images", on_click=lambda: frame_cache.clear())
 
 
 # Kindle image screen
+# Format from the "format" query parameter or the Accept header, see
+# frame_format.py.  Downloads resume with Range and If-Range set to the
+# ETag, a PNG frame replaced in the meantime is still served by hash.
+# Examples:
+#   /image/home-office?format=1bpp-rle
+#   curl -H "Accept: application/x-e-display-gray4" .../image/kitchen
+#   curl -H "Range: bytes=20480-" -H 'If-Range: "4a9681b6fe0ee4be"' .../image/kitchen
 @router.get("/image/{device}")
-async def get_image_for_device(device: str):
+async def get_image_for_device(device: str, request: Request, format: str = None):
     # Generate a new image
     logger.debug(f"Retrieving image for: {device}")
 
     if device not in device_data.keys():
         device_data[device] = {}
 
-    fn = f"image-{device}.png"
-    # See if we have a recent image.
-    # If we have an old one, delete it.
-    age_max = dt.timedelta(minutes=5)
-    if os.path.exists(fn):
-        # Used recently cached image if we have one
-        t_mod = os.path.getmtime(fn)
-        t_mod = dt.datetime.fromtimestamp(t_mod)
-        age = dt.datetime.now() - t_mod
-
-        # If image is less than 5 minutes old, use it.
-        if age < age_max:
-            logger.debug(f"Using cached image for: {device}")
-        else:
-            # Delete expired image
-            logger.debug(f"Deleting expired image for: {device}, age: {age}")
-            os.remove(fn)
-
-    # If we don't have an image, create one.
-    if not os.path.exists(fn):
-        # Draw it
-        try:
-            # Get renderer
-            renderer = app.plugin_manager.renderer_get(device)
-            if renderer:
-                renderer.render(device=device, filename=fn)
-            else:
-                logger.error(f"Renderer not found for: {device}")
-                return
+    fmt = format_negotiate(format, request.headers.get("accept"))
+    if fmt is None:
+        text = f"Unsupported image format, available: {', '.join(FORMATS)}"
+        return PlainTextResponse(text, status_code=406)
+
+    try:
+        frame = await frame_fresh_get(device)
+        if frame is None:
+            return
+    except Exception as e:  # noqa: F841
+        text = f"Error generating image for: {device}\n\n"
+        text += traceback.format_exc()
+
+        return PlainTextResponse(text)
+
+    # Device already has this frame.
+    headers = {"ETag": frame.etag_get(fmt), "Cache-Control": "no-cache", "Vary": "Accept"}
+    if frame.etag_match(request.headers.get("if-none-match"), fmt):
+        logger.debug(f"Image not modified for: {device}")
+        return Response(status_code=304, headers=headers)
+
+    if fmt == "png":
+        # Resuming a frame that has since been replaced.
+        if_range = request.headers.get("if-range")
+        if request.headers.get("range") and if_range and if_range.strip() != frame.etag:
+            png = frame_cache.png_get(device, if_range.strip().strip('"'))
+            if png is not None:
+                logger.debug(f"Resuming replaced frame for: {device}")
+                headers["ETag"] = if_range.strip()
+                return range_response(request, png, "image/png", headers)
+
+        return range_response(request, frame.png, "image/png", headers)
+
+    # Encoded once per frame, in a thread as it decodes the PNG.
+    encoding = await asyncio.to_thread(frame_cache.encoding_get, device, frame, fmt)
+    headers["X-Width"] = str(encoding.size[0])
+    headers["X-Height"] = str(encoding.size[1])
+
+    return range_response(request, encoding.data, encoding.media_type, headers)
+
+
+# Partial refresh update, dirty rectangles against the frame the device
+# shows.  Body layout in frame_diff.py.  The device may report the hash
+# of the frame it shows (the ETag it last got) with "base", otherwise
+# the frame it last acknowledged through /displayed is assumed.  Frames
+# sent are only diffed against once acknowledged.  Example:
+#   /image/home-office/partial?base=4a9681b6fe0ee4be
+@router.get("/image/{device}/partial")
+async def get_image_partial_for_device(device: str, base: str = None):
+    logger.debug(f"Retrieving partial update for: {device}, base: {base}")
+
+    try:
+        frame = await frame_fresh_get(device)
+        if frame is None:
+            return PlainTextResponse(f"Renderer not found for: {device}", status_code=404)
+    except Exception as e:  # noqa: F841
+        text = f"Error generating image for: {device}\n\n"
+        text += traceback.format_exc()
+
+        return PlainTextResponse(text)
+
+    if base:
+        base = base.strip('"')
+    else:
+        base = displayed_frames.hash_get(device)
 
-            logger.debug(f"Image created for: {device}")
-        except Exception as e:  # noqa: F841
-            text = f"Error generating image for: {device}\n\n"
-            text += traceback.format_exc()
+    # Diff on the packed 1bpp frame, encoded once per frame.
+    encoding = await asyncio.to_thread(frame_cache.encoding_get, device, frame, "1bpp")
+    update = partial_refresh.update_get(
+        device, frame.hash, encoding.data, encoding.size, base=base
+    )
 
-            return PlainTextResponse(text)
+    headers = {
+        "ETag": frame.etag,
+        "Cache-Control": "no-cache",
+        "X-Width": str(encoding.size[0]),
+        "X-Height": str(encoding.size[1]),
+    }
+    if not update.full and not update.rects:
+        logger.debug(f"Image not modified for: {device}")
+        return Response(status_code=304, headers=headers)
+
+    headers["X-Refresh"] = "full" if update.full else "partial"
+    headers["X-Rects"] = str(len(update.rects))
+
+    return Response(
+        content=update.data, media_type="application/x-e-display-1bpp-rects", headers=headers
+    )
 
-    # Make sure we got a file
-    if not os.path.exists(fn):
-        return PlainTextResponse(f"Image for: {device} not generated.")
 
-    # Replace "/path/to/image.png" with the actual path to your image file
-    return FileResponse(fn, media_type="image/png")
+def wake_delay_get(device: str) -> dt.timedelta:
+    """
+    Returns the delay until a device's next wake, and schedules a frame
+    pre-render for when the device is likely to arrive, see wake_arrivals.
 
+    Args:
+        device (str): Device name.
 
-# Return plain text with delay time
-@router.get("/delay/{device}", response_class=PlainTextResponse)
-async def get_delay_to_next_wake_time_for_device(device: str):
-    logger.debug("Get delay called")
-    logger.debug(f"Device: {device}")
+    Returns:
+        datetime.timedelta: Sleep delay, or None if the device has none.
+    """
 
     # Get the delay time for this device
     delay_update = app.plugin_manager.sleep_delay_get(device)
     if not delay_update:
         logger.error(f"Sleep delay not found for: {device}")
-        return "0"
+        return None
 
     # Message the delay
     now = dt.datetime.now()
     logger.debug(f"Current time     : {now}")
     logger.debug(f"Next update delay: {delay_update}")
 
-    # Schedule an image pre-render
-    timer_render_ahead = dt.timedelta(minutes=1)
-    delay_prerender = delay_update - timer_render_ahead
-    if delay_prerender.total_seconds() > 0:
-        # If we'd get a negative delay, don't schedule a pre-render.
-        asyncio.ensure_future(image_render_schedule(device, delay_prerender))
+    # Schedule an image pre-render, replacing any pending one.
+    expected = now + delay_update
+    wake_arrivals.expect(device, expected)
+    time_prerender = wake_arrivals.prerender_time_get(device, expected)
+    if time_prerender > now:
+        # If it would already be due, don't schedule a pre-render.
+        render_scheduler.schedule(device, time_prerender)
+
+    return delay_update
+
+
+# Frame check, plain text "<delay> <hash>": seconds to the next wake and
+# the hash of the current frame.  A device that displays that hash can
+# go back to sleep without downloading or redrawing.  X-Redraw is 0 when
+# the device acknowledged this frame, else 1.  Example:
+#   curl .../frame/kitchen
+#   900 4a9681b6fe0ee4be
+@router.get("/frame/{device}", response_class=PlainTextResponse)
+async def get_frame_for_device(device: str):
+    logger.debug(f"Frame check for: {device}")
+
+    # Render first, the sleep delay runs to the frame's next change.
+    text = None
+    try:
+        frame = await frame_fresh_get(device)
+    except Exception as e:  # noqa: F841
+        frame = None
+        text = f"Error generating image for: {device}\n\n"
+        text += traceback.format_exc()
+
+    delay_update = wake_delay_get(device)
+    delay = str(int(delay_update.total_seconds())) if delay_update else "0"
+
+    if text is not None:
+        return PlainTextResponse(text, status_code=500, headers={"X-Sleep-Delay": delay})
+    if frame is None:
+        text = f"Renderer not found for: {device}"
+        return PlainTextResponse(text, status_code=404, headers={"X-Sleep-Delay": delay})
+
+    redraw = displayed_frames.redraw_needed(device, frame.hash)
+    headers = {
+        "X-Sleep-Delay": delay,
+        "X-Frame-Hash": frame.hash,
+        "X-Redraw": "1" if redraw else "0",
+    }
+
+    return PlainTextResponse(f"{delay} {frame.hash}", headers=headers)
+
+
+# Acknowledge a frame was drawn, hash as from X-Frame-Hash or the ETag.
+# Example:
+#   curl -X POST ".../displayed/kitchen?hash=4a9681b6fe0ee4be"
+@router.post("/displayed/{device}", status_code=204)
+async def post_displayed_for_device(device: str, hash: str):
+    displayed_frames.ack(device, hash)
+    partial_refresh.confirm(device, displayed_frames.hash_get(device))
+
+
+# Return plain text with delay time
+@router.get("/delay/{device}", response_class=PlainTextResponse)
+async def get_delay_to_next_wake_time_for_device(device: str):
+    logger.debug("Get delay called")
+    logger.debug(f"Device: {device}")
+
+    delay_update = wake_delay_get(device)
+    if not delay_update:
+        return "0"
 
     return str(int(delay_update.total_seconds()))
 
@@ -256,6 +465,16 @@ async def device_delay_manager():
                         "field": "sleep_delay_fcn",
                         "sortable": "true",
                     },
+                    {
+                        "headerName": "Until Frame Change",
+                        "field": "sleep_until_change",
+                        "sortable": "true",
+                    },
+                    {
+                        "headerName": "Wake Offset",
+                        "field": "sleep_phase",
+                        "sortable": "true",
+                    },
                 ],
                 "rowData": device_dicts,
                 "rowSelection": "single",
@@ -283,13 +502,19 @@ async def device_delay_manager():
         grid.on("cellClicked", handler=on_click)
 
 
-# Allow Kindle to post state data
-# Proper curl call:
-# curl -X POST http://192.168.0.120:8000/state -H "Content-Type: application/json"  -d '{"temp":"72F","battery":"84%"}'  # noqa: E501
-# per: https://stackoverflow.com/questions/64057445/fast-api-post-does-not-recgonize-my-parameter
-@router.post("/state", status_code=200)
-def post_state(payload: StatePayload = None, request: Request = None):
-    logger.debug("POST called")
+def state_store(payload: StatePayload, ipaddr: str) -> DeviceState:
+    """
+    Stores state posted by a device, records its arrival and calls its
+    post handler.
+
+    Args:
+        payload (StatePayload): Posted state.
+        ipaddr (str): Device IP address.
+
+    Returns:
+        DeviceState: Stored state.
+    """
+
     logger.debug(f"Device     : {payload.device}")
     logger.debug(f"Result type: {type(payload)}")
     logger.debug(f"Result     : {payload}")
@@ -297,6 +522,14 @@ def post_state(payload: StatePayload = None, request: Request = None):
     logger.debug(f"Battery SOC: {payload.battery}")
     logger.debug(f"Battery Voltage: {payload.battery_voltage}")
 
+    # Device is here, note whether a fresh frame was waiting for it.
+    now = dt.datetime.now()
+    frame = frame_cache.frame_get(payload.device, fresh=False)
+    frame_time = None
+    if frame is not None and now - frame.time < frame_cache.ttl_get(payload.device):
+        frame_time = frame.time
+    wake_arrivals.arrive(payload.device, now, frame_time)
+
     # Track data in from devices.
     db = DB()
 
@@ -318,11 +551,11 @@ def post_state(payload: StatePayload = None, request: Request = None):
 
     data = DeviceState(
         device=payload.device,
-        time=dt.datetime.now(),
+        time=now,
         temperature=temperature,
         battery_soc=battery_soc,
         battery_voltage=battery_voltage,
-        ipaddr=request.client.host,
+        ipaddr=ipaddr,
     )
     db.store(data)
     logger.debug(data)
@@ -331,3 +564,91 @@ def post_state(payload: StatePayload = None, request: Request = None):
     handler = app.plugin_manager.state_post_handler_get(payload.device)
     if handler:
         handler(data)
+
+    return data
+
+
+# Allow Kindle to post state data
+# Proper curl call:
+# curl -X POST http://192.168.0.120:8000/state -H "Content-Type: application/json"  -d '{"temp":"72F","battery":"84%"}'  # noqa: E501
+# per: https://stackoverflow.com/questions/64057445/fast-api-post-does-not-recgonize-my-parameter
+@router.post("/state", status_code=200)
+def post_state(payload: StatePayload = None, request: Request = None):
+    logger.debug("POST called")
+    state_store(payload, request.client.host)
+
+
+# Single round trip wake: posts state, returns the frame and the next
+# sleep delay.  Replaces POST /state, GET /image and GET /delay.
+# Response headers:
+#   X-Sleep-Delay  seconds until the next wake, 0 to stop
+#   X-Frame-Hash   hash of the current frame, the ETag without quotes
+# The body is the frame as for /image/{device}, format from the "format"
+# query parameter or the Accept header.  The payload "displayed" field
+# acknowledges the frame the device shows (X-Frame-Hash of the last
+# wake).  When that, or the ETag sent in If-None-Match, is the current
+# frame the response is a 304 with no body and the device need not
+# redraw.
+# Example:
+#   curl -X POST .../wake/home-office -H "Content-Type: application/json" \
+#        -d '{"temp":"72F","battery":"84%"}' -D headers.txt -o image.png
+@router.post("/wake/{device}")
+async def post_wake(
+    device: str, request: Request, payload: StatePayload = None, format: str = None
+):
+    logger.debug(f"Wake called for: {device}")
+
+    fmt = format_negotiate(format, request.headers.get("accept"))
+    if fmt is None:
+        text = f"Unsupported image format, available: {', '.join(FORMATS)}"
+        return PlainTextResponse(text, status_code=406)
+
+    # Store state first, the frame shows it.  DB access blocks, keep it
+    # off the event loop.
+    if payload is None:
+        payload = StatePayload()
+    if not payload.device:
+        payload.device = device
+    await asyncio.to_thread(state_store, payload, request.client.host)
+    if payload.displayed:
+        displayed_frames.ack(device, payload.displayed)
+        partial_refresh.confirm(device, displayed_frames.hash_get(device))
+
+    # Render first, the sleep delay runs to the frame's next change.
+    text = None
+    try:
+        frame = await frame_fresh_get(device)
+    except Exception as e:  # noqa: F841
+        frame = None
+        text = f"Error generating image for: {device}\n\n"
+        text += traceback.format_exc()
+
+    delay_update = wake_delay_get(device)
+    delay = str(int(delay_update.total_seconds())) if delay_update else "0"
+
+    if text is not None:
+        return PlainTextResponse(text, status_code=500, headers={"X-Sleep-Delay": delay})
+    if frame is None:
+        text = f"Renderer not found for: {device}"
+        return PlainTextResponse(text, status_code=404, headers={"X-Sleep-Delay": delay})
+
+    headers = {
+        "ETag": frame.etag_get(fmt),
+        "Cache-Control": "no-cache",
+        "Vary": "Accept",
+        "X-Sleep-Delay": delay,
+        "X-Frame-Hash": frame.hash,
+    }
+    redraw = displayed_frames.redraw_needed(device, frame.hash)
+    if not redraw or frame.etag_match(request.headers.get("if-none-match"), fmt):
+        logger.debug(f"Image not modified for: {device}")
+        return Response(status_code=304, headers=headers)
+
+    if fmt == "png":
+        return Response(content=frame.png, media_type="image/png", headers=headers)
+
+    encoding = await asyncio.to_thread(frame_cache.encoding_get, device, frame, fmt)
+    headers["X-Width"] = str(encoding.size[0])
+    headers["X-Height"] = str(encoding.size[1])
+
+    return Response(content=encoding.data, media_type=encoding.media_type, headers=headers)
@@ -14,6 +14,11 @@ from nicegui import APIRouter, ui
 import theme
 
 from repo import Repo
+from frame_diff import partial_refresh
+from frame_displayed import displayed_frames
+from render_pool import render_pool
+from render_scheduler import render_scheduler
+from wake_arrivals import wake_arrivals
 
 from plugin_base import PluginBase, MenuItem
 
@@ -83,6 +88,117 @@ async def list_current_server_version_info():
         # TODO: Enable/disable button based on if up to date or not.
         ui.button("Update to Latest", on_click=lambda: ui.navigate.to(ROUTE_UPDATE))
 
+        ui.markdown("### Render Caches")
+        with ui.grid(columns=5):
+            for label in ["Cache", "Entries", "Hits", "Misses", "Hit Rate"]:
+                ui.label(label).classes("font-bold")
+
+            # Caches live in the render workers, totals over all of them.
+            caches = render_pool.caches_get()
+            names = {
+                "text_layout": "Text Layout",
+                "glyph_runs": "Glyph Runs",
+                "icons": "Icons",
+                "backgrounds": "Backgrounds",
+            }
+            for key, name in names.items():
+                stats = caches[key]
+                ui.label(name)
+                ui.label(f"{stats['size']} / {stats['size_max']}")
+                ui.label(str(stats["hits"]))
+                ui.label(str(stats["misses"]))
+                ui.label(f"{100 * stats['hit_rate']:.1f}%")
+
+        ui.markdown("### Render Pool")
+        stats = render_pool.to_dict()
+        with ui.grid(columns=6):
+            labels = ["Workers", "Renders", "In Progress", "Coalesced", "Unchanged", "Failures"]
+            for label in labels:
+                ui.label(label).classes("font-bold")
+
+            ui.label(str(stats["workers"]))
+            ui.label(str(stats["renders"]))
+            ui.label(str(stats["inflight"]))
+            ui.label(str(stats["coalesced"]))
+            ui.label(str(stats["unchanged"]))
+            ui.label(str(stats["failures"]))
+
+        ui.markdown("### Pre-render Schedule")
+        stats = render_scheduler.to_dict()
+        with ui.grid(columns=6):
+            labels = ["Concurrency", "Pending", "Running", "Runs", "Replaced", "Failures"]
+            for label in labels:
+                ui.label(label).classes("font-bold")
+
+            ui.label(str(stats["concurrency"]))
+            ui.label(str(stats["pending"]))
+            ui.label(str(stats["running"]))
+            ui.label(str(stats["runs"]))
+            ui.label(str(stats["replaced"]))
+            ui.label(str(stats["failures"]))
+
+        with ui.grid(columns=2):
+            for label in ["Device", "Render At"]:
+                ui.label(label).classes("font-bold")
+
+            for job in render_scheduler.jobs():
+                ui.label(job.device)
+                ui.label(job.time.strftime("%Y-%m-%d %H:%M:%S"))
+            for device in render_scheduler.running():
+                ui.label(device)
+                ui.label("Rendering")
+
+        # Pre-render starts by minute past the hour, wakes bunching up
+        # show as tall bars.
+        ui.markdown("#### Pre-render Load, Last Day")
+        counts = render_scheduler.load_histogram(dt.timedelta(minutes=1))
+        ui.echart(
+            {
+                "xAxis": {
+                    "type": "category",
+                    "name": "Minute",
+                    "data": [f":{minute:02d}" for minute in range(len(counts))],
+                },
+                "yAxis": {"type": "value", "name": "Renders"},
+                "series": [{"type": "bar", "data": counts}],
+                "tooltip": {"trigger": "axis"},
+            }
+        ).classes("w-full h-64")
+
+        ui.markdown("### Device Arrivals")
+        with ui.grid(columns=5):
+            labels = ["Device", "Arrivals", "Early Offset", "Median Offset", "Frame Ready"]
+            for label in labels:
+                ui.label(label).classes("font-bold")
+
+            for device, stats in sorted(wake_arrivals.to_dict().items()):
+                ui.label(device)
+                ui.label(str(stats["samples"]))
+                ui.label(f"{stats['offset']:+.0f} s")
+                ui.label(f"{stats['median']:+.0f} s")
+                ui.label(f"{100 * stats['hit_rate']:.1f}%")
+
+        ui.markdown("### Partial Refresh")
+        stats = partial_refresh.to_dict()
+        with ui.grid(columns=3):
+            for label in ["Devices", "Partial Updates", "Full Updates"]:
+                ui.label(label).classes("font-bold")
+
+            ui.label(str(stats["devices"]))
+            ui.label(str(stats["partial"]))
+            ui.label(str(stats["full"]))
+
+        ui.markdown("### Displayed Frames")
+        stats = displayed_frames.to_dict()
+        with ui.grid(columns=4):
+            for label in ["Devices", "Acknowledged", "Redraws Skipped", "Redraws"]:
+                ui.label(label).classes("font-bold")
+
+            ui.label(str(stats["devices"]))
+            ui.label(str(stats["acks"]))
+            ui.label(str(stats["skipped"]))
+            ui.label(str(stats["redraws"]))
+
 
 @router_admin.get(ROUTE_UPDATE)
 def update_server_to_latest_commit(request: Request):
@@ -0,0 +1,15 @@
+# conftest.py
+# Test setup: server import paths, as set up by paths.py for the app.
+
+import os
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for path in ("plugins", "helpers", ""):
+    path = os.path.join(SERVER_DIR, path).rstrip(os.sep)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Device fonts load from paths relative to the server directory.
+os.chdir(SERVER_DIR)
@@ -0,0 +1,131 @@
+# test_battery_model.py
+# Battery state of charge curve, drain fit and sleep delay multipliers.
+
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from battery_model import CHARGE_JUMP, FIT_SAMPLES_MIN, MULTIPLIER_MAX, DrainModel, drain_fit, soc_from_voltage
+
+NOW = dt.datetime(2025, 3, 4, 9)
+
+
+def history_get(gaps, wake: float = 0.2, idle: float = 0.4, soc: float = 90) -> tuple:
+    """
+    Post times and state of charge draining exactly per wake and per hour.
+    """
+
+    gaps = np.asarray(gaps, dtype=float)
+    hours = np.concatenate([[0], np.cumsum(gaps)])
+    socs = soc - np.concatenate([[0], np.cumsum(wake + gaps * idle)])
+    return hours, socs
+
+
+@pytest.mark.parametrize(
+    "voltage, expected",
+    [
+        (2.5, 0),
+        # The old stepped table read 5 below 3.0 V.
+        (2.9, 0),
+        (2.95, 10),
+        (3.0, 20),
+        (3.1, 35),
+        (3.25, 65),
+        (3.65, 100),
+        (4.1, 100),
+    ],
+)
+def test_soc_from_voltage(voltage, expected):
+    assert soc_from_voltage(voltage) == pytest.approx(expected)
+    assert isinstance(soc_from_voltage(voltage), float)
+
+
+def test_soc_from_voltage_array():
+    socs = soc_from_voltage(np.array([2.5, 3.1, 4.1]))
+    np.testing.assert_allclose(socs, [0, 35, 100])
+
+
+def test_drain_fit():
+    hours, socs = history_get(np.resize([0.25, 1.0], 19))
+
+    wake, idle, samples = drain_fit(hours, socs)
+
+    assert wake == pytest.approx(0.2)
+    assert idle == pytest.approx(0.4)
+    assert samples == 19
+
+
+def test_drain_fit_skips_charges():
+    hours, socs = history_get(np.resize([0.25, 1.0, 2.0], 20))
+    # Charged between the 10th and 11th post.
+    socs[10:] += CHARGE_JUMP + 20
+
+    wake, idle, samples = drain_fit(hours, socs)
+
+    assert wake == pytest.approx(0.2)
+    assert idle == pytest.approx(0.4)
+    assert samples == 19
+
+
+def test_drain_fit_too_few_samples():
+    hours, socs = history_get(np.resize([0.25, 1.0], FIT_SAMPLES_MIN - 1))
+    assert drain_fit(hours, socs) is None
+
+    # Posts with no time between them don't count.
+    hours, socs = history_get(np.resize([0.25, 0.0], 2 * FIT_SAMPLES_MIN - 2))
+    assert drain_fit(hours, socs) is None
+
+
+def test_drain_fit_never_negative():
+    # Charge creeping up between wakes, below CHARGE_JUMP.
+    hours, socs = history_get(np.resize([0.25, 1.0], 19), wake=-0.1, idle=-0.2)
+
+    wake, idle, _ = drain_fit(hours, socs)
+
+    assert wake == 0.0
+    assert idle == 0.0
+
+
+def test_rate_and_runtime():
+    model = DrainModel(soc=50, wake=0.2, idle=0.05, samples=40, time=NOW)
+
+    assert model.rate_get(dt.timedelta(minutes=15)) == pytest.approx(0.85)
+    assert model.rate_get(dt.timedelta(0)) == float("inf")
+    assert model.runtime_get(dt.timedelta(hours=1)) == dt.timedelta(hours=200)
+
+    idle = DrainModel(soc=50, wake=0, idle=0, samples=40, time=NOW)
+    assert idle.runtime_get(dt.timedelta(hours=1)) is None
+
+
+def test_multiplier():
+    model = DrainModel(soc=50, wake=0.2, idle=0.05, samples=40, time=NOW)
+
+    multiplier = model.multiplier_get(dt.timedelta(minutes=15), dt.timedelta(days=7))
+
+    assert multiplier == pytest.approx(3.230769230769231)
+    # The stretched delay just reaches the target.
+    runtime = model.runtime_get(dt.timedelta(minutes=15) * multiplier)
+    assert runtime == pytest.approx(dt.timedelta(days=7), abs=dt.timedelta(seconds=1))
+
+
+def test_multiplier_target_reached():
+    model = DrainModel(soc=50, wake=0.2, idle=0.05, samples=40, time=NOW)
+    assert model.multiplier_get(dt.timedelta(hours=1), dt.timedelta(days=7)) == 1.0
+
+    idle = DrainModel(soc=50, wake=0, idle=0, samples=40, time=NOW)
+    assert idle.multiplier_get(dt.timedelta(minutes=15), dt.timedelta(days=7)) == 1.0
+
+
+def test_multiplier_clamped():
+    model = DrainModel(soc=50, wake=0.5, idle=0.05, samples=40, time=NOW)
+
+    assert model.multiplier_get(dt.timedelta(minutes=5), dt.timedelta(days=7)) == MULTIPLIER_MAX
+
+
+def test_multiplier_idle_drain_over_budget():
+    # Idle drain alone empties the battery before the target, no delay
+    # reaches it.
+    model = DrainModel(soc=10, wake=0.2, idle=0.1, samples=40, time=NOW)
+
+    assert model.multiplier_get(dt.timedelta(hours=1), dt.timedelta(days=7)) == MULTIPLIER_MAX
@@ -0,0 +1,165 @@
+# test_calendar_sync.py
+# Calendar event store: full and incremental syncs, pruning, the store
+# file shared between processes and its lock.
+
+import datetime as dt
+import fcntl
+import os
+
+import pytest
+
+from calendar_sync import CalendarStore
+
+SINCE = dt.datetime(2025, 3, 3, tzinfo=dt.timezone.utc)
+UNTIL = dt.datetime(2025, 4, 3, tzinfo=dt.timezone.utc)
+
+
+def item_get(key: str, start: str = "2025-03-04") -> dict:
+    return {"id": key, "summary": f"Event {key}", "start": {"date": start}}
+
+
+@pytest.fixture
+def filename(tmp_path):
+    return str(tmp_path / "events.json")
+
+
+@pytest.fixture
+def store(filename):
+    store = CalendarStore(filename)
+    store.replace("primary", [item_get("a"), item_get("b")], "token-1", SINCE, UNTIL)
+    return store
+
+
+def ids_get(store: CalendarStore, calendar: str = "primary") -> list:
+    return [item["id"] for item in store.items_get(calendar)]
+
+
+def test_replace(store, filename):
+    assert store.calendars() == ["primary"]
+    assert ids_get(store) == ["a", "b"]
+    assert store.token_get("primary") == "token-1"
+    assert store.since_get("primary") == SINCE
+    assert store.until_get("primary") == UNTIL
+    assert os.path.exists(filename)
+
+    # A full sync replaces all events.
+    store.replace("primary", [item_get("c")], "token-2", SINCE)
+    assert ids_get(store) == ["c"]
+    assert store.until_get("primary") is None
+
+
+def test_apply_adds_and_removes(store):
+    changed = [item_get("b", "2025-03-05"), item_get("c")]
+
+    assert store.apply("primary", changed, ["a", "missing"], "token-2")
+
+    assert ids_get(store) == ["b", "c"]
+    assert store.items_get("primary")[0]["start"] == {"date": "2025-03-05"}
+    assert store.token_get("primary") == "token-2"
+    assert store.to_dict() == {
+        "calendars": 1,
+        "events": 2,
+        "full": 1,
+        "incremental": 1,
+        "changed": 2,
+        "removed": 1,
+    }
+
+
+def test_apply_unchanged_keeps_token(store, filename, monkeypatch):
+    saves = []
+    monkeypatch.setattr(store, "_save", lambda: saves.append(True))
+
+    assert store.apply("primary", [], [], "token-2")
+
+    assert store.token_get("primary") == "token-1"
+    assert saves == []
+    assert store.to_dict()["incremental"] == 1
+
+
+def test_apply_unknown_calendar(store):
+    assert not store.apply("work", [item_get("c")], [], "token-2")
+    assert store.calendars() == ["primary"]
+
+
+def test_second_store_reloads(store, filename):
+    other = CalendarStore(filename)
+    assert ids_get(other) == ["a", "b"]
+    assert other.token_get("primary") == "token-1"
+
+    # Changes by another process show on the next read, several saves
+    # within one file system timestamp tick included.
+    for i in range(5):
+        store.apply("primary", [item_get(f"c{i}")], [], f"token-{i + 2}")
+        assert other.token_get("primary") == f"token-{i + 2}"
+    assert ids_get(other) == ["a", "b", "c0", "c1", "c2", "c3", "c4"]
+
+    # And the other way around, changes start from the file.
+    other.apply("primary", [], ["a"], "token-9")
+    assert ids_get(store) == ["b", "c0", "c1", "c2", "c3", "c4"]
+    assert store.token_get("primary") == "token-9"
+
+
+def test_drop_forces_full_sync(store, filename):
+    store.replace("work", [item_get("w")], "token-w", SINCE)
+
+    store.drop("primary")
+    store.drop("missing")
+
+    assert store.token_get("primary") is None
+    assert store.items_get("primary") == []
+    assert store.since_get("primary") is None
+    assert store.calendars() == ["work"]
+
+    # Another process still holding the calendar learns it's gone.
+    other = CalendarStore(filename)
+    assert other.token_get("primary") is None
+    assert not other.apply("primary", [item_get("c")], [], "token-2")
+
+
+def test_prune(store):
+    store.apply("primary", [item_get("old", "2025-02-01"), item_get("c", "2025-03-10")], [], "token-2")
+
+    dropped = store.prune("primary", lambda item: item["start"]["date"] >= "2025-03-03")
+
+    assert dropped == 1
+    assert ids_get(store) == ["a", "b", "c"]
+    assert store.prune("primary", lambda item: True) == 0
+    assert store.prune("missing", lambda item: False) == 0
+
+
+def test_clear(store, filename):
+    store.clear()
+
+    assert store.calendars() == []
+    assert CalendarStore(filename).calendars() == []
+
+
+def test_batch_holds_file_lock(store, filename):
+    with open(f"{filename}.lock", "a") as f:
+        with store.batch():
+            store.apply("primary", [item_get("c")], [], "token-2")
+
+            # Another process can't change the store mid batch.
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+            # Saved once, at the end of the batch.
+            assert CalendarStore(filename).token_get("primary") == "token-1"
+
+            store.prune("primary", lambda item: item["id"] != "a")
+
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+    assert ids_get(CalendarStore(filename)) == ["b", "c"]
+
+
+def test_bad_file(filename):
+    with open(filename, "w") as f:
+        f.write("{")
+
+    store = CalendarStore(filename)
+
+    assert store.calendars() == []
+    assert store.token_get("primary") is None
@@ -0,0 +1,191 @@
+# test_frame_diff.py
+# Dirty rectangles and partial refresh tracking against confirmed frames.
+
+import struct
+
+import numpy as np
+import pytest
+
+from frame_diff import FULL_REFRESH_AREA, FULL_REFRESH_EVERY, PartialRefresh, dirty_rects
+
+WIDTH = 64
+HEIGHT = 128
+SIZE = (WIDTH, HEIGHT)
+
+
+def frame_get(*blocks) -> np.ndarray:
+    """
+    White packed frame with black blocks of (row, row end, byte, byte end).
+    """
+
+    pixels = np.full((HEIGHT, WIDTH // 8), 0xFF, dtype=np.uint8)
+    for y0, y1, x0, x1 in blocks:
+        pixels[y0:y1, x0:x1] = 0
+    return pixels
+
+
+def update_get(refresh, name, pixels, base=None):
+    return refresh.update_get("kitchen", name, pixels.tobytes(), SIZE, base=base)
+
+
+def test_dirty_rects_none():
+    assert dirty_rects(frame_get(), frame_get(), WIDTH) == []
+
+
+def test_dirty_rects_byte_aligned():
+    prev = np.full((800, 60), 0xFF, dtype=np.uint8)
+    new = prev.copy()
+    new[770:790, 1:20] = 0
+    assert dirty_rects(prev, new, 480) == [(8, 770, 152, 20)]
+
+
+def test_dirty_rects_merge():
+    new = frame_get((10, 12, 0, 1), (15, 17, 0, 1), (60, 62, 0, 1), (60, 62, 6, 7))
+
+    # Rows within MERGE_ROWS join a band, byte columns further apart than
+    # MERGE_BYTES stay separate rects.
+    assert dirty_rects(frame_get(), new, WIDTH) == [
+        (0, 10, 8, 7),
+        (0, 60, 8, 2),
+        (48, 60, 8, 2),
+    ]
+    assert dirty_rects(frame_get(), new, WIDTH, merge_rows=0) == [
+        (0, 10, 8, 2),
+        (0, 15, 8, 2),
+        (0, 60, 8, 2),
+        (48, 60, 8, 2),
+    ]
+
+
+def test_dirty_rects_clipped_to_width():
+    prev = np.full((4, 2), 0xFF, dtype=np.uint8)
+    new = prev.copy()
+    new[1, 1] = 0
+    assert dirty_rects(prev, new, 12) == [(8, 1, 4, 1)]
+
+
+def test_update_body():
+    refresh = PartialRefresh()
+    update_get(refresh, "a", frame_get())
+    refresh.confirm("kitchen", "a")
+
+    new = frame_get((20, 22, 2, 3))
+    update = update_get(refresh, "b", new)
+
+    assert not update.full
+    assert update.rects == [(16, 20, 8, 2)]
+    count, x, y, w, h = struct.unpack("<H4H", update.data[:10])
+    assert (count, x, y, w, h) == (1, 16, 20, 8, 2)
+    assert update.data[10:] == bytes(2)
+
+
+def test_first_update_full():
+    update = update_get(PartialRefresh(), "a", frame_get())
+    assert update.full
+    assert update.rects == [(0, 0, WIDTH, HEIGHT)]
+    assert update.base is None
+
+
+def test_rects_against_last_confirmed_frame():
+    refresh = PartialRefresh()
+    update_get(refresh, "a", frame_get())
+    refresh.confirm("kitchen", "a")
+
+    # Sent, never confirmed: a failed download or draw.
+    update = update_get(refresh, "b", frame_get((10, 20, 0, 2)))
+    assert update.base == "a"
+    assert update.rects == [(0, 10, 16, 10)]
+
+    # Diffed against "a", what the device shows, not against "b".
+    update = update_get(refresh, "c", frame_get((100, 110, 4, 6)))
+    assert not update.full
+    assert update.base == "a"
+    assert update.rects == [(32, 100, 16, 10)]
+
+
+def test_confirm_moves_base():
+    refresh = PartialRefresh()
+    update_get(refresh, "a", frame_get())
+    refresh.confirm("kitchen", "a")
+    update_get(refresh, "b", frame_get((10, 20, 0, 2)))
+    refresh.confirm("kitchen", "b")
+
+    update = update_get(refresh, "c", frame_get((10, 20, 0, 2), (100, 110, 4, 6)))
+    assert update.base == "b"
+    assert update.rects == [(32, 100, 16, 10)]
+
+
+def test_reported_base_confirms_pending():
+    refresh = PartialRefresh()
+    update_get(refresh, "a", frame_get())
+    update_get(refresh, "b", frame_get((10, 20, 0, 2)), base="a")
+
+    update = update_get(refresh, "c", frame_get((10, 20, 0, 2), (100, 110, 4, 6)), base="b")
+    assert not update.full
+    assert update.rects == [(32, 100, 16, 10)]
+
+
+def test_unknown_base_full():
+    refresh = PartialRefresh()
+    update_get(refresh, "a", frame_get())
+    refresh.confirm("kitchen", "a")
+
+    update = update_get(refresh, "c", frame_get((100, 110, 4, 6)), base="elsewhere")
+    assert update.full
+    assert update.base == "elsewhere"
+
+
+def test_up_to_date_device_empty():
+    refresh = PartialRefresh()
+    update_get(refresh, "a", frame_get())
+    refresh.confirm("kitchen", "a")
+
+    update = update_get(refresh, "a", frame_get())
+    assert not update.full
+    assert update.rects == []
+    assert update.data == b"\x00\x00"
+
+
+@pytest.mark.parametrize("full_every", [FULL_REFRESH_EVERY, 3, 0])
+def test_full_refresh_every(full_every):
+    refresh = PartialRefresh(full_every=full_every)
+    update_get(refresh, "0", frame_get())
+    refresh.confirm("kitchen", "0")
+
+    fulls = []
+    for i in range(1, 2 * full_every + 3):
+        name = str(i)
+        update = update_get(refresh, name, frame_get((i, i + 1, 0, 1)))
+        refresh.confirm("kitchen", name)
+        fulls.append(update.full)
+
+    # Partial updates in between full refreshes.
+    period = [False] * full_every + [True]
+    assert fulls == (period * 3)[:len(fulls)]
+
+
+def test_full_refresh_area():
+    refresh = PartialRefresh()
+    update_get(refresh, "a", frame_get())
+    refresh.confirm("kitchen", "a")
+
+    rows = int(HEIGHT * FULL_REFRESH_AREA)
+    update = update_get(refresh, "b", frame_get((0, rows, 0, WIDTH // 8)))
+    assert not update.full
+
+    # Both diffed against "a".
+    update = update_get(refresh, "c", frame_get((0, rows + 1, 0, WIDTH // 8)))
+    assert update.full
+    assert update.rects == [(0, 0, WIDTH, HEIGHT)]
+
+
+def test_counts():
+    refresh = PartialRefresh()
+    update_get(refresh, "a", frame_get())
+    refresh.confirm("kitchen", "a")
+    update_get(refresh, "b", frame_get((10, 20, 0, 2)))
+
+    assert refresh.to_dict() == {"devices": 1, "partial": 1, "full": 1}
+
+    refresh.clear()
+    assert update_get(refresh, "c", frame_get()).full
@@ -0,0 +1,143 @@
+# test_frame_format.py
+# Device frame encodings and format negotiation.
+
+import io
+import random
+
+import pytest
+from PIL import Image
+
+from frame_format import format_negotiate, frame_encode, packbits_decode, packbits_encode
+
+
+def png_get(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        b"\x00",
+        b"\x01\x02",
+        b"\xff\xff",
+        b"\xff" * 3,
+        b"\xff" * 127,
+        b"\xff" * 128,
+        b"\xff" * 129,
+        b"\xff" * 130,
+        b"\xff" * 300,
+        bytes(range(127)),
+        bytes(range(128)),
+        bytes(range(129)),
+        bytes(range(256)) * 2,
+        bytes(range(127)) + b"\x00" * 3 + bytes(range(128)),
+        b"\x01\x02\x02\x03\x03\x03\x04\x04\x04\x04",
+    ],
+    ids=lambda data: f"{len(data)}-bytes",
+)
+def test_packbits_round_trip(data):
+    assert packbits_decode(packbits_encode(data)) == data
+
+
+def test_packbits_round_trip_random():
+    rng = random.Random(0)
+    for _ in range(200):
+        data = bytes(rng.choice(b"\x00\xff\x55") for _ in range(rng.randint(0, 600)))
+        assert packbits_decode(packbits_encode(data)) == data
+
+
+def test_packbits_run_boundaries():
+    # Longest run is 128 bytes, header 257 - 128.
+    assert packbits_encode(b"\xff" * 128) == b"\x81\xff"
+    assert packbits_encode(b"\xff" * 129) == b"\x81\xff\x00\xff"
+    assert packbits_encode(b"\xff" * 131) == b"\x81\xff\xfe\xff"
+
+    # Runs shorter than 3 stay literal.
+    assert packbits_encode(b"\x01\x02\x02\x03") == b"\x03\x01\x02\x02\x03"
+
+
+def test_packbits_literal_boundaries():
+    # Longest literal is 128 bytes, header 127.
+    literal = bytes(range(128))
+    assert packbits_encode(literal) == b"\x7f" + literal
+    assert packbits_encode(literal + b"\x80") == b"\x7f" + literal + b"\x00\x80"
+
+
+def test_packbits_decode_skips_noop():
+    assert packbits_decode(b"\x80\x00\x41\x80\xfe\x42") == b"ABBB"
+
+
+def test_gray4_nibble_order():
+    image = Image.new("L", (3, 2))
+    image.putdata([0x00, 0xF0, 0x80, 0xFF, 0x10, 0x00])
+
+    encoding = frame_encode(png_get(image), "gray4")
+
+    # Left pixel in the high nibble, odd rows padded with white.
+    assert encoding.data == bytes([0x0F, 0x8F, 0xF1, 0x0F])
+    assert encoding.size == (3, 2)
+    assert encoding.media_type == "application/x-e-display-gray4"
+
+
+def test_1bpp_msb_first_white_set():
+    image = Image.new("1", (10, 1), 0)
+    image.putpixel((0, 0), 1)
+    image.putpixel((9, 0), 1)
+
+    encoding = frame_encode(png_get(image), "1bpp")
+
+    assert encoding.data == bytes([0x80, 0x40])
+    assert packbits_decode(frame_encode(png_get(image), "1bpp-rle").data) == encoding.data
+
+
+def test_png_passes_through():
+    png = png_get(Image.new("1", (4, 4), 1))
+    assert frame_encode(png, "png").data == png
+
+
+def test_frame_encode_unknown_format():
+    with pytest.raises(ValueError):
+        frame_encode(png_get(Image.new("1", (4, 4), 1)), "jpeg")
+
+
+@pytest.mark.parametrize(
+    "format, accept, expected",
+    [
+        (None, None, "png"),
+        (None, "", "png"),
+        ("1BPP", "image/png", "1bpp"),
+        ("jpeg", None, None),
+        (None, "image/png", "png"),
+        (None, "Image/PNG", "png"),
+        (None, "application/x-e-display-1bpp-rle, image/png;q=0.5", "1bpp-rle"),
+        (None, "image/png;q=0.4, application/x-e-display-gray4;q=0.9", "gray4"),
+        (None, "application/x-e-display-gray4, application/x-e-display-1bpp", "gray4"),
+        (None, "application/x-e-display-gray4;q=x, image/png;q=0.1", "png"),
+        (None, "*/*", "png"),
+        (None, "image/*", "png"),
+        (None, "text/html, */*;q=0.1", "png"),
+        (None, "*/*, image/png;q=0", "1bpp"),
+        (None, "*/*, image/png;q=0, application/x-e-display-1bpp;q=0", "1bpp-rle"),
+        (None, "image/png;q=0, */*;q=0.5", "1bpp"),
+    ],
+)
+def test_format_negotiate(format, accept, expected):
+    assert format_negotiate(format=format, accept=accept) == expected
+
+
+@pytest.mark.parametrize(
+    "accept",
+    [
+        "text/html",
+        "image/jpeg, image/webp",
+        "image/png;q=0",
+        "image/*, image/png;q=0",
+        "*/*;q=0",
+    ],
+)
+def test_format_negotiate_nothing_acceptable(accept):
+    # The routes answer None with 406 Not Acceptable.
+    assert format_negotiate(accept=accept) is None
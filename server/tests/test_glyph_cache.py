@@ -0,0 +1,46 @@
+# test_glyph_cache.py
+# Pixel test: GlyphRunCache drawing against ImageDraw.multiline_text for
+# all device fonts.
+
+import random
+
+import pytest
+from PIL import Image, ImageDraw
+
+import kindle
+import renderer
+import trmnl_7_5in
+from glyph_cache import GlyphRunCache
+
+WORDS = renderer.test_text().split() + ["9 AM", "Today", "72°F", "1:1", "(Q3)", "jig", "Tj"]
+
+FONTS = [
+    pytest.param(font, id=f"{device}-{name}")
+    for device, fonts in (("trmnl", trmnl_7_5in.fonts), ("kindle", kindle.fonts))
+    for name, font in fonts.items()
+]
+
+
+@pytest.mark.parametrize("mode", ["1", "L"])
+@pytest.mark.parametrize("font", FONTS)
+def test_multiline_text_draw_matches_imagedraw(mode, font):
+    cache = GlyphRunCache()
+    rng = random.Random(f"{mode}-{font.size}")
+
+    mismatches = []
+    for _ in range(40):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 8)))
+        if rng.random() < 0.3:
+            text = text.replace(" ", "\n", 2)
+        xy = (rng.choice([-3, 0, 10, 15.5, 37.25]), rng.choice([-5, 0, 44.7, 101.5]))
+        fill = rng.choice([0, 255]) if mode == "1" else rng.choice([0, 96, 255])
+
+        expected = Image.new(mode, (480, 300), 255 - fill)
+        ImageDraw.Draw(expected).multiline_text(xy, text, font=font, fill=fill, spacing=2)
+        actual = Image.new(mode, (480, 300), 255 - fill)
+        cache.multiline_text_draw(ImageDraw.Draw(actual), xy, text, font, fill, spacing=2)
+
+        if expected.tobytes() != actual.tobytes():
+            mismatches.append((xy, fill, text))
+
+    assert mismatches == []
@@ -0,0 +1,128 @@
+# test_http_range.py
+# Range header parsing for resumable frame downloads.
+
+import pytest
+
+from http_range import RangeNotSatisfiable, content_range, range_parse
+
+SIZE = 4096
+ETAG = '"7fc56270e7a70fa8"'
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-0", (0, 0)),
+        ("bytes=0-99", (0, 99)),
+        ("bytes=100-199", (100, 199)),
+        ("bytes=0-4095", (0, 4095)),
+        ("bytes = 10 - 20", (10, 20)),
+        ("Bytes=10-20", (10, 20)),
+    ],
+)
+def test_closed_range(header, expected):
+    assert range_parse(header, SIZE) == expected
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=1000-", (1000, 4095)),
+        ("bytes=0-", (0, 4095)),
+        ("bytes=4095-", (4095, 4095)),
+    ],
+)
+def test_open_range(header, expected):
+    assert range_parse(header, SIZE) == expected
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=-96", (4000, 4095)),
+        ("bytes=-1", (4095, 4095)),
+        ("bytes=-4096", (0, 4095)),
+        # Longer than the resource, all of it.
+        ("bytes=-10000", (0, 4095)),
+    ],
+)
+def test_suffix_range(header, expected):
+    assert range_parse(header, SIZE) == expected
+
+
+def test_range_end_past_eof_clipped():
+    assert range_parse("bytes=4000-9999", SIZE) == (4000, 4095)
+
+
+@pytest.mark.parametrize("header", ["bytes=4096-", "bytes=4096-5000", "bytes=9999-"])
+def test_range_start_past_eof(header):
+    with pytest.raises(RangeNotSatisfiable):
+        range_parse(header, SIZE)
+
+
+def test_range_empty_resource():
+    with pytest.raises(RangeNotSatisfiable):
+        range_parse("bytes=-10", 0)
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        "bytes=",
+        "bytes=-",
+        "bytes=5",
+        "bytes=a-",
+        "bytes=1-b",
+        "bytes=--5",
+        "bytes=-0",
+        "bytes=1 2-3",
+        "bytes=²-",
+        "bytes=200-100",
+    ],
+)
+def test_malformed_range(header):
+    # Answered with a 416.
+    with pytest.raises(RangeNotSatisfiable):
+        range_parse(header, SIZE)
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        None,
+        "",
+        # Multiple ranges and other units: the whole resource, a 200.
+        "bytes=0-99,200-299",
+        "bytes=0-99, -100",
+        "items=0-5",
+        "pages",
+    ],
+)
+def test_whole_resource(header):
+    assert range_parse(header, SIZE) is None
+
+
+def test_if_range_match():
+    assert range_parse("bytes=100-", SIZE, if_range=ETAG, etag=ETAG) == (100, 4095)
+    assert range_parse("bytes=100-", SIZE, if_range=f" {ETAG} ", etag=ETAG) == (100, 4095)
+
+
+@pytest.mark.parametrize(
+    "if_range",
+    [
+        '"0000000000000000"',
+        f"W/{ETAG}",
+        "Wed, 21 Oct 2015 07:28:00 GMT",
+    ],
+)
+def test_if_range_mismatch_whole_resource(if_range):
+    # The frame changed since the partial download, a 200 with all of it.
+    assert range_parse("bytes=100-", SIZE, if_range=if_range, etag=ETAG) is None
+
+
+def test_if_range_mismatch_skips_malformed_range():
+    assert range_parse("bytes=x-", SIZE, if_range='"0"', etag=ETAG) is None
+
+
+def test_content_range():
+    assert content_range(1000, 4095, 4096) == "bytes 1000-4095/4096"
@@ -0,0 +1,37 @@
+# test_render_pool.py
+# Single-flight renders: callers share a render in progress only when
+# they gave the same input fingerprint.
+
+import asyncio
+
+import render_pool
+from render_pool import RenderPool
+
+
+def test_render_without_fingerprint_never_joins_skipping_render(monkeypatch):
+    calls = []
+
+    async def render(self, renderer, device, fingerprint):
+        calls.append(fingerprint)
+        await asyncio.sleep(0.01)
+        # Inputs unchanged: nothing drawn for a caller with the fingerprint.
+        png = None if fingerprint == "abc" else b"\x89PNG"
+        return png, "abc", ()
+
+    monkeypatch.setattr(render_pool.RenderPool, "_render", render)
+    pool = RenderPool()
+
+    async def main():
+        return await asyncio.gather(
+            pool.render(None, "kitchen", "abc"),
+            pool.render(None, "kitchen", None),
+            pool.render(None, "kitchen", "abc"),
+            pool.render(None, "kitchen", None),
+        )
+
+    results = asyncio.run(main())
+
+    assert [png for png, _, _ in results] == [None, b"\x89PNG", None, b"\x89PNG"]
+    assert calls == ["abc", None]
+    assert pool.coalesced == 2
+    assert not pool.inflight("kitchen")
@@ -0,0 +1,257 @@
+# test_render_scheduler.py
+# Pre-render job heap: ordering, replacement, persistence and the render
+# budget.
+
+import asyncio
+import datetime as dt
+import json
+
+import pytest
+
+import render_scheduler
+from render_scheduler import RenderScheduler
+
+
+async def until(predicate, timeout: float = 2.0) -> None:
+    """
+    Waits until predicate() is true.
+    """
+
+    loop = asyncio.get_running_loop()
+    end = loop.time() + timeout
+    while not predicate():
+        if loop.time() > end:
+            raise TimeoutError("Condition not met")
+        await asyncio.sleep(0.005)
+
+
+@pytest.fixture
+def schedule_file(tmp_path):
+    return str(tmp_path / "render-schedule.json")
+
+
+def test_jobs_run_in_time_order(schedule_file):
+    rendered = []
+    scheduler = RenderScheduler(concurrency=1)
+    now = dt.datetime.now()
+
+    async def render(device):
+        rendered.append(device)
+
+    async def main():
+        scheduler.schedule("c", now - dt.timedelta(seconds=1))
+        scheduler.schedule("a", now - dt.timedelta(seconds=3))
+        scheduler.schedule("d", now + dt.timedelta(seconds=0.1))
+        scheduler.schedule("b", now - dt.timedelta(seconds=2))
+        assert [job.device for job in scheduler.jobs()] == ["a", "b", "c", "d"]
+
+        scheduler.start(render=render, filename=schedule_file)
+        await until(lambda: len(rendered) == 4)
+        scheduler.shutdown()
+
+    asyncio.run(main())
+
+    assert rendered == ["a", "b", "c", "d"]
+    assert len(scheduler) == 0
+    assert scheduler.to_dict()["runs"] == 4
+
+
+def test_schedule_replaces_pending_job(schedule_file):
+    rendered = []
+    scheduler = RenderScheduler()
+    now = dt.datetime.now()
+
+    async def render(device):
+        rendered.append(device)
+
+    async def main():
+        scheduler.start(render=render, filename=schedule_file)
+
+        first = scheduler.schedule("kitchen", now + dt.timedelta(hours=1))
+        job = scheduler.schedule("kitchen", now - dt.timedelta(seconds=1))
+        assert first != job
+        assert scheduler.job_get("kitchen") == job
+        assert len(scheduler) == 1
+
+        await until(lambda: rendered)
+
+        # Later job for the device was replaced, never runs.
+        later = scheduler.schedule("office", now + dt.timedelta(seconds=0.05))
+        scheduler.schedule("office", now + dt.timedelta(hours=1))
+        assert scheduler.job_get("office") != later
+        await asyncio.sleep(0.2)
+        scheduler.shutdown()
+
+    asyncio.run(main())
+
+    assert rendered == ["kitchen"]
+    assert scheduler.to_dict()["replaced"] == 2
+    assert [job.device for job in scheduler.jobs()] == ["office"]
+
+
+def test_cancel(schedule_file):
+    scheduler = RenderScheduler()
+    scheduler.schedule("kitchen", dt.datetime.now())
+
+    assert scheduler.cancel("kitchen")
+    assert not scheduler.cancel("kitchen")
+    assert scheduler.job_get("kitchen") is None
+
+
+def test_schedule_saved_and_reloaded(schedule_file):
+    rendered = []
+    due = dt.datetime.now() - dt.timedelta(minutes=5)
+    later = dt.datetime.now() + dt.timedelta(hours=1)
+
+    async def render(device):
+        rendered.append(device)
+
+    async def save():
+        scheduler = RenderScheduler()
+        scheduler.start(render=render, filename=schedule_file)
+        scheduler.schedule("office", later)
+        scheduler.schedule("kitchen", later)
+        scheduler.cancel("kitchen")
+        scheduler.shutdown()
+
+    asyncio.run(save())
+
+    with open(schedule_file) as f:
+        assert json.load(f) == {"office": later.isoformat()}
+
+    # Jobs due while the server was down run on start.
+    with open(schedule_file, "w") as f:
+        json.dump({"office": later.isoformat(), "kitchen": due.isoformat()}, f)
+
+    scheduler = RenderScheduler()
+
+    async def reload():
+        scheduler.start(render=render, filename=schedule_file)
+        assert [job.device for job in scheduler.jobs()] == ["kitchen", "office"]
+        await until(lambda: rendered)
+        scheduler.shutdown()
+
+    asyncio.run(reload())
+
+    assert rendered == ["kitchen"]
+    assert scheduler.job_get("office").time == later
+    with open(schedule_file) as f:
+        assert json.load(f) == {"office": later.isoformat()}
+
+
+def test_load_keeps_newer_jobs(schedule_file):
+    with open(schedule_file, "w") as f:
+        json.dump({"kitchen": "2025-03-03T09:00:00"}, f)
+
+    scheduler = RenderScheduler()
+    job = scheduler.schedule("kitchen", dt.datetime(2025, 3, 3, 10))
+    scheduler._filename = schedule_file
+    scheduler.load()
+
+    assert scheduler.job_get("kitchen") == job
+
+
+def test_load_bad_file(schedule_file):
+    with open(schedule_file, "w") as f:
+        f.write("{")
+
+    scheduler = RenderScheduler()
+    scheduler._filename = schedule_file
+    scheduler.load()
+
+    assert len(scheduler) == 0
+
+
+def test_concurrency_limit(schedule_file):
+    running = []
+    peak = []
+    release = None
+    scheduler = RenderScheduler(concurrency=2)
+
+    async def render(device):
+        running.append(device)
+        peak.append(len(running))
+        await release.wait()
+        running.remove(device)
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        now = dt.datetime.now()
+        for device in "abcde":
+            scheduler.schedule(device, now)
+
+        scheduler.start(render=render, filename=schedule_file)
+        await until(lambda: len(running) == 2)
+        await asyncio.sleep(0.05)
+        assert len(running) == 2
+        assert len(scheduler) == 3
+        assert len(scheduler.running()) == 2
+
+        release.set()
+        await until(lambda: len(scheduler) == 0 and not running)
+        scheduler.shutdown()
+
+    asyncio.run(main())
+
+    assert max(peak) == 2
+    assert scheduler.to_dict()["runs"] == 5
+
+
+def test_busy_backoff(schedule_file, monkeypatch):
+    monkeypatch.setattr(render_scheduler, "BUDGET_POLL", 0.01)
+    rendered = []
+    busy = 2
+    scheduler = RenderScheduler(concurrency=2)
+
+    async def render(device):
+        rendered.append(device)
+
+    async def main():
+        nonlocal busy
+        scheduler.schedule("kitchen", dt.datetime.now())
+        scheduler.start(render=render, filename=schedule_file, busy=lambda: busy)
+
+        # Other renders fill the budget, the due job waits.
+        await asyncio.sleep(0.1)
+        assert rendered == []
+        assert scheduler.job_get("kitchen") is not None
+
+        busy = 1
+        await until(lambda: rendered)
+        scheduler.shutdown()
+
+    asyncio.run(main())
+
+    assert rendered == ["kitchen"]
+
+
+def test_failed_render_counted(schedule_file):
+    scheduler = RenderScheduler()
+
+    async def render(device):
+        raise RuntimeError("renderer broke")
+
+    async def main():
+        scheduler.schedule("kitchen", dt.datetime.now())
+        scheduler.start(render=render, filename=schedule_file)
+        await until(lambda: scheduler.to_dict()["failures"] == 1)
+        await until(lambda: not scheduler.running())
+        scheduler.shutdown()
+
+    asyncio.run(main())
+
+
+def test_load_histogram():
+    scheduler = RenderScheduler()
+    hour = dt.datetime.now().replace(minute=0, second=0, microsecond=0)
+    for minutes in (0, 0.5, 4, 7, 59.9):
+        scheduler._starts.append(hour - dt.timedelta(hours=1) + dt.timedelta(minutes=minutes))
+
+    # Outside LOAD_WINDOW.
+    scheduler._starts.append(hour - dt.timedelta(days=2) + dt.timedelta(minutes=1))
+
+    counts = scheduler.load_histogram(dt.timedelta(minutes=5))
+    assert counts == [3, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1]
+    assert sum(scheduler.load_histogram()) == 5
+    assert len(scheduler.load_histogram(dt.timedelta(minutes=7))) == 9
@@ -0,0 +1,93 @@
+# test_renderer_calendar_outlook.py
+# Pixel test: the Outlook time grid drawn as a static layer plus weather,
+# against the grid drawn in one pass as before the background cache.
+
+import datetime as dt
+import types
+
+import pytest
+from PIL import Image, ImageDraw
+
+from trmnl_7_5in import Color, fonts
+from trmnl_7_5in import ResolutionPortrait as Resolution
+from renderer_calendar_outlook import TimeGrid, TimeGridStatic
+
+START = dt.datetime(2025, 3, 3, 9, tzinfo=dt.timezone.utc)
+
+
+class WeatherStub:
+    """
+    Stands in for Weather.Render: a temperature and an opaque icon pasted
+    with its mask, tall enough to cover the line below the row.
+    """
+
+    def Render(self, draw, hour, x_base, y_base, width, height):
+        draw.text(
+            (x_base + 30, y_base + height - 20), f"{hour.hour}°F", font=fonts["small"], fill=Color.BLACK
+        )
+        icon = Image.new("RGBA", (width - 10, round(height)), (255, 255, 255, 255))
+        ImageDraw.Draw(icon).ellipse((10, 10, width - 20, height - 10), fill=(0, 0, 0, 255))
+        draw._image.paste(icon, (x_base + 5, round(y_base + 10)), icon)
+
+
+@pytest.fixture
+def time_grid_reference():
+    """
+    The time grid and weather as drawn before the background cache: each
+    row's lines, then its weather.
+    """
+
+    def time_grid(draw, weather, timeframe_hours, x_base, y_base, width, height, start):
+        x_pad = 5
+        y_pad = 3
+        width_weather = 100
+        x_weather = x_base + width - width_weather
+        row_height = height / timeframe_hours
+
+        y = y_base
+        fontsz = "small"
+        for i in range(timeframe_hours):
+            draw.line((x_base + x_pad, y, x_base + width - x_pad, y), fill=Color.BLACK)
+
+            hour = start + dt.timedelta(hours=i)
+            hour_str = hour.strftime("%-I %p")
+            draw.text((x_base + 3 * x_pad, y + y_pad), hour_str, font=fonts[fontsz], fill=Color.BLACK)
+            x_offset = fonts[fontsz].getbbox(hour_str)[2] + 2 * x_pad
+
+            y_mid = y + row_height / 2
+            draw.line((x_offset, y_mid, x_weather, y_mid), fill=Color.BLACK)
+
+            if weather is not None:
+                weather.Render(
+                    draw=draw, hour=hour, x_base=x_weather, y_base=y, width=width_weather, height=row_height
+                )
+
+            y += row_height
+
+        draw.line((x_base + x_pad, y, x_base + width - x_pad, y), fill=Color.BLACK)
+
+    return time_grid
+
+
+@pytest.mark.parametrize("weather", [WeatherStub(), None], ids=["weather", "no-weather"])
+@pytest.mark.parametrize("y_base", [120, 151.5])
+def test_time_grid_layers_match_single_pass(time_grid_reference, weather, y_base):
+    size = (Resolution.HORIZ, Resolution.VERT)
+    grid = dict(
+        timeframe_hours=7,
+        x_base=0,
+        y_base=y_base,
+        width=Resolution.HORIZ,
+        height=Resolution.VERT - y_base - 30,
+        start=START,
+    )
+    calendar = types.SimpleNamespace(upcoming=None)
+
+    expected = Image.new("1", size, Color.WHITE)
+    time_grid_reference(ImageDraw.Draw(expected), weather, **grid)
+
+    actual = Image.new("1", size, Color.WHITE)
+    TimeGridStatic(draw=ImageDraw.Draw(actual), **grid)
+    TimeGrid(draw=ImageDraw.Draw(actual), weather=weather, calendar=calendar, **grid)
+
+    assert expected.tobytes() == actual.tobytes()
@@ -0,0 +1,70 @@
+# test_sleep_policy.py
+# Sleep delays from the instants a renderer's frame changes at.
+
+import datetime as dt
+
+import pytest
+
+from renderer import RendererBase
+from sleep_policy import SLEEP_MAX, WAKE_MARGIN, boundary_next, change_times, delay_get
+
+NOW = dt.datetime(2025, 3, 4, 19, 20)
+MIDNIGHT = dt.datetime(2025, 3, 5)
+
+
+def test_change_times():
+    aware = dt.datetime(2025, 3, 4, 21, tzinfo=dt.timezone.utc).astimezone()
+    times = [NOW + dt.timedelta(hours=2), None, NOW - dt.timedelta(minutes=1), NOW, aware, NOW + dt.timedelta(hours=2)]
+
+    assert change_times(times, NOW) == tuple(sorted({NOW + dt.timedelta(hours=2), aware.replace(tzinfo=None)}))
+
+
+def test_boundary_next():
+    assert boundary_next(dt.timedelta(hours=1), NOW) == dt.datetime(2025, 3, 4, 20)
+    assert boundary_next(dt.timedelta(days=1), NOW) == MIDNIGHT
+    assert boundary_next(dt.timedelta(hours=1), dt.datetime(2025, 3, 4, 20)) == dt.datetime(2025, 3, 4, 21)
+
+
+def test_changes_leave_out_footer_period():
+    renderer = RendererBase()
+    assert renderer.UPDATED_TIME_RESOLUTION
+
+    # Only the header date changes, the footer time period doesn't wake.
+    renderer.changes_set(now=NOW)
+    assert renderer.changes == (MIDNIGHT,)
+
+    event = dt.datetime(2025, 3, 4, 21, 30)
+    renderer.changes_set(event, NOW - dt.timedelta(hours=1), now=NOW)
+    assert renderer.changes == (event, MIDNIGHT)
+
+
+@pytest.mark.parametrize(
+    "sleep_max, expected",
+    [
+        # A quiet evening sleeps to midnight, where the old schedule woke
+        # at every hour.
+        (dt.timedelta(hours=6), MIDNIGHT - NOW + WAKE_MARGIN),
+        (dt.timedelta(hours=3), dt.timedelta(hours=3)),
+        (SLEEP_MAX, SLEEP_MAX),
+    ],
+)
+def test_delay_longer_than_hourly(sleep_max, expected):
+    renderer = RendererBase()
+    renderer.changes_set(now=NOW)
+
+    delay = delay_get(renderer.changes, sleep_max=sleep_max, now=NOW)
+
+    assert delay == expected
+    assert delay >= boundary_next(dt.timedelta(hours=1), NOW) - NOW + WAKE_MARGIN
+
+
+def test_delay_next_change_wins():
+    renderer = RendererBase()
+    renderer.changes_set(dt.datetime(2025, 3, 4, 19, 45), now=NOW)
+
+    assert delay_get(renderer.changes, sleep_max=dt.timedelta(hours=6), now=NOW) == dt.timedelta(minutes=27)
+
+
+def test_delay_no_changes():
+    assert delay_get([], now=NOW) == SLEEP_MAX
+    assert delay_get([NOW - dt.timedelta(minutes=1)], sleep_max=dt.timedelta(hours=2), now=NOW) == dt.timedelta(hours=2)
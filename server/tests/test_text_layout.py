@@ -0,0 +1,97 @@
+# test_text_layout.py
+# Regression test: TextWrapper.box_fill against the original quadratic
+# text_fill_box, across fonts, font modes and box sizes.
+
+import pytest
+from PIL import Image, ImageDraw
+
+import kindle
+import trmnl_7_5in
+import renderer
+from text_layout import TextWrapper
+
+TEXTS = [
+    renderer.test_text(),
+    "",
+    "Standup",
+    "1:1 Jan/Joe - Quarterly planning & roadmap review (Q3) for the platform team",
+    "Supercalifragilisticexpialidocious word and tiny jig",
+    "A  b   c\tdd  eee ffff ggggg hhhhhh",
+]
+
+FONTS = [
+    pytest.param(font, id=f"{device}-{name}")
+    for device, fonts in (("trmnl", trmnl_7_5in.fonts), ("kindle", kindle.fonts))
+    for name, font in fonts.items()
+]
+
+
+@pytest.fixture
+def text_fill_box_reference():
+    """
+    Original text_fill_box implementation, debug logging removed.
+    """
+
+    def text_fill_box(draw, text, font, width, height, spacing):
+        words = text.split()
+        word_cnt_total = len(words)
+        word_cnt_cur = 0
+        fit_text = ""
+
+        def multiline_textsz(text, font, spacing):
+            sz = draw.multiline_textbbox((0, 0), text, font=font, spacing=spacing)
+            return (sz[2] - sz[0], sz[3] - sz[1])
+
+        while word_cnt_cur < word_cnt_total:
+            first_word_of_line = True
+            while multiline_textsz(fit_text, font=font, spacing=spacing)[0] <= width:
+                if first_word_of_line:
+                    fit_text += words[word_cnt_cur]
+                    first_word_of_line = False
+                else:
+                    fit_text += " " + words[word_cnt_cur]
+                word_cnt_cur += 1
+                if word_cnt_cur == word_cnt_total:
+                    if multiline_textsz(fit_text, font=font, spacing=spacing)[0] <= width:
+                        return fit_text
+
+            fit_text = fit_text.rsplit(" ", 1)[0]
+            word_cnt_cur -= 1
+            fit_text += "\n"
+
+            if multiline_textsz(fit_text, font=font, spacing=spacing)[0] > width:
+                raise ValueError("Text too long for box width.")
+            if multiline_textsz(fit_text, font=font, spacing=spacing)[1] > height:
+                break
+
+        return fit_text
+
+    return text_fill_box
+
+
+def fill(fcn, *args):
+    try:
+        return fcn(*args)
+    except ValueError as e:
+        return f"ValueError: {e}"
+
+
+@pytest.mark.parametrize("mode", ["1", "L"])
+@pytest.mark.parametrize("font", FONTS)
+def test_box_fill_matches_reference(mode, font, text_fill_box_reference):
+    draw = ImageDraw.Draw(Image.new(mode, (10, 10)))
+    wrapper = TextWrapper.from_font(font, draw.fontmode)
+
+    mismatches = []
+    for text in TEXTS:
+        for width in range(10, 400, 29):
+            for height in (0, 24.5, 120):
+                for spacing in (2, 4):
+                    expected = fill(
+                        text_fill_box_reference, draw, text, font, width, height, spacing
+                    )
+                    actual = fill(wrapper.box_fill, text, width, height, spacing)
+                    if actual != expected:
+                        mismatches.append((text, width, height, spacing, expected, actual))
+
+    assert mismatches == []
@@ -0,0 +1,125 @@
+# test_wake_arrivals.py
+# Arrival offsets, pre-render timing and ready-before-arrival accounting.
+
+import datetime as dt
+
+import pytest
+
+from wake_arrivals import ARRIVAL_HISTORY, ARRIVAL_SAMPLES_MIN, PRERENDER_LEAD, WakeArrivals
+
+EXPECTED = dt.datetime(2025, 3, 4, 10, 2)
+
+# Ten arrivals, seconds from expected.  The 10th percentile interpolates
+# between the two earliest: -30 + 0.9 * (-10 - -30).
+OFFSETS = [20, -10, 0, 5, 90, -30, 10, 60, 40, 120]
+OFFSET_P10 = -12.0
+
+
+def arrivals_get(offsets, device: str = "kitchen") -> WakeArrivals:
+    arrivals = WakeArrivals()
+    for offset in offsets:
+        arrivals.expect(device, EXPECTED)
+        arrivals.arrive(device, EXPECTED + dt.timedelta(seconds=offset))
+    return arrivals
+
+
+def test_offset_percentile():
+    arrivals = arrivals_get(OFFSETS)
+
+    assert arrivals.offset_get("kitchen") == dt.timedelta(seconds=OFFSET_P10)
+    assert arrivals.offset_get("kitchen", 50) == dt.timedelta(seconds=15)
+
+
+def test_prerender_time():
+    arrivals = arrivals_get(OFFSETS)
+    expected = dt.datetime(2025, 3, 4, 11, 2)
+
+    prerender = arrivals.prerender_time_get("kitchen", expected)
+
+    assert prerender == expected + dt.timedelta(seconds=OFFSET_P10) - PRERENDER_LEAD
+    assert prerender == dt.datetime(2025, 3, 4, 11, 0, 48)
+
+
+def test_prerender_time_few_samples():
+    arrivals = arrivals_get(OFFSETS[: ARRIVAL_SAMPLES_MIN - 1])
+    expected = dt.datetime(2025, 3, 4, 11, 2)
+
+    # Too few arrivals to move the pre-render, or none at all.
+    assert arrivals.offset_get("kitchen") == dt.timedelta(0)
+    assert arrivals.prerender_time_get("kitchen", expected) == expected - PRERENDER_LEAD
+    assert arrivals.prerender_time_get("office", expected) == expected - PRERENDER_LEAD
+
+
+def test_history_bounded():
+    arrivals = arrivals_get([-600] * 10 + [30] * ARRIVAL_HISTORY)
+
+    assert arrivals.offset_get("kitchen") == dt.timedelta(seconds=30)
+    assert arrivals.to_dict()["kitchen"]["samples"] == ARRIVAL_HISTORY
+
+
+def test_hits_and_misses():
+    arrivals = WakeArrivals()
+
+    # Pre-rendered for this wake.
+    arrivals.expect("kitchen", EXPECTED)
+    arrivals.arrive("kitchen", EXPECTED, frame_time=dt.datetime.now())
+
+    # No fresh frame waiting.
+    arrivals.expect("kitchen", EXPECTED)
+    arrivals.arrive("kitchen", EXPECTED)
+
+    # Frame left over from before the device went to sleep.
+    arrivals.expect("kitchen", EXPECTED)
+    arrivals.arrive("kitchen", EXPECTED, frame_time=dt.datetime.now() - dt.timedelta(hours=1))
+
+    arrivals.expect("kitchen", EXPECTED)
+    arrivals.arrive("kitchen", EXPECTED, frame_time=dt.datetime.now())
+
+    stats = arrivals.to_dict()["kitchen"]
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["hit_rate"] == 0.5
+    assert stats["samples"] == 4
+
+
+def test_unexpected_arrival_ignored():
+    arrivals = WakeArrivals()
+
+    # First contact, or a second arrival for one expected wake.
+    arrivals.arrive("kitchen", EXPECTED, frame_time=dt.datetime.now())
+    arrivals.expect("kitchen", EXPECTED)
+    arrivals.arrive("kitchen", EXPECTED + dt.timedelta(seconds=9), frame_time=dt.datetime.now())
+    arrivals.arrive("kitchen", EXPECTED + dt.timedelta(seconds=60), frame_time=dt.datetime.now())
+
+    stats = arrivals.to_dict()["kitchen"]
+    assert stats["samples"] == 1
+    assert stats["median"] == 9.0
+    assert stats["hits"] == 1
+    assert stats["misses"] == 0
+
+
+def test_to_dict():
+    arrivals = arrivals_get(OFFSETS)
+
+    assert arrivals.to_dict() == {
+        "kitchen": {
+            "samples": len(OFFSETS),
+            "offset": pytest.approx(OFFSET_P10),
+            "median": 15.0,
+            "hits": 0,
+            "misses": len(OFFSETS),
+            "hit_rate": 0.0,
+        }
+    }
+
+
+def test_clear():
+    arrivals = arrivals_get(OFFSETS)
+    arrivals.expect("office", EXPECTED)
+    arrivals.arrive("office", EXPECTED)
+
+    arrivals.clear("kitchen")
+    assert list(arrivals.to_dict()) == ["office"]
+
+    arrivals.clear()
+    assert arrivals.to_dict() == {}